@@ -0,0 +1,154 @@
+# benchmarks/bench_pipeline.py
+"""
+Ingest pipeline stages on synthetic workbooks (benchmarks/generate.py):
+header detection + read (CSV and XLSX), convert_series over every parameter
+column, melt_harmonized, _compute_quality_flags_df and the
+insert_measurements payload build (_measurement_payload). No database.
+
+    python -m benchmarks.bench_pipeline [--rows 20000] [--params 12] [--repeat 5]
+                                        [--json out.json] [--compare baseline.json] [--threshold 1.25]
+
+Reports best and median seconds and rows/s per stage. --json keeps the run
+(with the git commit) so a later run can --compare against it; stages slower
+than threshold x the baseline's best are listed and the exit status is 1.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+from typing import Callable, Dict, Optional
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+for p in (BASE_DIR, os.path.join(BASE_DIR, "server")):
+    if p not in sys.path:
+        sys.path.insert(0, p)
+
+import pandas as pd  # noqa: E402
+
+from benchmarks.generate import POINTS, harmonized_frame, make_workbook  # noqa: E402
+from ewai.db.db_util import _compute_quality_flags_df, _measurement_payload, melt_harmonized  # noqa: E402
+from ewai.unit_convertor import convert_series  # noqa: E402
+
+
+def _read_table():
+    # server/app.py builds the Flask app on import; only the read path needs it
+    from app import _read_table_with_header_detection
+    return _read_table_with_header_detection
+
+
+def _convert_all(df_h: pd.DataFrame) -> pd.DataFrame:
+    out = df_h.copy()
+    renames = {}
+    for col in df_h.columns:
+        if " [" not in col:
+            continue
+        param, unit = col[:-1].split(" [", 1)
+        series, unit_to, did = convert_series(param, unit, out[col])
+        if did:
+            out[col] = series
+            renames[col] = f"{param} [{unit_to}]"
+    return out.rename(columns=renames)
+
+
+def _time(fn: Callable[[], object], repeat: int) -> Dict[str, float]:
+    runs = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - t0)
+    return {"best_s": min(runs), "median_s": statistics.median(runs)}
+
+
+def run(rows: int, params: int, repeat: int, seed: int = 1) -> Dict[str, Dict[str, float]]:
+    read_table = _read_table()
+    csv_raw, csv_name = make_workbook(rows, params, "csv", seed=seed)
+    xlsx_raw, xlsx_name = make_workbook(rows, params, "xlsx", seed=seed)
+    df_h = harmonized_frame(rows, params, seed=seed)
+    converted = _convert_all(df_h)
+    long_df = melt_harmonized(converted)
+    flagged = long_df.assign(quality_flag_code=_compute_quality_flags_df(long_df))
+    code_to_pid = {c: i + 1 for i, c in enumerate(sorted(long_df["parameter_code"].unique()))}
+    sp_map = {p: str(uuid.uuid4()) for p in POINTS}
+    dataset_id = str(uuid.uuid4())
+
+    cases = {
+        "read_header_csv": (lambda: read_table(csv_raw, csv_name, None), rows),
+        "read_header_xlsx": (lambda: read_table(xlsx_raw, xlsx_name, None), rows),
+        "convert_series": (lambda: _convert_all(df_h), rows * (df_h.shape[1] - 2)),
+        "melt_harmonized": (lambda: melt_harmonized(converted), len(long_df)),
+        "quality_flags": (lambda: _compute_quality_flags_df(long_df), len(long_df)),
+        "payload_build": (lambda: _measurement_payload(flagged, dataset_id, code_to_pid, sp_map), len(long_df)),
+    }
+    report = {}
+    for name, (fn, n) in cases.items():
+        r = _time(fn, repeat)
+        r["rows"] = n
+        r["rows_per_s"] = round(n / r["best_s"]) if r["best_s"] > 0 else None
+        report[name] = r
+    return report
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], threshold: float):
+    """[(stage, baseline best, current best, ratio)] for stages slower than threshold x baseline."""
+    slower = []
+    for name, r in report.items():
+        b = baseline.get(name)
+        if not b or not b.get("best_s"):
+            continue
+        ratio = r["best_s"] / b["best_s"]
+        if ratio > threshold:
+            slower.append((name, b["best_s"], r["best_s"], ratio))
+    return slower
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m benchmarks.bench_pipeline")
+    ap.add_argument("--rows", type=int, default=20000)
+    ap.add_argument("--params", type=int, default=12)
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--json", default=None, help="also write the report to this file")
+    ap.add_argument("--compare", default=None, help="report from an earlier --json run")
+    ap.add_argument("--threshold", type=float, default=1.25)
+    args = ap.parse_args(argv)
+
+    report = run(args.rows, args.params, args.repeat, args.seed)
+    for name, r in report.items():
+        print(f"{name:18s} best={r['best_s'] * 1000:9.1f} ms  median={r['median_s'] * 1000:9.1f} ms  "
+              f"rows={r['rows']:>8}  rows/s={r['rows_per_s']}")
+    if args.json:
+        meta = {"commit": _git_commit(), "python": platform.python_version(), "pandas": pd.__version__,
+                "rows": args.rows, "params": args.params, "repeat": args.repeat, "seed": args.seed}
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump({"meta": meta, "stages": report}, fh, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as fh:
+            base = json.load(fh)
+        slower = compare(report, base.get("stages", {}), args.threshold)
+        label = base.get("meta", {}).get("commit") or args.compare
+        for name, b, cur, ratio in slower:
+            print(f"REGRESSION {name}: {b * 1000:.1f} ms ({label}) -> {cur * 1000:.1f} ms (x{ratio:.2f})")
+        if slower:
+            return 1
+        print(f"no stage slower than x{args.threshold} vs {label}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,144 @@
+# benchmarks/bench_responses.py
+"""
+Encode time and bytes on the wire for the heavy JSON endpoints.
+
+Compares the previous path (per-row isoformat()/float() coercion + Flask's
+json provider) with server/responses.py (orjson on raw DB values), and the
+gzip/brotli sizes produced by compress_response().
+
+    python -m benchmarks.bench_responses [--rows 50000] [--repeat 5] [--json out.json]
+"""
+from __future__ import annotations
+
+import argparse
+import decimal
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+for p in (BASE_DIR, os.path.join(BASE_DIR, "server")):
+    if p not in sys.path:
+        sys.path.insert(0, p)
+
+from responses import dumps, encode_body, brotli  # noqa: E402
+
+PARAMS = ["temperature", "ph", "dissolved_oxygen", "turbidity", "conductivity",
+          "chlorophyll_a", "total_phosphorus", "nitrate", "total_cyanobacteria"]
+POINTS = ["Presa", "Torre 1 Superficial", "Torre 2 Media", "Torre 3 Profunda", "Entrada Potreros"]
+
+
+def measurement_rows(n: int, seed: int = 7):
+    """Tuples shaped like the /measurements cursor rows."""
+    rnd = random.Random(seed)
+    t0 = datetime(2019, 1, 1, tzinfo=timezone.utc)
+    rows = []
+    for i in range(n):
+        p = PARAMS[i % len(PARAMS)]
+        rows.append((
+            t0 + timedelta(hours=6 * (i // len(PARAMS))),
+            POINTS[(i // 7) % len(POINTS)], p, p.replace("_", " ").title(),
+            round(rnd.lognormvariate(1.0, 1.2), 4), "mg/L", rnd.choice([0, 0, 0, 0, 3]),
+            6.1 + rnd.random() / 100, -75.5 + rnd.random() / 100,
+        ))
+    return rows
+
+
+def assistant_rows(n: int = 300, seed: int = 11):
+    rnd = random.Random(seed)
+    d0 = datetime(2022, 1, 1, tzinfo=timezone.utc)
+    return [{"month": d0 + timedelta(days=30 * i), "point": rnd.choice(POINTS),
+             "avg_value": decimal.Decimal(str(round(rnd.uniform(0, 40), 6))), "n": rnd.randint(1, 90)}
+            for i in range(n)]
+
+
+def correlation_payload(k: int = 43, seed: int = 3):
+    rnd = random.Random(seed)
+    labels = [f"param_{i}" for i in range(k)]
+    return {"labels": labels, "matrix": [[round(rnd.uniform(-1, 1), 12) for _ in range(k)] for _ in range(k)]}
+
+
+def _legacy_dumps(obj) -> bytes:
+    # Flask's DefaultJSONProvider in production mode
+    return json.dumps(obj, sort_keys=True, ensure_ascii=True, separators=(",", ":")).encode("utf-8")
+
+
+def _legacy_measurements(rows):
+    return {"data": [{
+        "ts": (r[0].isoformat() if r[0] else None), "sampling_point": r[1], "parameter": r[2],
+        "parameter_display": r[3], "value": None if r[4] is None else float(r[4]), "unit": r[5],
+        "quality_flag_id": r[6], "lat": None if r[7] is None else float(r[7]),
+        "lon": None if r[8] is None else float(r[8]),
+    } for r in rows]}
+
+
+def _new_measurements(rows):
+    keys = ("ts", "sampling_point", "parameter", "parameter_display",
+            "value", "unit", "quality_flag_id", "lat", "lon")
+    return {"data": [dict(zip(keys, r)) for r in rows]}
+
+
+def _legacy_assistant(rows):
+    def norm(v):
+        if isinstance(v, decimal.Decimal):
+            return float(v)
+        if isinstance(v, datetime):
+            return v.isoformat()
+        return v
+    return {"rows": [{k: norm(v) for k, v in r.items()} for r in rows]}
+
+
+def _best(fn, repeat: int):
+    best, out = float("inf"), None
+    for _ in range(repeat):
+        t = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t)
+    return best, out
+
+
+def run(rows: int, repeat: int):
+    cases = {
+        "measurements": (measurement_rows(rows), _legacy_measurements, _new_measurements),
+        "assistant_chat": (assistant_rows(), _legacy_assistant, lambda r: {"rows": r}),
+        "correlation": (correlation_payload(), lambda p: p, lambda p: p),
+    }
+    report = {}
+    for name, (src, legacy_build, new_build) in cases.items():
+        t_legacy, body_legacy = _best(lambda: _legacy_dumps(legacy_build(src)), repeat)
+        t_new, body_new = _best(lambda: dumps(new_build(src)), repeat)
+        entry = {
+            "legacy_encode_ms": round(t_legacy * 1000, 2),
+            "orjson_encode_ms": round(t_new * 1000, 2),
+            "legacy_bytes": len(body_legacy),
+            "identity_bytes": len(body_new),
+        }
+        for coding in (["gzip", "br"] if brotli is not None else ["gzip"]):
+            t_c, enc = _best(lambda: encode_body(body_new, coding), repeat)
+            entry[f"{coding}_bytes"] = len(enc)
+            entry[f"{coding}_ms"] = round(t_c * 1000, 2)
+        report[name] = entry
+    return report
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m benchmarks.bench_responses")
+    ap.add_argument("--rows", type=int, default=50000, help="/measurements rows (endpoint caps at 50k)")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--json", default=None, help="also write the report to this file")
+    args = ap.parse_args(argv)
+
+    report = run(args.rows, args.repeat)
+    for name, e in report.items():
+        print(f"{name:16s} " + "  ".join(f"{k}={v}" for k, v in e.items()))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,206 @@
+# benchmarks/bench_storage.py
+"""
+On-disk size and scan time of the measurements row layout, before and after
+compaction (see measurement_rows in ewai/db/db_util.py).
+
+Builds both layouts side by side in a scratch schema from the same synthetic
+rows (each layout's dedup key, the same secondary indexes, no partitioning
+or FKs so only the layout differs), then reports heap bytes per row, index sizes and the best
+of --repeat timings for the dataset- and series-scoped reads the API issues.
+
+    python -m benchmarks.bench_storage [--rows 500000] [--datasets 20] [--repeat 5] [--json out.json]
+
+Runs against DATABASE_URL; the scratch schema is dropped at the end.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import time
+import uuid
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from ewai.db.db_conn import get_connection  # noqa: E402
+
+SCHEMA = "bench_storage"
+N_PARAMS = 9
+N_POINTS = 7
+UNITS = ["°C", "pH", "mg/L", "NTU", "µS/cm", "µg/L", "mg/L", "mg/L", "cells/mL"]
+
+_DDL = f"""
+DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;
+CREATE SCHEMA {SCHEMA};
+CREATE TYPE {SCHEMA}.method AS ENUM ('harmonized', 'raw');
+
+CREATE TABLE {SCHEMA}.legacy (
+  measurement_id BIGSERIAL PRIMARY KEY,
+  dataset_id UUID NOT NULL,
+  sampling_point_id UUID NULL,
+  parameter_id INTEGER NOT NULL,
+  ts TIMESTAMPTZ NULL,
+  value DOUBLE PRECISION NULL,
+  unit TEXT NULL,
+  value_qualifier TEXT NULL,
+  source_column TEXT NULL,
+  method TEXT NOT NULL DEFAULT 'harmonized',
+  created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  quality_flag_id SMALLINT NULL
+);
+
+CREATE TABLE {SCHEMA}.compact (
+  measurement_id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+  row_key BIGINT NULL,
+  ts TIMESTAMPTZ NULL,
+  value DOUBLE PRECISION NULL,
+  dataset_key INTEGER NOT NULL,
+  point_key INTEGER NULL,
+  parameter_id INTEGER NOT NULL,
+  source_id INTEGER NULL,
+  method {SCHEMA}.method NOT NULL DEFAULT 'harmonized',
+  unit_id SMALLINT NULL,
+  quality_flag_id SMALLINT NULL,
+  value_qualifier TEXT NULL
+);
+"""
+
+_INDEXES = {
+    "legacy": [
+        "CREATE UNIQUE INDEX legacy_key ON {s}.legacy (dataset_id, sampling_point_id, parameter_id, ts, source_column)",
+        "CREATE INDEX legacy_point_param ON {s}.legacy (sampling_point_id, parameter_id)",
+        "CREATE INDEX legacy_brin_ts ON {s}.legacy USING brin (ts)",
+    ],
+    "compact": [
+        "CREATE UNIQUE INDEX compact_key ON {s}.compact (dataset_key, row_key)",
+        "CREATE INDEX compact_point_param ON {s}.compact (point_key, parameter_id)",
+        "CREATE INDEX compact_brin_ts ON {s}.compact USING brin (ts)",
+    ],
+}
+
+# row i: dataset i % D, point (i / D) % P, parameter (i / (D·P)) % 9, one time step per full sweep
+_FILL = {
+    "legacy": f"""
+        INSERT INTO {SCHEMA}.legacy (dataset_id, sampling_point_id, parameter_id, ts, value,
+                                     unit, source_column, quality_flag_id)
+        SELECT (%(datasets)s::uuid[])[i %% %(d)s + 1],
+               (%(points)s::uuid[])[(i / %(d)s) %% {N_POINTS} + 1],
+               (i / (%(d)s * {N_POINTS})) %% {N_PARAMS} + 1,
+               timestamptz '2015-01-01' + (i / (%(d)s * {N_POINTS * N_PARAMS})) * interval '6 hours',
+               random() * 100,
+               (%(units)s::text[])[(i / (%(d)s * {N_POINTS})) %% {N_PARAMS} + 1],
+               'Column ' || ((i / (%(d)s * {N_POINTS})) %% {N_PARAMS} + 1),
+               0
+        FROM generate_series(0, %(n)s - 1) AS i
+    """,
+    "compact": f"""
+        INSERT INTO {SCHEMA}.compact (row_key, ts, value, dataset_key, point_key, parameter_id,
+                                      source_id, unit_id, quality_flag_id)
+        SELECT hashtextextended(i::text, 0),
+               timestamptz '2015-01-01' + (i / (%(d)s * {N_POINTS * N_PARAMS})) * interval '6 hours',
+               random() * 100,
+               i %% %(d)s + 1,
+               (i / %(d)s) %% {N_POINTS} + 1,
+               (i / (%(d)s * {N_POINTS})) %% {N_PARAMS} + 1,
+               (i / (%(d)s * {N_POINTS})) %% {N_PARAMS} + 1,
+               (i / (%(d)s * {N_POINTS})) %% {N_PARAMS} + 1,
+               0
+        FROM generate_series(0, %(n)s - 1) AS i
+    """,
+}
+
+_QUERIES = {
+    "dataset_scan": {
+        "legacy": f"SELECT COUNT(*), AVG(value) FROM {SCHEMA}.legacy WHERE dataset_id = %(dataset)s",
+        "compact": f"SELECT COUNT(*), AVG(value) FROM {SCHEMA}.compact WHERE dataset_key = 1",
+    },
+    "series": {
+        "legacy": f"""SELECT ts, value FROM {SCHEMA}.legacy
+                      WHERE sampling_point_id = %(point)s AND parameter_id = 3 ORDER BY ts""",
+        "compact": f"""SELECT ts, value FROM {SCHEMA}.compact
+                       WHERE point_key = 1 AND parameter_id = 3 ORDER BY ts""",
+    },
+    "full_scan": {
+        "legacy": f"SELECT parameter_id, AVG(value) FROM {SCHEMA}.legacy GROUP BY 1",
+        "compact": f"SELECT parameter_id, AVG(value) FROM {SCHEMA}.compact GROUP BY 1",
+    },
+}
+
+
+def _best(cur, sql: str, params: dict, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        cur.execute(sql, params)
+        cur.fetchall()
+        best = min(best, time.perf_counter() - t)
+    return best
+
+
+def run(rows: int, datasets: int, repeat: int):
+    ids = {
+        "datasets": [str(uuid.uuid4()) for _ in range(datasets)],
+        "points": [str(uuid.uuid4()) for _ in range(N_POINTS)],
+    }
+    fill = {"n": rows, "d": datasets, "units": UNITS, **ids}
+    report = {}
+    # no `with conn:` here: psycopg2 opens a transaction block there even in autocommit (VACUUM)
+    conn = get_connection()
+    conn.commit()
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            cur.execute(_DDL)
+            for layout in ("legacy", "compact"):
+                cur.execute(_FILL[layout], fill)
+                for ddl in _INDEXES[layout]:
+                    cur.execute(ddl.format(s=SCHEMA))
+                cur.execute(f"VACUUM ANALYZE {SCHEMA}.{layout}")
+
+                cur.execute("SELECT pg_relation_size(%s), pg_indexes_size(%s)",
+                            (f"{SCHEMA}.{layout}", f"{SCHEMA}.{layout}"))
+                heap, indexes = cur.fetchone()
+                cur.execute("""
+                    SELECT c.relname, pg_relation_size(c.oid)
+                    FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+                    WHERE i.indrelid = %s::regclass ORDER BY c.relname
+                """, (f"{SCHEMA}.{layout}",))
+                entry = {
+                    "heap_bytes_per_row": round(heap / rows, 1),
+                    "heap_mb": round(heap / 2**20, 2),
+                    "index_mb": round(indexes / 2**20, 2),
+                    "indexes_mb": {name: round(size / 2**20, 2) for name, size in cur.fetchall()},
+                }
+                args = {"dataset": ids["datasets"][0], "point": ids["points"][0]}
+                for qname, sqls in _QUERIES.items():
+                    entry[f"{qname}_ms"] = round(_best(cur, sqls[layout], args, repeat) * 1000, 2)
+                report[layout] = entry
+    finally:
+        with conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        conn.close()
+    return report
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m benchmarks.bench_storage")
+    ap.add_argument("--rows", type=int, default=500000)
+    ap.add_argument("--datasets", type=int, default=20)
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--json", default=None, help="also write the report to this file")
+    args = ap.parse_args(argv)
+
+    report = run(args.rows, args.datasets, args.repeat)
+    for layout, e in report.items():
+        print(f"{layout:8s} " + "  ".join(f"{k}={v}" for k, v in e.items()))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
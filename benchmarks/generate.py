@@ -0,0 +1,156 @@
+# benchmarks/generate.py
+"""
+Synthetic water-quality workbooks shaped like the files clients upload.
+
+- parameter columns drawn from STANDARD_UNITS, each in a unit picked from
+  CONTROLLED_UNIT_VOCAB (°F / K temperatures, mS/cm conductivity, µg/L
+  nutrients ...), with values generated in the standard unit and converted
+  back so convert_series has real work to do
+- a few junk rows (report title, lab name, blank line) above the header
+- sampling points named like PRESET_SAMPLING_LOCATIONS, a date column
+- missing cells (blank, "ND", "<LD"), and outliers well outside the fences
+
+    python -m benchmarks.generate --rows 20000 --out /tmp/sample.xlsx [--params 12] [--seed 1]
+
+make_table() returns the DataFrame as written (header included), and
+harmonized_frame() the frame /ingest/map would hand to melt_harmonized.
+"""
+from __future__ import annotations
+
+import argparse
+import io
+import os
+import sys
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from ewai.db.db_util import CONTROLLED_UNIT_VOCAB, PRESET_SAMPLING_LOCATIONS  # noqa: E402
+from ewai.unit_convertor import STANDARD_UNITS  # noqa: E402
+
+# typical (median, log-sd) in the standard unit; lognormal unless noted
+_TYPICAL: Dict[str, Tuple[float, float]] = {
+    "temperature": (21.0, 0.12),
+    "ph": (7.4, 0.05),
+    "dissolved_oxygen": (7.5, 0.25),
+    "turbidity": (6.0, 0.8),
+    "conductivity": (120.0, 0.4),
+    "chlorophyll_a": (12.0, 1.0),
+    "total_phosphorus": (0.04, 0.7),
+    "nitrate": (0.8, 0.6),
+    "total_cyanobacteria": (4000.0, 1.6),
+}
+_DEFAULT_TYPICAL = (3.0, 0.7)
+
+# standard unit -> unit the column is written in
+_FROM_STANDARD = {
+    ("temperature", "F"): lambda v: v * 9 / 5 + 32,
+    ("temperature", "K"): lambda v: v + 273.15,
+    ("conductivity", "mS/cm"): lambda v: v / 1000.0,
+}
+_UG_PER_MG = 1000.0
+
+POINTS = [name.title() for name in PRESET_SAMPLING_LOCATIONS]
+JUNK_ROWS = [
+    ["Informe de calidad de agua - Embalse La Fe"],
+    ["Laboratorio de Hidráulica", None, "Generado: 2024-02-01"],
+    [],
+]
+
+
+def _params(n: int, rng: np.random.Generator) -> List[str]:
+    # the ones with a typical range first (they also have plausible-range checks), then others
+    known = [p for p in _TYPICAL if p in STANDARD_UNITS and p in CONTROLLED_UNIT_VOCAB]
+    rest = [p for p in STANDARD_UNITS if p in CONTROLLED_UNIT_VOCAB and p not in known]
+    rng.shuffle(rest)
+    return (known + rest)[:n]
+
+
+def _to_unit(param: str, unit: str, v: np.ndarray) -> np.ndarray:
+    fn = _FROM_STANDARD.get((param, unit))
+    if fn is not None:
+        return fn(v)
+    if unit == "µg/L" and STANDARD_UNITS.get(param) == "mg/L":
+        return v * _UG_PER_MG
+    return v
+
+
+def make_table(rows: int = 5000, params: int = 10, missing: float = 0.05, outliers: float = 0.01,
+               seed: int = 1) -> Tuple[pd.DataFrame, Dict[str, Tuple[str, str]]]:
+    """
+    The sheet body (header row + data) and {column header: (parameter, unit)}.
+    Rows cycle through the sampling points, one sampling date per sweep.
+    """
+    rng = np.random.default_rng(seed)
+    chosen = _params(params, rng)
+    n_pts = len(POINTS)
+    dates = pd.Timestamp("2015-01-05") + pd.to_timedelta((np.arange(rows) // n_pts) * 7, unit="D")
+    data: Dict[str, object] = {
+        "Fecha": dates.strftime("%d/%m/%Y"),
+        "Punto de muestreo": [POINTS[i % n_pts] for i in range(rows)],
+    }
+    columns: Dict[str, Tuple[str, str]] = {}
+    for p in chosen:
+        unit = str(rng.choice(CONTROLLED_UNIT_VOCAB[p]))
+        med, sd = _TYPICAL.get(p, _DEFAULT_TYPICAL)
+        v = med * np.exp(rng.normal(0.0, sd, rows))
+        out = rng.random(rows) < outliers
+        v[out] *= rng.choice([25.0, 0.02], out.sum())
+        v = np.round(_to_unit(p, unit, v), 4).astype(object)
+        holes = rng.random(rows) < missing
+        v[holes] = rng.choice(np.array([None, "ND", "<LD"], dtype=object), holes.sum())
+        header = f"{p.replace('_', ' ').title()} [{unit}]" if unit != "unitless" else p.replace("_", " ").title()
+        data[header] = v
+        columns[header] = (p, unit)
+    return pd.DataFrame(data), columns
+
+
+def make_workbook(rows: int = 5000, params: int = 10, fmt: str = "xlsx", junk_rows: bool = True,
+                  seed: int = 1, **kw) -> Tuple[bytes, str]:
+    """Encoded upload (xlsx or csv) with junk rows above the header; returns (bytes, filename)."""
+    df, _ = make_table(rows, params, seed=seed, **kw)
+    body = [list(df.columns)] + df.values.tolist()
+    sheet = pd.DataFrame((JUNK_ROWS if junk_rows else []) + body)
+    buf = io.BytesIO()
+    if fmt == "csv":
+        sheet.to_csv(buf, index=False, header=False)
+        return buf.getvalue(), "synthetic.csv"
+    sheet.to_excel(buf, index=False, header=False, sheet_name="Datos")
+    return buf.getvalue(), "synthetic.xlsx"
+
+
+def harmonized_frame(rows: int = 5000, params: int = 10, seed: int = 1, **kw) -> pd.DataFrame:
+    """What /ingest/map produces before unit conversion: date, sampling_point, '<param> [<unit>]'."""
+    df, columns = make_table(rows, params, seed=seed, **kw)
+    out = pd.DataFrame({"date": df["Fecha"], "sampling_point": df["Punto de muestreo"]})
+    for header, (p, unit) in columns.items():
+        out[p if unit == "unitless" else f"{p} [{unit}]"] = pd.to_numeric(df[header], errors="coerce")
+    return out
+
+
+def main(argv: Optional[list] = None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m benchmarks.generate")
+    ap.add_argument("--rows", type=int, default=5000)
+    ap.add_argument("--params", type=int, default=10)
+    ap.add_argument("--missing", type=float, default=0.05)
+    ap.add_argument("--outliers", type=float, default=0.01)
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--out", required=True, help=".xlsx or .csv")
+    args = ap.parse_args(argv)
+
+    fmt = "csv" if args.out.lower().endswith(".csv") else "xlsx"
+    raw, _ = make_workbook(args.rows, args.params, fmt, seed=args.seed,
+                           missing=args.missing, outliers=args.outliers)
+    with open(args.out, "wb") as fh:
+        fh.write(raw)
+    print(f"wrote {args.out} ({len(raw)} bytes, {args.rows} rows)")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
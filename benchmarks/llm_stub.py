@@ -0,0 +1,186 @@
+# benchmarks/llm_stub.py
+"""
+Deterministic stand-in for the Groq chat API, for offline load tests.
+
+StubProvider answers the three prompts the server sends, recognised by their
+system prompt, after LLM_STUB_LATENCY_MS (+/- LLM_STUB_JITTER_MS) plus
+LLM_STUB_MS_PER_TOKEN per completion token (generation time, default 0):
+- header mapping: maps each header by name ("Temperature [K]" ->
+  temperature / K, "Fecha" -> date, "Punto de muestreo" -> sampling_point)
+- waterbody resolution: {"name": "La Fe", "type": "reservoir", ...}
+- Talk2CSV: a per-parameter monthly mean over the measurements view
+
+Importing this module installs it as the ewai.llm provider, so prompt
+building and response parsing still run for real. Job workers load it as
+their handlers module (jobs.start_workers(..., handlers_module="benchmarks.llm_stub")).
+
+Run as a script it serves the same answers (or, with --replay DIR, recorded
+ones) as an OpenAI-compatible HTTP endpoint, for exercising the real Groq
+client path without the network:
+
+    python -m benchmarks.llm_stub --port 8790 [--latency-ms 0] [--replay cassettes/]
+    GROQ_BASE_URL=http://127.0.0.1:8790 GROQ_API_KEY=stub python server/app.py
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+for p in (BASE_DIR, os.path.join(BASE_DIR, "server")):
+    if p not in sys.path:
+        sys.path.insert(0, p)
+
+import app  # noqa: E402  (registers the job kinds)
+import ewai.waterbody_llm_resolver as wb_resolver  # noqa: E402
+from ewai import header_rules, llm  # noqa: E402
+from ewai.db.db_util import CONTROLLED_UNIT_VOCAB  # noqa: E402
+
+_META = {
+    "fecha": "date", "date": "date", "fecha muestreo": "date", "timestamp": "timestamp",
+    "punto de muestreo": "sampling_point", "punto": "sampling_point", "sampling point": "sampling_point",
+    "sampling_point": "sampling_point", "estacion": "station", "station": "station",
+}
+_UNIT = re.compile(r"\s*[\[(]([^\])]+)[\])]\s*$")
+
+TALK2CSV_SQL = """
+SELECT p.code AS parameter, date_trunc('month', m.ts) AS month, AVG(m.value) AS avg_value, COUNT(*) AS n
+FROM measurements m JOIN parameters p ON p.parameter_id = m.parameter_id
+WHERE m.ts IS NOT NULL
+GROUP BY 1, 2 ORDER BY 2, 1
+""".strip()
+
+
+def _map_header(h: str) -> Dict[str, Any]:
+    m = _UNIT.search(h)
+    unit = m.group(1).strip() if m else None
+    name = (_UNIT.sub("", h) if m else h).strip()
+    key = name.lower()
+    if key in _META:
+        return {"raw_header": h, "category": "meta", "map_to": _META[key], "confidence": 0.95,
+                "unit_map_to": "not_applicable", "unit_confidence": 1.0}
+    code = re.sub(r"[^a-z0-9]+", "_", key).strip("_")
+    if code in CONTROLLED_UNIT_VOCAB:
+        allowed = CONTROLLED_UNIT_VOCAB[code]
+        unit_to = unit if unit in allowed else (app.UNIT_NOT_PRESENT if unit is None else "unknown")
+        return {"raw_header": h, "category": "parameter", "map_to": code, "confidence": 0.9,
+                "unit_map_to": unit_to, "unit_confidence": 0.9}
+    # Spanish names, abbreviations ...: whatever the local rules make of it
+    guess = header_rules.map_header(h)
+    guess.pop("source", None)
+    return guess
+
+
+def _headers_from_prompt(prompt: str) -> List[str]:
+    tail = prompt.rsplit("Headers to map:", 1)[-1]
+    try:
+        return json.loads(tail.strip())
+    except ValueError:
+        return []
+
+
+def _answer(messages: List[Dict[str, str]]) -> str:
+    system = messages[0]["content"] if messages else ""
+    user = messages[-1]["content"] if messages else ""
+    if system == app.SYSTEM_PROMPT:
+        return json.dumps({"mappings": [_map_header(h) for h in _headers_from_prompt(user)]})
+    if system == wb_resolver.SYSTEM_PROMPT:
+        return json.dumps({"name": "La Fe", "type": "reservoir", "confidence": 0.9,
+                           "evidence": ["stub: Embalse La Fe"]})
+    return json.dumps({"answer": "Monthly mean per parameter.", "sql": TALK2CSV_SQL,
+                       "chart": {"type": "line", "x": "month", "series": ["avg_value"]}})
+
+
+class StubProvider:
+    """ewai.llm provider answering from _answer() after the configured latency."""
+
+    def __init__(self, latency_ms: float = None, jitter_ms: float = None, ms_per_token: float = None):
+        latency_ms = float(os.getenv("LLM_STUB_LATENCY_MS", "300")) if latency_ms is None else latency_ms
+        jitter_ms = float(os.getenv("LLM_STUB_JITTER_MS", "50")) if jitter_ms is None else jitter_ms
+        ms_per_token = float(os.getenv("LLM_STUB_MS_PER_TOKEN", "0")) if ms_per_token is None else ms_per_token
+        self.latency_s = latency_ms / 1000.0
+        self.jitter_s = jitter_ms / 1000.0
+        self.s_per_token = ms_per_token / 1000.0
+
+    def complete(self, req: Dict[str, Any], timeout: float = None) -> llm.Completion:
+        content = _answer(req.get("messages") or [])
+        prompt_chars = sum(len(m.get("content") or "") for m in req.get("messages") or [])
+        # ~4 characters per token, so the ewai_llm_*_tokens metrics have something to show
+        completion_tokens = len(content) // 4
+        delay = (self.latency_s + random.uniform(-self.jitter_s, self.jitter_s)
+                 + self.s_per_token * completion_tokens)
+        if delay > 0:
+            time.sleep(delay)
+        return llm.Completion(content, prompt_chars // 4, completion_tokens)
+
+
+def install(provider=None) -> None:
+    llm.set_provider(provider or StubProvider())
+
+
+# ---- OpenAI-compatible HTTP stand-in ----
+class _Handler(BaseHTTPRequestHandler):
+    provider = None
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_error(404)
+            return
+        req = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        try:
+            completion = self.provider.complete(req)
+        except llm.ReplayMiss as e:
+            self._send(404, {"error": {"message": str(e), "type": "replay_miss"}})
+            return
+        self._send(200, {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": req.get("model", llm.DEFAULT_MODEL),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": completion.content}}],
+            "usage": {"prompt_tokens": completion.prompt_tokens or 0,
+                      "completion_tokens": completion.completion_tokens or 0,
+                      "total_tokens": (completion.prompt_tokens or 0) + (completion.completion_tokens or 0)},
+        })
+
+    def _send(self, status: int, body: Dict[str, Any]) -> None:
+        raw = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def log_message(self, *args):
+        pass
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m benchmarks.llm_stub")
+    ap.add_argument("--port", type=int, default=8790)
+    ap.add_argument("--latency-ms", type=float, default=None, help="stub answers (default LLM_STUB_LATENCY_MS)")
+    ap.add_argument("--ms-per-token", type=float, default=None, help="default LLM_STUB_MS_PER_TOKEN")
+    ap.add_argument("--replay", default=None, help="serve recorded responses from this LLM_CASSETTE_DIR instead")
+    args = ap.parse_args(argv)
+
+    _Handler.provider = llm.ReplayProvider(args.replay) if args.replay else StubProvider(args.latency_ms, ms_per_token=args.ms_per_token)
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), _Handler)
+    print(f"LLM stand-in on http://127.0.0.1:{args.port} "
+          f"(GROQ_BASE_URL=http://127.0.0.1:{args.port} GROQ_API_KEY=stub)", flush=True)
+    server.serve_forever()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
+else:
+    install()
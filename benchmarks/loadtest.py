@@ -0,0 +1,429 @@
+# benchmarks/loadtest.py
+"""
+End-to-end load test of the API, offline: a throwaway Postgres cluster, the
+Flask app on a local port with the LLM replaced by benchmarks/llm_stub.py,
+and mixed concurrent traffic over real HTTP.
+
+    python -m benchmarks.loadtest [--duration 60] [--concurrency 8] [--clients 4]
+                                  [--llm-latency-ms 300] [--job-workers 2] [--rows 2000]
+                                  [--mix ingest=1,measurements=4,analytics=6,assistant=1]
+                                  [--database-url URL | --pg-bin DIR] [--json out.json]
+
+Without --database-url, initdb/pg_ctl (from --pg-bin, $PG_BIN, PATH or
+pg_config --bindir) create a temp cluster that is removed afterwards; run it
+as a non-root user. Each client first ingests one workbook (generate.py) so
+the read endpoints have data; then `concurrency` threads pick scenarios by
+--mix weight until --duration is up:
+- ingest: POST /ingest/map, poll the job, POST /ingest/persist, poll the job
+- measurements: GET /measurements for one of the client's datasets
+- analytics: one of the /analytics/* views for that dataset
+- assistant: POST /assistant/chat (the stub answers with a monthly-mean query)
+
+Reported per endpoint: requests, errors, p50/p95/p99 latency, throughput,
+and the web process RSS when it answered; job rows ("job map", "job persist")
+time enqueue -> done. Peak RSS of the web process and of the job workers is
+sampled from /proc (Linux).
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+DEFAULT_MIX = "ingest=1,measurements=4,analytics=6,assistant=1"
+ANALYTICS = [
+    ("/analytics/correlation", {}),
+    ("/analytics/lagged_correlation", {"interval": "week", "max_lag": "8"}),
+    ("/analytics/anomalies", {}),
+    ("/analytics/aggregate", {"interval": "month"}),
+    ("/analytics/pivot", {"params": "temperature,ph,turbidity", "interval": "week"}),
+    ("/analytics/quantiles", {}),
+    ("/analytics/distribution", {"parameter": "temperature"}),
+    ("/analytics/trends", {}),
+    ("/analytics/bloom", {}),
+]
+JOB_POLL_S = 0.2
+
+
+# ---------------------------------------------------------------- Postgres
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _pg_bin(explicit: Optional[str]) -> str:
+    for d in (explicit, os.getenv("PG_BIN")):
+        if d and os.path.isfile(os.path.join(d, "initdb")):
+            return d
+    found = shutil.which("initdb")
+    if found:
+        return os.path.dirname(found)
+    try:
+        d = subprocess.run(["pg_config", "--bindir"], capture_output=True, text=True, check=True).stdout.strip()
+        if os.path.isfile(os.path.join(d, "initdb")):
+            return d
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    raise SystemExit("initdb not found: pass --pg-bin (or PG_BIN), or --database-url for an existing server")
+
+
+class TempPostgres:
+    """initdb + pg_ctl start on a free port; stop() removes the cluster."""
+
+    def __init__(self, bin_dir: str):
+        self.bin_dir = bin_dir
+        self.root = tempfile.mkdtemp(prefix="ewai-loadtest-pg-")
+        self.data = os.path.join(self.root, "data")
+        self.port = _free_port()
+
+    def _run(self, tool: str, *args: str) -> None:
+        subprocess.run([os.path.join(self.bin_dir, tool), *args], check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+    def start(self) -> str:
+        if hasattr(os, "geteuid") and os.geteuid() == 0:
+            raise SystemExit("postgres refuses to run as root; run as another user or pass --database-url")
+        self._run("initdb", "-D", self.data, "-U", "postgres", "-A", "trust", "-E", "UTF8", "--no-sync")
+        self._run("pg_ctl", "-D", self.data, "-l", os.path.join(self.root, "postgres.log"), "-w",
+                  "-o", f"-p {self.port} -k {self.root} -c listen_addresses=127.0.0.1", "start")
+        return f"postgresql://postgres@127.0.0.1:{self.port}/postgres"
+
+    def stop(self) -> None:
+        try:
+            self._run("pg_ctl", "-D", self.data, "-m", "fast", "-w", "stop")
+        except subprocess.CalledProcessError:
+            pass
+        shutil.rmtree(self.root, ignore_errors=True)
+
+
+# ------------------------------------------------------------------ server
+def _rss_kb(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/status", encoding="ascii") as fh:
+            for line in fh:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def _children(pid: int) -> List[int]:
+    out = []
+    try:
+        for tid in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{tid}/children", encoding="ascii") as fh:
+                out += [int(c) for c in fh.read().split()]
+    except OSError:
+        pass
+    return out
+
+
+def serve(port: int, job_workers: int, per_client: int) -> None:
+    """Child process: the app with the LLM stub, its job workers and a threaded HTTP server."""
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    import benchmarks.llm_stub  # noqa: F401  (patches app before any request)
+    import app as server_app
+    import jobs
+
+    @server_app.app.after_request
+    def _rss_header(resp):
+        resp.headers["X-RSS-KB"] = str(_rss_kb(os.getpid()))
+        return resp
+
+    if job_workers > 0:
+        jobs.start_workers(job_workers, per_client, handlers_module="benchmarks.llm_stub")
+    class _Quiet(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    make_server("127.0.0.1", port, server_app.app, threaded=True, request_handler=_Quiet).serve_forever()
+
+
+def _start_server(env: Dict[str, str], port: int, job_workers: int, per_client: int) -> subprocess.Popen:
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.loadtest", "serve", "--port", str(port),
+         "--job-workers", str(job_workers), "--per-client", str(per_client)],
+        cwd=BASE_DIR, env=env,
+    )
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit("server exited during startup")
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=2).read()
+            return proc
+        except OSError:
+            time.sleep(0.3)
+    proc.kill()
+    raise SystemExit("server did not come up within 60 s")
+
+
+# ------------------------------------------------------------------ client
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples: Dict[str, List[Tuple[float, bool, int]]] = defaultdict(list)
+
+    def add(self, name: str, seconds: float, ok: bool, rss_kb: int = 0) -> None:
+        with self.lock:
+            self.samples[name].append((seconds, ok, rss_kb))
+
+
+class Client:
+    def __init__(self, base: str, rec: Recorder):
+        self.base = base
+        self.rec = rec
+
+    def call(self, name: str, method: str, path: str, body: Optional[bytes] = None,
+             headers: Optional[Dict[str, str]] = None, record: bool = True):
+        req = urllib.request.Request(self.base + path, data=body, method=method, headers=headers or {})
+        t0 = time.perf_counter()
+        status, payload, rss = 0, None, 0
+        try:
+            with urllib.request.urlopen(req, timeout=300) as r:
+                status, raw, rss = r.status, r.read(), int(r.headers.get("X-RSS-KB") or 0)
+        except urllib.error.HTTPError as e:
+            status, raw, rss = e.code, e.read(), int(e.headers.get("X-RSS-KB") or 0)
+        except OSError:
+            raw = b""
+        dt = time.perf_counter() - t0
+        if record:
+            self.rec.add(name, dt, 200 <= status < 300, rss)
+        try:
+            payload = json.loads(raw) if raw else None
+        except ValueError:
+            payload = None
+        return status, payload
+
+    def get(self, name: str, path: str, params: Dict[str, str], record: bool = True):
+        return self.call(name, "GET", path + "?" + urllib.parse.urlencode(params), record=record)
+
+    def post_json(self, name: str, path: str, obj) -> Tuple[int, object]:
+        return self.call(name, "POST", path, json.dumps(obj).encode(), {"Content-Type": "application/json"})
+
+    def post_file(self, name: str, path: str, fields: Dict[str, str], filename: str, raw: bytes):
+        boundary = uuid.uuid4().hex
+        parts = []
+        for k, v in fields.items():
+            parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{k}"\r\n\r\n{v}\r\n'.encode())
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+                     f"Content-Type: application/octet-stream\r\n\r\n".encode() + raw + b"\r\n")
+        parts.append(f"--{boundary}--\r\n".encode())
+        return self.call(name, "POST", path, b"".join(parts),
+                         {"Content-Type": f"multipart/form-data; boundary={boundary}"})
+
+    def wait_job(self, name: str, job_id: str, client_id: str, started: float):
+        while True:
+            status, job = self.get("GET /jobs/<job_id>", f"/jobs/{job_id}", {"client_id": client_id})
+            if status != 200 or not job:
+                self.rec.add(name, time.perf_counter() - started, False)
+                return None
+            if job["status"] in ("done", "failed"):
+                self.rec.add(name, time.perf_counter() - started, job["status"] == "done")
+                return job.get("result")
+            time.sleep(JOB_POLL_S)
+
+
+def ingest(c: Client, client_id: str, workbook: Tuple[bytes, str]) -> Optional[str]:
+    raw, filename = workbook
+    t0 = time.perf_counter()
+    status, body = c.post_file("POST /ingest/map", "/ingest/map", {"client_id": client_id}, filename, raw)
+    if status != 202:
+        return None
+    mapped = c.wait_job("job map", body["job_id"], client_id, t0)
+    if not mapped:
+        return None
+    t0 = time.perf_counter()
+    status, body = c.post_json("POST /ingest/persist", "/ingest/persist", {
+        "client_id": client_id, "session_id": mapped["session_id"], "email": f"{client_id[:8]}@loadtest.local",
+        "file_name": filename, "mode": "new", "use_content_hash": False,
+    })
+    if status != 202:
+        return None
+    persisted = c.wait_job("job persist", body["job_id"], client_id, t0)
+    return persisted["dataset_id"] if persisted else None
+
+
+def _scenario(c: Client, kind: str, client_id: str, datasets: List[str], workbooks, rnd: random.Random) -> None:
+    if kind == "ingest":
+        ds = ingest(c, client_id, rnd.choice(workbooks))
+        if ds:
+            datasets.append(ds)
+        return
+    if kind == "assistant":
+        c.post_json("POST /assistant/chat", "/assistant/chat",
+                    {"messages": [{"role": "user", "content": "monthly mean of every parameter as a line chart"}]})
+        return
+    params = {"client_id": client_id, "dataset_id": rnd.choice(datasets)}
+    if kind == "measurements":
+        c.get("GET /measurements", "/measurements", params)
+    else:
+        path, extra = rnd.choice(ANALYTICS)
+        c.get(f"GET {path}", path, {**params, **extra})
+
+
+def _percentile(sorted_vals: List[float], q: float) -> float:
+    if not sorted_vals:
+        return float("nan")
+    i = min(len(sorted_vals) - 1, max(0, int(round(q * (len(sorted_vals) - 1)))))
+    return sorted_vals[i]
+
+
+def summarize(rec: Recorder, duration: float) -> Dict[str, Dict[str, float]]:
+    out = {}
+    for name, rows in sorted(rec.samples.items()):
+        lat = sorted(s for s, _, _ in rows)
+        rss = [r for _, _, r in rows if r]
+        out[name] = {
+            "requests": len(rows),
+            "errors": sum(1 for _, ok, _ in rows if not ok),
+            "p50_ms": round(_percentile(lat, 0.50) * 1000, 1),
+            "p95_ms": round(_percentile(lat, 0.95) * 1000, 1),
+            "p99_ms": round(_percentile(lat, 0.99) * 1000, 1),
+            "per_s": round(len(rows) / duration, 2),
+            "rss_mb_max": round(max(rss) / 1024, 1) if rss else None,
+        }
+    return out
+
+
+def run(args) -> dict:
+    from benchmarks.generate import make_workbook
+
+    pg = None
+    url = args.database_url
+    if not url:
+        pg = TempPostgres(_pg_bin(args.pg_bin))
+        url = pg.start()
+    port = _free_port()
+    env = {**os.environ, "DATABASE_URL": url, "JOB_WORKERS": "0",
+           "LLM_STUB_LATENCY_MS": str(args.llm_latency_ms), "LLM_STUB_JITTER_MS": str(args.llm_latency_ms / 5),
+           "METRICS_DIR": "", "SLOW_REQUEST_MS": "600000", "PYTHONPATH": BASE_DIR}
+    server = None
+    peaks = {"web_rss_mb": 0.0, "workers_rss_mb": 0.0}
+    stop = threading.Event()
+    try:
+        server = _start_server(env, port, args.job_workers, args.per_client)
+
+        def sample():
+            while not stop.is_set():
+                peaks["web_rss_mb"] = max(peaks["web_rss_mb"], _rss_kb(server.pid) / 1024)
+                kids = sum(_rss_kb(p) for p in _children(server.pid))
+                peaks["workers_rss_mb"] = max(peaks["workers_rss_mb"], kids / 1024)
+                time.sleep(0.5)
+        threading.Thread(target=sample, daemon=True).start()
+
+        workbooks = [make_workbook(args.rows, 10, fmt, seed=s)
+                     for s, fmt in enumerate(["xlsx", "csv", "xlsx", "csv"])]
+        clients = [str(uuid.uuid4()) for _ in range(args.clients)]
+        datasets: Dict[str, List[str]] = {}
+        setup = Client(f"http://127.0.0.1:{port}", Recorder())
+        for i, cid in enumerate(clients):
+            ds = ingest(setup, cid, workbooks[i % len(workbooks)])
+            if not ds:
+                raise SystemExit(f"seeding client {cid} failed (see server output)")
+            datasets[cid] = [ds]
+
+        mix = [(k, float(w)) for k, w in (kv.split("=") for kv in args.mix.split(","))]
+        kinds, weights = [k for k, _ in mix], [w for _, w in mix]
+        rec = Recorder()
+        deadline = time.time() + args.duration
+
+        def worker(n: int):
+            rnd = random.Random(n)
+            c = Client(f"http://127.0.0.1:{port}", rec)
+            while time.time() < deadline:
+                cid = rnd.choice(clients)
+                _scenario(c, rnd.choices(kinds, weights)[0], cid, datasets[cid], workbooks, rnd)
+
+        t0 = time.time()
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(args.concurrency)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.time() - t0
+    finally:
+        stop.set()
+        if server is not None:
+            for p in _children(server.pid):
+                try:
+                    os.kill(p, 15)
+                except OSError:
+                    pass
+            server.terminate()
+            server.wait(timeout=30)
+        if pg is not None:
+            pg.stop()
+
+    endpoints = summarize(rec, elapsed)
+    total = sum(e["requests"] for n, e in endpoints.items() if not n.startswith("job "))
+    return {
+        "config": {k: v for k, v in vars(args).items() if k not in ("command", "database_url")},
+        "elapsed_s": round(elapsed, 1),
+        "requests_per_s": round(total / elapsed, 2),
+        "peak_rss_mb": {k: round(v, 1) for k, v in peaks.items()},
+        "endpoints": endpoints,
+    }
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m benchmarks.loadtest")
+    sub = ap.add_subparsers(dest="command")
+    sv = sub.add_parser("serve", help=argparse.SUPPRESS)
+    sv.add_argument("--port", type=int, required=True)
+    sv.add_argument("--job-workers", type=int, default=2)
+    sv.add_argument("--per-client", type=int, default=1)
+    ap.add_argument("--duration", type=float, default=60)
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--clients", type=int, default=4)
+    ap.add_argument("--rows", type=int, default=2000, help="rows per generated workbook")
+    ap.add_argument("--llm-latency-ms", type=float, default=300)
+    ap.add_argument("--job-workers", type=int, default=2)
+    ap.add_argument("--per-client", type=int, default=1)
+    ap.add_argument("--mix", default=DEFAULT_MIX)
+    ap.add_argument("--database-url", default=None, help="use this database instead of a temp cluster")
+    ap.add_argument("--pg-bin", default=None, help="directory with initdb/pg_ctl")
+    ap.add_argument("--json", default=None, help="also write the report to this file")
+    args = ap.parse_args(argv)
+
+    if args.command == "serve":
+        serve(args.port, args.job_workers, args.per_client)
+        return 0
+
+    report = run(args)
+    print(f"{'endpoint':40s} {'req':>6s} {'err':>5s} {'p50':>8s} {'p95':>8s} {'p99':>8s} {'req/s':>7s} {'rss MB':>7s}")
+    for name, e in report["endpoints"].items():
+        print(f"{name:40s} {e['requests']:6d} {e['errors']:5d} {e['p50_ms']:8.1f} {e['p95_ms']:8.1f} "
+              f"{e['p99_ms']:8.1f} {e['per_s']:7.2f} {e['rss_mb_max'] or 0:7.1f}")
+    print(f"throughput {report['requests_per_s']} req/s over {report['elapsed_s']} s; "
+          f"peak RSS web {report['peak_rss_mb']['web_rss_mb']} MB, "
+          f"job workers {report['peak_rss_mb']['workers_rss_mb']} MB")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
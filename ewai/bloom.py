@@ -0,0 +1,79 @@
+# ewai/bloom.py
+"""
+Algal-bloom risk bands, server-side twin of myapp/src/utils/bloom.js.
+
+Bands are checked in order and the first matching test wins (pH lists its
+'alert' band first, like the frontend). Keep both files in sync.
+"""
+from __future__ import annotations
+
+import math
+from typing import Any, Dict, Optional
+
+BLOOM_RULES: Dict[str, Dict[str, Any]] = {
+    "total_cyanobacteria": {
+        "unit": "cells/mL",
+        "label": "Cyanobacteria",
+        "bands": [
+            ("ok",    lambda v: v < 2000,                "< 2,000 cells/mL"),
+            ("watch", lambda v: 2000 <= v <= 100000,     "2k–100k cells/mL"),
+            ("alert", lambda v: v > 100000,              "> 100k cells/mL"),
+        ],
+    },
+    "chlorophyll_a": {
+        "unit": "µg/L",
+        "label": "Chlorophyll-a",
+        "bands": [
+            ("ok",    lambda v: v < 10,                  "< 10 µg/L"),
+            ("watch", lambda v: 10 <= v <= 50,           "10–50 µg/L"),
+            ("alert", lambda v: v > 50,                  "> 50 µg/L"),
+        ],
+    },
+    "microcystins": {
+        "unit": "µg/L",
+        "label": "Microcystins",
+        "bands": [
+            ("ok",    lambda v: v < 1,                   "< 1 µg/L"),
+            ("watch", lambda v: 1 <= v <= 10,            "1–10 µg/L"),
+            ("alert", lambda v: v > 10,                  "> 10 µg/L"),
+        ],
+    },
+    "ph": {
+        "unit": "",
+        "label": "pH",
+        "bands": [
+            ("alert", lambda v: v < 6 or v > 9.5,                     "< 6 or > 9.5"),
+            ("watch", lambda v: 6 <= v < 6.5 or 9 < v <= 9.5,         "6–6.5 or 9–9.5"),
+            ("ok",    lambda v: 6.5 <= v <= 9,                        "6.5–9"),
+        ],
+    },
+}
+
+BLOOM_CODES = ["total_cyanobacteria", "chlorophyll_a", "microcystins", "ph"]
+
+LEVEL_RANK = {"alert": 3, "watch": 2, "ok": 1, "na": 0}
+
+
+def pick_level(code: str, value: Optional[float]) -> Dict[str, str]:
+    """{'level': 'ok'|'watch'|'alert'|'na', 'msg': ...} for one reading."""
+    rules = BLOOM_RULES.get(code)
+    if rules is None or value is None:
+        return {"level": "na", "msg": "—"}
+    try:
+        v = float(value)
+    except (TypeError, ValueError):
+        return {"level": "na", "msg": "—"}
+    if not math.isfinite(v):
+        return {"level": "na", "msg": "—"}
+    for level, test, msg in rules["bands"]:
+        if test(v):
+            return {"level": level, "msg": msg}
+    return {"level": "na", "msg": "—"}
+
+
+def worst_level(levels) -> str:
+    return max(levels, key=lambda lv: LEVEL_RANK.get(lv, 0), default="na")
+
+
+def level_to_safety(level: str) -> str:
+    return {"alert": "unsafe", "watch": "warn", "ok": "safe"}.get(level, "unknown")
@@ -1,10 +1,47 @@
 # csv/db/db_conn.py
 import os
+import time
+from functools import lru_cache
+
 import psycopg2
+import psycopg2.extensions
 from dotenv import load_dotenv
 
+from ewai.metrics import record_query
+
 load_dotenv()  # optional .env support
 
+class _TimedCursorMixin:
+    """Counts statements and their time (ewai.metrics.record_query)."""
+
+    def execute(self, query, vars=None):
+        t0 = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            record_query(time.perf_counter() - t0)
+
+    def executemany(self, query, vars_list):
+        t0 = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            record_query(time.perf_counter() - t0)
+
+
+@lru_cache(maxsize=None)
+def _timed(cursor_class):
+    return type("Timed" + cursor_class.__name__, (_TimedCursorMixin, cursor_class), {})
+
+
+class TimedConnection(psycopg2.extensions.connection):
+    """Connection whose cursors (whatever cursor_factory is asked for) are timed."""
+
+    def cursor(self, *args, **kwargs):
+        factory = kwargs.pop("cursor_factory", None) or self.cursor_factory or psycopg2.extensions.cursor
+        return super().cursor(*args, cursor_factory=_timed(factory), **kwargs)
+
+
 def get_connection():
     # Prefer env var, else fallback to your Neon URL
     db_url = os.getenv(
@@ -14,7 +51,7 @@ def get_connection():
     if not db_url:
         raise RuntimeError("DATABASE_URL not set (and no fallback provided)")
 
-    conn = psycopg2.connect(db_url)
+    conn = psycopg2.connect(db_url, connection_factory=TimedConnection)
     with conn.cursor() as cur:
         cur.execute("SET search_path TO public;")
     return conn
@@ -1,14 +1,20 @@
 # csv_pipeline/db/db_utils.py
 from __future__ import annotations
 
+import hashlib
 import re
 from typing import Dict, List, Tuple, Optional
 import unicodedata
 import string
+import numpy as np
 import pandas as pd
 import psycopg2
 import psycopg2.extras as pgx
 from typing import Iterable
+
+from ewai.geo import geohash_encode
+from ewai.metrics import stage
+from ewai.tdigest import TDigest
 # =========================
 # Canonical vocab (single source of truth)
 # =========================
@@ -249,6 +255,13 @@ CREATE TABLE IF NOT EXISTS public.sampling_points (
   UNIQUE (client_id, code)
 );
 
+ALTER TABLE public.sampling_points
+  ADD COLUMN IF NOT EXISTS geohash TEXT NULL;
+
+-- bbox lookups without PostGIS: prefix range scans (see ewai/geo.py)
+CREATE INDEX IF NOT EXISTS sampling_points_idx_geohash
+  ON public.sampling_points (client_id, geohash text_pattern_ops);
+
 CREATE TABLE IF NOT EXISTS public.parameters (
   parameter_id SERIAL PRIMARY KEY,
   code TEXT UNIQUE NOT NULL,
@@ -274,28 +287,288 @@ CREATE TABLE IF NOT EXISTS public.datasets (
   uploaded_at TIMESTAMPTZ NOT NULL DEFAULT now()
 );
 
-CREATE TABLE IF NOT EXISTS public.measurements (
-  measurement_id BIGSERIAL PRIMARY KEY,
-  dataset_id UUID NOT NULL REFERENCES public.datasets(dataset_id) ON DELETE CASCADE,
-  sampling_point_id UUID NULL REFERENCES public.sampling_points(sampling_point_id) ON DELETE SET NULL,
-  parameter_id INTEGER NOT NULL REFERENCES public.parameters(parameter_id),
+CREATE TABLE IF NOT EXISTS public.quality_flags (
+  quality_flag_id SMALLINT PRIMARY KEY,
+  code TEXT UNIQUE NOT NULL,
+  label TEXT NOT NULL,
+  description TEXT NULL
+);
+
+-- Integer surrogate keys: measurement rows carry these instead of 16-byte UUIDs.
+ALTER TABLE public.datasets
+  ADD COLUMN IF NOT EXISTS dataset_key INTEGER GENERATED BY DEFAULT AS IDENTITY;
+CREATE UNIQUE INDEX IF NOT EXISTS datasets_dataset_key ON public.datasets (dataset_key);
+
+ALTER TABLE public.sampling_points
+  ADD COLUMN IF NOT EXISTS point_key INTEGER GENERATED BY DEFAULT AS IDENTITY;
+CREATE UNIQUE INDEX IF NOT EXISTS sampling_points_point_key ON public.sampling_points (point_key);
+
+-- Dictionaries for the low-cardinality text columns of measurement rows.
+CREATE TABLE IF NOT EXISTS public.units (
+  unit_id INTEGER GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+  unit TEXT UNIQUE NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS public.source_columns (
+  source_id INTEGER GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+  source_column TEXT UNIQUE NOT NULL
+);
+
+DO $$
+BEGIN
+  IF NOT EXISTS (SELECT 1 FROM pg_type WHERE typname = 'measurement_method') THEN
+    CREATE TYPE public.measurement_method AS ENUM ('harmonized', 'raw');
+  END IF;
+END$$;
+
+-- Compact physical layout of measurements: fixed-width columns ordered
+-- 8-byte, 4-byte, 2-byte so no alignment padding is wasted, the only
+-- varlena (value_qualifier, almost always NULL) last. public.measurements is
+-- a view over this with the legacy column names (_ensure_measurements_view).
+-- Hash-partitioned on dataset_key (_ensure_measurement_partitions): every
+-- read filters on one dataset, so the planner prunes to one partition.
+CREATE TABLE IF NOT EXISTS public.measurement_rows (
+  measurement_id BIGINT GENERATED BY DEFAULT AS IDENTITY,
+  row_key BIGINT NULL,
   ts TIMESTAMPTZ NULL,
   value DOUBLE PRECISION NULL,
-  unit TEXT NULL,
+  dataset_key INTEGER NOT NULL REFERENCES public.datasets(dataset_key) ON DELETE CASCADE,
+  point_key INTEGER NULL REFERENCES public.sampling_points(point_key) ON DELETE SET NULL,
+  parameter_id INTEGER NOT NULL REFERENCES public.parameters(parameter_id),
+  source_id INTEGER NULL REFERENCES public.source_columns(source_id),
+  method public.measurement_method NOT NULL DEFAULT 'harmonized',
+  unit_id INTEGER NULL REFERENCES public.units(unit_id),
+  quality_flag_id SMALLINT NULL,
   value_qualifier TEXT NULL,
-  source_column TEXT NULL,
-  method TEXT NOT NULL DEFAULT 'harmonized',
+  PRIMARY KEY (measurement_id, dataset_key)
+) PARTITION BY HASH (dataset_key);
+
+-- unit_id was SMALLINT, too narrow for a sequence that any wasted insert
+-- advances. Widened once (rewrites measurement_rows); the legacy view reads
+-- the column, so it is dropped here and recreated by _ensure_measurements_view.
+DO $$
+BEGIN
+  IF EXISTS (SELECT 1 FROM information_schema.columns
+             WHERE table_schema = 'public' AND table_name = 'measurement_rows'
+               AND column_name = 'unit_id' AND data_type = 'smallint')
+     OR EXISTS (SELECT 1 FROM information_schema.columns
+                WHERE table_schema = 'public' AND table_name = 'units'
+                  AND column_name = 'unit_id' AND data_type = 'smallint') THEN
+    DROP VIEW IF EXISTS public.measurements;
+    ALTER TABLE public.units ALTER COLUMN unit_id TYPE INTEGER;
+    ALTER TABLE public.measurement_rows ALTER COLUMN unit_id TYPE INTEGER;
+  END IF;
+END$$;
+
+-- Dedup key: a 64-bit hash of (point, parameter, ts, source column) with
+-- NULLs encoded, computed at ingest (_row_keys). Unlike a UNIQUE over the
+-- raw columns it also catches rows without a timestamp or sampling point.
+-- NULL only for rows copied in before keying (backfill_row_keys).
+ALTER TABLE public.measurement_rows
+  ADD COLUMN IF NOT EXISTS row_key BIGINT NULL;
+CREATE UNIQUE INDEX IF NOT EXISTS measurement_rows_row_key
+  ON public.measurement_rows (dataset_key, row_key);
+ALTER TABLE public.measurement_rows
+  DROP CONSTRAINT IF EXISTS measurement_rows_dataset_key_point_key_parameter_id_ts_sour_key;
+
+-- ts is range-scanned within one dataset; BRIN (per partition) is tiny next
+-- to a btree and rows arrive roughly in time order per file
+CREATE INDEX IF NOT EXISTS measurement_rows_brin_ts
+  ON public.measurement_rows USING brin (ts);
+
+CREATE INDEX IF NOT EXISTS measurement_rows_idx_point_param
+  ON public.measurement_rows (point_key, parameter_id);
+
+-- Per (dataset, parameter, point, flag) counters behind /analytics/anomalies.
+-- Maintained by insert_measurements in the same transaction as the rows;
+-- removed with the dataset via ON DELETE CASCADE.
+CREATE TABLE IF NOT EXISTS public.dataset_flag_counts (
+  dataset_id UUID NOT NULL REFERENCES public.datasets(dataset_id) ON DELETE CASCADE,
+  parameter_id INTEGER NOT NULL REFERENCES public.parameters(parameter_id),
+  sampling_point_id UUID NULL,
+  quality_flag_id SMALLINT NOT NULL,
+  n BIGINT NOT NULL DEFAULT 0
+);
+
+-- Monotonic per-dataset data version (source of HTTP ETags). No FK on purpose:
+-- the row outlives the dataset so that deleting it still bumps the version.
+CREATE TABLE IF NOT EXISTS public.dataset_versions (
+  dataset_id UUID PRIMARY KEY,
+  version BIGINT NOT NULL DEFAULT 0,
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- Per-client version of public.sampling_points (shared by all of a client's
+-- datasets); bumped by upsert_sampling_points, part of /sampling_points ETags.
+CREATE TABLE IF NOT EXISTS public.point_versions (
+  client_id UUID PRIMARY KEY,
+  version BIGINT NOT NULL DEFAULT 0,
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- Background ingest jobs (server/jobs.py): queued -> running -> done | failed.
+-- payload holds the upload until the job finishes.
+CREATE TABLE IF NOT EXISTS public.ingest_jobs (
+  job_id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+  client_id UUID NULL,
+  kind TEXT NOT NULL,
+  status TEXT NOT NULL DEFAULT 'queued' CHECK (status IN ('queued','running','done','failed')),
+  stage TEXT NULL,
+  progress JSONB NOT NULL DEFAULT '{}'::jsonb,
+  params JSONB NOT NULL DEFAULT '{}'::jsonb,
+  payload BYTEA NULL,
+  result JSONB NULL,
+  error TEXT NULL,
+  error_status SMALLINT NULL,
   created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
-  UNIQUE (dataset_id, sampling_point_id, parameter_id, ts, source_column)
+  started_at TIMESTAMPTZ NULL,
+  heartbeat_at TIMESTAMPTZ NULL,
+  finished_at TIMESTAMPTZ NULL
+);
+
+CREATE INDEX IF NOT EXISTS ingest_jobs_idx_queued
+  ON public.ingest_jobs (created_at) WHERE status = 'queued';
+
+CREATE INDEX IF NOT EXISTS ingest_jobs_idx_running
+  ON public.ingest_jobs (client_id) WHERE status = 'running';
+
+-- /ingest/map sessions (harmonized frame + upload, pickled) shared between
+-- the web and worker processes until /ingest/persist consumes them.
+CREATE TABLE IF NOT EXISTS public.ingest_sessions (
+  session_id UUID PRIMARY KEY,
+  data BYTEA NOT NULL,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- Waterbody per upload naming pattern (ewai/waterbody_cache.py): filename and
+-- sheet names with dates/numbers folded, so monthly files share one row.
+CREATE TABLE IF NOT EXISTS public.waterbody_hints (
+  client_id UUID NOT NULL,
+  pattern TEXT NOT NULL,
+  waterbody_id UUID NULL REFERENCES public.waterbodies(waterbody_id) ON DELETE CASCADE,
+  name TEXT NOT NULL,
+  type TEXT NOT NULL,
+  confidence NUMERIC(4,3) NOT NULL DEFAULT 0,
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  PRIMARY KEY (client_id, pattern)
+);
+
+-- sampling_point_id may be NULL; fold it to the nil UUID so the key stays unique
+CREATE UNIQUE INDEX IF NOT EXISTS dataset_flag_counts_key
+  ON public.dataset_flag_counts
+  (dataset_id, parameter_id, (COALESCE(sampling_point_id, '00000000-0000-0000-0000-000000000000'::uuid)), quality_flag_id);
+
+-- Daily rollup of non-null values per (dataset, point, parameter, UTC day).
+-- Maintained by insert_measurements; day-or-coarser mean/min/max/count
+-- aggregations read this instead of the raw rows.
+CREATE TABLE IF NOT EXISTS public.measurement_daily (
+  dataset_id UUID NOT NULL REFERENCES public.datasets(dataset_id) ON DELETE CASCADE,
+  sampling_point_id UUID NULL,
+  parameter_id INTEGER NOT NULL REFERENCES public.parameters(parameter_id),
+  day DATE NOT NULL,
+  n INTEGER NOT NULL,
+  vsum DOUBLE PRECISION NOT NULL,
+  vsum_sq DOUBLE PRECISION NOT NULL,
+  vmin DOUBLE PRECISION NOT NULL,
+  vmax DOUBLE PRECISION NOT NULL
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS measurement_daily_key
+  ON public.measurement_daily
+  (dataset_id, parameter_id, (COALESCE(sampling_point_id, '00000000-0000-0000-0000-000000000000'::uuid)), day);
+
+-- Newest timestamped non-null value per (dataset, point, parameter).
+-- Maintained by insert_measurements; backs /analytics/bloom.
+CREATE TABLE IF NOT EXISTS public.latest_measurement (
+  dataset_id UUID NOT NULL REFERENCES public.datasets(dataset_id) ON DELETE CASCADE,
+  sampling_point_id UUID NULL,
+  parameter_id INTEGER NOT NULL REFERENCES public.parameters(parameter_id),
+  ts TIMESTAMPTZ NOT NULL,
+  value DOUBLE PRECISION NOT NULL,
+  quality_flag_id SMALLINT NULL
 );
 
-CREATE INDEX IF NOT EXISTS measurements_idx_ts
-  ON public.measurements (ts);
+CREATE UNIQUE INDEX IF NOT EXISTS latest_measurement_key
+  ON public.latest_measurement
+  (dataset_id, parameter_id, (COALESCE(sampling_point_id, '00000000-0000-0000-0000-000000000000'::uuid)));
+
+-- per-point summaries across datasets (/sampling_points)
+CREATE INDEX IF NOT EXISTS latest_measurement_idx_point
+  ON public.latest_measurement (sampling_point_id);
+
+CREATE INDEX IF NOT EXISTS dataset_flag_counts_idx_point
+  ON public.dataset_flag_counts (sampling_point_id);
+
+-- Per (client, point, parameter, calendar month) t-digest (ewai/tdigest.py)
+-- of scorable values across all of a client's datasets. New rows are scored
+-- against its median/IQR fences at ingest and then merged in.
+CREATE TABLE IF NOT EXISTS public.climatology_baselines (
+  client_id UUID NOT NULL,
+  sampling_point_id UUID NULL,
+  parameter_id INTEGER NOT NULL REFERENCES public.parameters(parameter_id),
+  month SMALLINT NOT NULL,
+  n BIGINT NOT NULL,
+  digest BYTEA NULL,
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- earlier layout kept a running mean / M2; those slots have no digest and
+-- are ignored until rebuild-baselines (or the next ingest) refills them
+ALTER TABLE public.climatology_baselines
+  ADD COLUMN IF NOT EXISTS digest BYTEA NULL,
+  DROP COLUMN IF EXISTS mean,
+  DROP COLUMN IF EXISTS m2;
+
+CREATE UNIQUE INDEX IF NOT EXISTS climatology_baselines_key
+  ON public.climatology_baselines
+  (client_id, parameter_id, (COALESCE(sampling_point_id, '00000000-0000-0000-0000-000000000000'::uuid)), month);
+
+-- Mergeable t-digests (ewai/tdigest.py) of non-null values per (dataset,
+-- point, parameter), for all rows (month = 0) and per UTC calendar month
+-- (1..12). Merged at ingest; quantile queries read these instead of rows.
+CREATE TABLE IF NOT EXISTS public.quantile_sketches (
+  dataset_id UUID NOT NULL REFERENCES public.datasets(dataset_id) ON DELETE CASCADE,
+  sampling_point_id UUID NULL,
+  parameter_id INTEGER NOT NULL REFERENCES public.parameters(parameter_id),
+  month SMALLINT NOT NULL,
+  n BIGINT NOT NULL,
+  digest BYTEA NOT NULL
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS quantile_sketches_key
+  ON public.quantile_sketches
+  (dataset_id, parameter_id, (COALESCE(sampling_point_id, '00000000-0000-0000-0000-000000000000'::uuid)), month);
+
+-- Shared LLM admission queue (ewai/llm_admission.py): one ticket per waiting
+-- or running call across all processes, tagged by start-time fair queueing.
+-- llm_flows holds each (purpose|client) flow's last finish tag; the row with
+-- flow = '' is the virtual time.
+CREATE TABLE IF NOT EXISTS public.llm_tickets (
+  ticket BIGSERIAL PRIMARY KEY,
+  purpose TEXT NOT NULL,
+  client TEXT NULL,
+  tag DOUBLE PRECISION NOT NULL,
+  running BOOLEAN NOT NULL DEFAULT FALSE,
+  seen_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  expires_at TIMESTAMPTZ NULL
+);
 
-CREATE INDEX IF NOT EXISTS measurements_idx_point_param
-  ON public.measurements (sampling_point_id, parameter_id);
+CREATE TABLE IF NOT EXISTS public.llm_flows (
+  flow TEXT PRIMARY KEY,
+  finish DOUBLE PRECISION NOT NULL,
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- Fingerprint of the DDL last applied (ensure_schema skips it when current)
+CREATE TABLE IF NOT EXISTS public.schema_version (
+  singleton BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (singleton),
+  fingerprint TEXT NOT NULL,
+  applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
 """
 
+_NIL_UUID = "00000000-0000-0000-0000-000000000000"
+
 # =========================
 # Helpers
 # =========================
@@ -322,80 +595,226 @@ def _first_present(df: pd.DataFrame, candidates: List[str]) -> Optional[str]:
 # Public API
 # =========================
 
-def ensure_schema(conn, seed_all: bool = False) -> None:
+MEASUREMENT_PARTITIONS = 16
+
+
+def _relkind(cur, name: str) -> Optional[str]:
+    cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (name,))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def _ensure_measurement_partitions(cur) -> None:
+    """Create the hash partitions of public.measurement_rows."""
+    for r in range(MEASUREMENT_PARTITIONS):
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS public.measurement_rows_p{r:02d}
+              PARTITION OF public.measurement_rows
+              FOR VALUES WITH (MODULUS {MEASUREMENT_PARTITIONS}, REMAINDER {r})
+        """)
+
+
+_MEASUREMENTS_VIEW_SQL = """
+CREATE OR REPLACE VIEW public.measurements AS
+SELECT m.measurement_id, d.dataset_id, sp.sampling_point_id, m.parameter_id,
+       m.ts, m.value, u.unit, m.value_qualifier, s.source_column,
+       m.method::text AS method, m.quality_flag_id
+FROM public.measurement_rows m
+JOIN public.datasets d ON d.dataset_key = m.dataset_key
+LEFT JOIN public.sampling_points sp ON sp.point_key = m.point_key
+LEFT JOIN public.units u ON u.unit_id = m.unit_id
+LEFT JOIN public.source_columns s ON s.source_id = m.source_id
+"""
+
+
+def _ensure_measurements_view(cur) -> Tuple[int, List[str]]:
     """
-    Creates tables + indexes. Optionally seeds full vocab.
-    Re-runnable / idempotent.
+    Legacy-shaped public.measurements view over measurement_rows, for
+    Talk2CSV and ad-hoc SQL. A pre-compaction measurements *table* is
+    migrated first (see compact_measurements). Returns (rows migrated,
+    dataset ids that lost duplicate rows on the way).
+    """
+    moved, deduped = 0, []
+    if _relkind(cur, "public.measurements") in ("r", "p"):
+        cur.execute("LOCK TABLE public.measurements IN ACCESS EXCLUSIVE MODE")
+        # a concurrent ensure_schema may have migrated it while we waited
+        if _relkind(cur, "public.measurements") in ("r", "p"):
+            moved, deduped = _migrate_legacy_measurements(cur)
+    cur.execute(_MEASUREMENTS_VIEW_SQL)
+    return moved, deduped
+
+
+def _migrate_legacy_measurements(cur) -> Tuple[int, List[str]]:
+    cur.execute("ALTER TABLE public.measurements RENAME TO measurements_legacy")
+    cur.execute("ALTER TABLE public.measurements_legacy ADD COLUMN IF NOT EXISTS quality_flag_id SMALLINT NULL")
+    cur.execute("""
+        INSERT INTO public.units (unit)
+        SELECT DISTINCT unit FROM public.measurements_legacy WHERE unit IS NOT NULL
+        ON CONFLICT (unit) DO NOTHING
+    """)
+    cur.execute("""
+        INSERT INTO public.source_columns (source_column)
+        SELECT DISTINCT source_column FROM public.measurements_legacy WHERE source_column IS NOT NULL
+        ON CONFLICT (source_column) DO NOTHING
+    """)
+    # ordered by dataset then time so each partition's BRIN ranges stay tight
+    cur.execute("""
+        INSERT INTO public.measurement_rows
+          (measurement_id, ts, value, dataset_key, point_key, parameter_id,
+           source_id, method, unit_id, quality_flag_id, value_qualifier)
+        SELECT l.measurement_id, l.ts, l.value, d.dataset_key, sp.point_key, l.parameter_id,
+               s.source_id,
+               (CASE WHEN l.method = 'raw' THEN 'raw' ELSE 'harmonized' END)::public.measurement_method,
+               u.unit_id, l.quality_flag_id, l.value_qualifier
+        FROM public.measurements_legacy l
+        JOIN public.datasets d ON d.dataset_id = l.dataset_id
+        LEFT JOIN public.sampling_points sp ON sp.sampling_point_id = l.sampling_point_id
+        LEFT JOIN public.units u ON u.unit = l.unit
+        LEFT JOIN public.source_columns s ON s.source_column = l.source_column
+        ORDER BY d.dataset_key, l.ts
+    """)
+    moved = cur.rowcount
+    deduped = _key_rows(cur)
+    cur.execute("""
+        SELECT setval(pg_get_serial_sequence('public.measurement_rows', 'measurement_id'),
+                      GREATEST(COALESCE((SELECT MAX(measurement_id) FROM public.measurement_rows), 0), 1))
+    """)
+    cur.execute("DROP TABLE public.measurements_legacy CASCADE")
+    return moved, deduped
+
+
+def compact_measurements(conn) -> int:
+    """
+    One-off migration of a legacy public.measurements table (plain or
+    partitioned on dataset_id) into measurement_rows, in one transaction;
+    the table is locked while rows are copied. ensure_schema does the same
+    on first use, so run this ahead of deploying to keep that off a request.
+    Returns the number of rows moved; 0 if already migrated.
     """
     with conn.cursor() as cur:
-        # Base DDL (tables without the new column)
         cur.execute(_DDL_SQL)
-
-        # --- add/maintain the new parameters.category column & constraint ---
-        # 1) add the column if missing
-        cur.execute("""
+        _ensure_measurement_partitions(cur)
+        moved, deduped = _ensure_measurements_view(cur)
+    conn.commit()
+    _rebuild_derived(conn, deduped)
+    return moved
+
+
+# Recorded in public.schema_version by _apply_schema. The DDL strings are
+# hashed in; bump _SCHEMA_REVISION when DDL issued from code changes.
+_SCHEMA_REVISION = 1
+SCHEMA_FINGERPRINT = hashlib.sha1(
+    f"{_SCHEMA_REVISION}|{MEASUREMENT_PARTITIONS}|{_DDL_SQL}|{_MEASUREMENTS_VIEW_SQL}".encode("utf-8")
+).hexdigest()[:16]
+
+
+def _schema_current(cur) -> bool:
+    cur.execute("SELECT to_regclass('public.schema_version') IS NOT NULL")
+    if not cur.fetchone()[0]:
+        return False
+    cur.execute("SELECT fingerprint FROM public.schema_version")
+    row = cur.fetchone()
+    return bool(row) and row[0] == SCHEMA_FINGERPRINT
+
+
+def _apply_schema(cur) -> List[str]:
+    """All DDL + fixed seeds; returns dataset ids deduplicated by a legacy migration."""
+    # Base DDL (tables without the new column)
+    cur.execute(_DDL_SQL)
+    _ensure_measurement_partitions(cur)
+    _, deduped = _ensure_measurements_view(cur)
+
+    # --- add/maintain the new parameters.category column & constraint ---
+    # 1) add the column if missing
+    cur.execute("""
+      ALTER TABLE public.parameters
+      ADD COLUMN IF NOT EXISTS category text
+    """)
+
+    # 2) backfill any NULLs to 'unknown'
+    cur.execute("""
+      UPDATE public.parameters
+      SET category = COALESCE(category, 'unknown')
+      WHERE category IS NULL
+    """)
+
+    # 3) set default + not null
+    cur.execute("""
+      ALTER TABLE public.parameters
+      ALTER COLUMN category SET DEFAULT 'unknown'
+    """)
+    cur.execute("""
+      ALTER TABLE public.parameters
+      ALTER COLUMN category SET NOT NULL
+    """)
+
+    # 4) add CHECK constraint once
+    cur.execute("""
+      DO $$
+      BEGIN
+        IF NOT EXISTS (
+          SELECT 1 FROM pg_constraint
+          WHERE conname = 'parameters_category_check'
+            AND conrelid = 'public.parameters'::regclass
+        ) THEN
           ALTER TABLE public.parameters
-          ADD COLUMN IF NOT EXISTS category text
-        """)
+            ADD CONSTRAINT parameters_category_check
+            CHECK (category IN ('physical','chemical','bio','unknown'));
+        END IF;
+      END$$;
+    """)
+
+    # --- seed quality_flags (existing behavior) ---
+    for code, qid in QUALITY_FLAGS.items():
+        label = {
+            "ok": "OK",
+            "out_of_range": "Out of range",
+            "missing": "Missing",
+            "outlier": "Outlier",
+        }[code]
+        desc = {
+            "ok": "Value present and within range",
+            "out_of_range": "Present but outside expected range",
+            "missing": "Value missing or non-numeric",
+            "outlier": "Statistical outlier",
+        }[code]
+        cur.execute(
+            """
+            INSERT INTO public.quality_flags (quality_flag_id, code, label, description)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (quality_flag_id) DO UPDATE
+            SET code = EXCLUDED.code,
+                label = EXCLUDED.label,
+                description = EXCLUDED.description
+            """,
+            (qid, code, label, desc),
+        )
 
-        # 2) backfill any NULLs to 'unknown'
-        cur.execute("""
-          UPDATE public.parameters
-          SET category = COALESCE(category, 'unknown')
-          WHERE category IS NULL
-        """)
+    cur.execute(
+        """
+        INSERT INTO public.schema_version (singleton, fingerprint) VALUES (TRUE, %s)
+        ON CONFLICT (singleton) DO UPDATE SET fingerprint = EXCLUDED.fingerprint, applied_at = now()
+        """,
+        (SCHEMA_FINGERPRINT,),
+    )
+    return deduped
 
-        # 3) set default + not null
-        cur.execute("""
-          ALTER TABLE public.parameters
-          ALTER COLUMN category SET DEFAULT 'unknown'
-        """)
-        cur.execute("""
-          ALTER TABLE public.parameters
-          ALTER COLUMN category SET NOT NULL
-        """)
 
-        # 4) add CHECK constraint once
-        cur.execute("""
-          DO $$
-          BEGIN
-            IF NOT EXISTS (
-              SELECT 1 FROM pg_constraint
-              WHERE conname = 'parameters_category_check'
-                AND conrelid = 'public.parameters'::regclass
-            ) THEN
-              ALTER TABLE public.parameters
-                ADD CONSTRAINT parameters_category_check
-                CHECK (category IN ('physical','chemical','bio','unknown'));
-            END IF;
-          END$$;
-        """)
-
-        # --- seed quality_flags (existing behavior) ---
-        for code, qid in QUALITY_FLAGS.items():
-            label = {
-                "ok": "OK",
-                "out_of_range": "Out of range",
-                "missing": "Missing",
-                "outlier": "Outlier",
-            }[code]
-            desc = {
-                "ok": "Value present and within range",
-                "out_of_range": "Present but outside expected range",
-                "missing": "Value missing or non-numeric",
-                "outlier": "Statistical outlier",
-            }[code]
-            cur.execute(
-                """
-                INSERT INTO public.quality_flags (quality_flag_id, code, label, description)
-                VALUES (%s, %s, %s, %s)
-                ON CONFLICT (quality_flag_id) DO UPDATE
-                SET code = EXCLUDED.code,
-                    label = EXCLUDED.label,
-                    description = EXCLUDED.description
-                """,
-                (qid, code, label, desc),
-            )
+def ensure_schema(conn, seed_all: bool = False) -> None:
+    """
+    Creates tables + indexes. Optionally seeds full vocab.
+    Re-runnable / idempotent. When public.schema_version already holds this
+    code's SCHEMA_FINGERPRINT the DDL is skipped: ALTER TABLE / CREATE OR
+    REPLACE VIEW take ACCESS EXCLUSIVE locks even when they change nothing,
+    and would queue behind (and in front of) every in-flight insert or read.
+    """
+    deduped: List[str] = []
+    with conn.cursor() as cur:
+        if not _schema_current(cur):
+            # one migrator at a time; the others wait here, then find it done
+            cur.execute("SELECT pg_advisory_xact_lock(hashtext('ewai.ensure_schema'))")
+            if not _schema_current(cur):
+                deduped = _apply_schema(cur)
 
         # --- optional eager parameter/meta seeding (now includes category) ---
         if seed_all:
@@ -426,11 +845,18 @@ def ensure_schema(conn, seed_all: bool = False) -> None:
                     (code,),
                 )
     conn.commit()
-def _compute_quality_flags_df(long_df: pd.DataFrame) -> pd.Series:
+    _rebuild_derived(conn, deduped)
+
+
+def _compute_quality_flags_df(
+    long_df: pd.DataFrame,
+    quartiles: Optional[Dict[str, Tuple[float, float]]] = None,
+) -> pd.Series:
     """
     Returns a Series of quality_flag codes aligned with long_df index.
     Priority: missing > out_of_range > outlier > ok.
-    Outliers computed per parameter_code within the given long_df (Tukey 3*IQR).
+    Outliers computed per parameter_code (Tukey 3*IQR), from `quartiles`
+    (q1, q3) when given for that parameter, else within the given long_df.
     """
     out = pd.Series(index=long_df.index, dtype="object")
 
@@ -451,10 +877,13 @@ def _compute_quality_flags_df(long_df: pd.DataFrame) -> pd.Series:
     rem = out.isna() & (~missing_mask)
     for pcode, grp in long_df.loc[rem].groupby("parameter_code"):
         v = grp["value"].astype(float)
-        if v.size < 5:
+        if quartiles and pcode in quartiles:
+            q1, q3 = quartiles[pcode]
+        elif v.size < 5:
             continue  # too few to score outliers
-        q1 = v.quantile(0.25)
-        q3 = v.quantile(0.75)
+        else:
+            q1 = v.quantile(0.25)
+            q3 = v.quantile(0.75)
         iqr = q3 - q1
         if pd.isna(iqr) or iqr == 0:
             continue
@@ -467,6 +896,75 @@ def _compute_quality_flags_df(long_df: pd.DataFrame) -> pd.Series:
     out.fillna("ok", inplace=True)
     return out
 
+# --- Seasonal baseline scoring (public.climatology_baselines) ---
+BASELINE_MIN_N = 8          # history needed before a (point, parameter, month) slot is trusted
+BASELINE_FENCE = 3.0        # Tukey far-out fences: q1 - 3*IQR .. q3 + 3*IQR
+BASELINE_MIN_SCALE = 0.05   # IQR floor as a fraction of |median| (repeated detection-limit values)
+
+_BASELINE_KEY = ["sampling_point_id", "parameter_id", "month"]
+
+
+def _baseline_scorable(rows: pd.DataFrame) -> pd.Series:
+    # missing / out-of-range rows are neither re-scored nor merged into baselines
+    return (
+        rows["quality_flag_id"].isin([QUALITY_FLAGS["ok"], QUALITY_FLAGS["outlier"]])
+        & rows["ts"].notna() & rows["value"].notna()
+    )
+
+
+def _load_baselines(cur, client_id: str, parameter_ids: List[int]) -> pd.DataFrame:
+    """Trusted slots with their fences: columns _BASELINE_KEY + lo, hi."""
+    cur.execute(
+        """
+        SELECT sampling_point_id, parameter_id, month, digest
+        FROM public.climatology_baselines
+        WHERE client_id = %s AND parameter_id = ANY(%s) AND n >= %s AND digest IS NOT NULL
+        """,
+        (client_id, parameter_ids, BASELINE_MIN_N),
+    )
+    out = []
+    for sp, pid, month, raw in cur.fetchall():
+        q1, med, q3 = TDigest.from_bytes(raw).quantile([0.25, 0.5, 0.75])
+        scale = max(q3 - q1, BASELINE_MIN_SCALE * abs(med))
+        if scale > 0:  # all-zero history: nothing to measure spread against
+            out.append((sp, pid, month, q1 - BASELINE_FENCE * scale, q3 + BASELINE_FENCE * scale))
+    b = pd.DataFrame(out, columns=_BASELINE_KEY + ["lo", "hi"])
+    b["sampling_point_id"] = _point_key(b["sampling_point_id"].astype(object))
+    return b
+
+
+def _score_against_baselines(cur, client_id: str, rows: pd.DataFrame) -> pd.Series:
+    """
+    Seasonal outlier flags for `rows` (sampling_point_id, parameter_id, ts,
+    value, quality_flag_id). Rows whose slot has a trusted baseline get
+    ok/outlier from its median/IQR fences; everything else keeps its in-file
+    flag. Missing / out-of-range rows are never re-scored.
+    """
+    qid = rows["quality_flag_id"].copy()
+    scorable = _baseline_scorable(rows)
+    if not scorable.any():
+        return qid
+    sub = rows.loc[scorable]
+    key = pd.DataFrame({
+        "sampling_point_id": _point_key(sub["sampling_point_id"].astype(object)),
+        "parameter_id": sub["parameter_id"].astype(int),
+        "month": pd.to_datetime(sub["ts"], utc=True).dt.month,
+    }, index=sub.index)
+    base = _load_baselines(cur, client_id, sorted(key["parameter_id"].unique().tolist()))
+    if base.empty:
+        return qid
+    # vectorized lookup: position of each row's slot in `base`, -1 if untrusted
+    pos = pd.MultiIndex.from_frame(base[_BASELINE_KEY]).get_indexer(pd.MultiIndex.from_frame(key))
+    hit = pos >= 0
+    if not hit.any():
+        return qid
+    b = base.iloc[pos[hit]]
+    v = sub["value"].to_numpy(float)[hit]
+    outlier = (v < b["lo"].to_numpy()) | (v > b["hi"].to_numpy())
+    qid.loc[sub.index[hit]] = np.where(outlier, QUALITY_FLAGS["outlier"], QUALITY_FLAGS["ok"])
+    return qid
+
+
 def upsert_parameters_for_codes(conn, codes: Iterable[str]) -> None:
     """
     Lazily upsert only the parameter codes used by this ingest.
@@ -628,16 +1126,49 @@ def upsert_sampling_points(conn, client_id: str, waterbody_id: Optional[str], df
                   lat = COALESCE(EXCLUDED.lat, public.sampling_points.lat),
                   lon = COALESCE(EXCLUDED.lon, public.sampling_points.lon),
                   depth_m = COALESCE(EXCLUDED.depth_m, public.sampling_points.depth_m)
-                RETURNING sampling_point_id
+                RETURNING sampling_point_id, lat, lon, geohash
                 """,
                 (client_id, waterbody_id, code, name, lat, lon, depth_m),
             )
-            sp_id = cur.fetchone()[0]
+            sp_id, final_lat, final_lon, old_hash = cur.fetchone()
+            # coordinates may come from the existing row; hash what was kept
+            new_hash = geohash_encode(final_lat, final_lon)
+            if new_hash != old_hash:
+                cur.execute(
+                    "UPDATE public.sampling_points SET geohash = %s WHERE sampling_point_id = %s",
+                    (new_hash, sp_id),
+                )
             mapping[code] = sp_id
+        if mapping:
+            _bump_point_version(cur, client_id)
     conn.commit()
     return mapping
 
 
+def backfill_geohashes(conn, client_id: Optional[str] = None) -> int:
+    """
+    Fill public.sampling_points.geohash for points whose hash is missing or
+    stale (e.g. created before the column existed). Returns rows updated.
+    """
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT sampling_point_id, lat, lon, geohash FROM public.sampling_points"
+            + (" WHERE client_id = %s" if client_id else ""),
+            (client_id,) if client_id else None,
+        )
+        updates = [
+            (h, sp_id) for sp_id, lat, lon, old in cur.fetchall()
+            if (h := geohash_encode(lat, lon)) != old
+        ]
+        if updates:
+            pgx.execute_batch(
+                cur, "UPDATE public.sampling_points SET geohash = %s WHERE sampling_point_id = %s",
+                updates, page_size=1000,
+            )
+    conn.commit()
+    return len(updates)
+
+
 def register_dataset(
     conn,
     client_id: str,
@@ -681,6 +1212,70 @@ def register_dataset(
     return dataset_id
 
 
+def bump_data_version(conn, dataset_id: str) -> int:
+    """
+    Increment the data version of a dataset (creating it at 1) and return it.
+    Call after any change to the dataset's measurements, including deletion.
+    """
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            INSERT INTO public.dataset_versions (dataset_id, version, updated_at)
+            VALUES (%s, 1, now())
+            ON CONFLICT (dataset_id) DO UPDATE
+            SET version = public.dataset_versions.version + 1,
+                updated_at = now()
+            RETURNING version
+            """,
+            (dataset_id,),
+        )
+        version = cur.fetchone()[0]
+    conn.commit()
+    return int(version)
+
+
+def get_data_version(conn, dataset_id: str) -> Optional[Tuple[int, object]]:
+    """
+    Returns (version, last_modified) for an existing dataset, or None if the
+    dataset does not exist. Datasets that were never bumped report version 0
+    and their upload time.
+    """
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT COALESCE(v.version, 0), COALESCE(v.updated_at, d.uploaded_at)
+            FROM public.datasets d
+            LEFT JOIN public.dataset_versions v ON v.dataset_id = d.dataset_id
+            WHERE d.dataset_id = %s
+            """,
+            (dataset_id,),
+        )
+        row = cur.fetchone()
+    return (int(row[0]), row[1]) if row else None
+
+
+def _bump_point_version(cur, client_id: str) -> None:
+    # same transaction as the point upserts it versions
+    cur.execute(
+        """
+        INSERT INTO public.point_versions (client_id, version, updated_at)
+        VALUES (%s, 1, now())
+        ON CONFLICT (client_id) DO UPDATE
+        SET version = public.point_versions.version + 1,
+            updated_at = now()
+        """,
+        (client_id,),
+    )
+
+
+def get_point_version(conn, client_id: str) -> Tuple[int, object]:
+    """(version, last_modified) of a client's sampling points; (0, None) before the first upsert."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT version, updated_at FROM public.point_versions WHERE client_id = %s", (client_id,))
+        row = cur.fetchone()
+    return (int(row[0]), row[1]) if row else (0, None)
+
+
 # ---------- melt (wide -> long) ----------
 
 _UNIT_IN_BRACKETS = re.compile(r"^(?P<param>[^\[]+?)\s*\[(?P<unit>[^\]]+)\]\s*$", re.UNICODE)
@@ -755,30 +1350,567 @@ def melt_harmonized(df_h: pd.DataFrame) -> pd.DataFrame:
     return long_df[["ts","sampling_point","parameter_code","unit","value","source_column"]]
 
 
-def insert_measurements(conn, client_id: str, dataset_id: str, long_df: pd.DataFrame, sp_map: dict) -> dict:
-    if not isinstance(long_df, pd.DataFrame) or long_df.empty:
-        return {"rows_in": 0, "rows_inserted": 0, "rows_skipped": 0}
+# ---------- derived tables maintained at ingest ----------
 
-    required = ["parameter_code", "value", "source_column"]
-    for c in required:
-        if c not in long_df.columns:
-            raise ValueError(f"long_df missing required column: {c}")
+_INSERTED_COLS = ["sampling_point_id", "parameter_id", "quality_flag_id", "ts", "value"]
 
-    # derive quality flags for this long_df (uses value; marks NaNs as 'missing')
-    flags_series = _compute_quality_flags_df(long_df)
-    long_df = long_df.copy()
-    long_df["quality_flag_code"] = flags_series
 
-    # parameter_id map
-    param_codes = sorted(set(str(c).strip().lower() for c in long_df["parameter_code"].unique()))
-    with conn.cursor(cursor_factory=pgx.DictCursor) as cur:
-        cur.execute("SELECT parameter_id, code FROM public.parameters WHERE code = ANY(%s)", (param_codes,))
-        rows = cur.fetchall()
-    code_to_pid = {r["code"]: r["parameter_id"] for r in rows}
+def _lookup_ids(cur, table: str, id_col: str, key_col: str, keys: Iterable, create: bool = True,
+                key_type: str = "text") -> dict:
+    """
+    {key: id} for the distinct non-NULL keys, inserting missing dictionary
+    entries when create. key_type is key_col's SQL type: the parameter is cast
+    to it (not the column to text) so the lookup uses key_col's index.
+    Only keys the SELECT did not find are inserted: INSERT ... ON CONFLICT
+    draws an identity value even for a row that conflicts, so inserting known
+    keys on every ingest would run the id sequence out.
+    """
+    uniq = sorted({str(k) for k in keys if k is not None})
+    if not uniq:
+        return {}
+    sql = f"SELECT {key_col}::text, {id_col} FROM {table} WHERE {key_col} = ANY(%s::{key_type}[])"
+    cur.execute(sql, (uniq,))
+    found = dict(cur.fetchall())
+    missing = [k for k in uniq if k not in found]
+    if create and missing:
+        # ON CONFLICT still covers a concurrent ingest adding the same key
+        pgx.execute_values(
+            cur, f"INSERT INTO {table} ({key_col}) VALUES %s ON CONFLICT ({key_col}) DO NOTHING",
+            [(k,) for k in missing],
+        )
+        cur.execute(sql, (missing,))
+        found.update(cur.fetchall())
+    return found
+
+
+# ---------- row keys ----------
+
+_KEY_SEED = np.uint64(0x9E3779B97F4A7C15)
+_KEY_NULL = np.uint64(0x6A09E667F3BCC908)  # stands in for any NULL component
+
+
+def _mix64(x: np.ndarray) -> np.ndarray:
+    # splitmix64 finalizer; uint64 arithmetic wraps
+    x = x ^ (x >> np.uint64(30))
+    x = x * np.uint64(0xBF58476D1CE4E5B9)
+    x = x ^ (x >> np.uint64(27))
+    x = x * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def _hash_texts(values) -> np.ndarray:
+    """Stable 64-bit hash per value (blake2b of the distinct strings); NULL -> _KEY_NULL."""
+    codes, uniques = pd.factorize(pd.Series(list(values), dtype=object).map(
+        lambda v: None if v is None or (isinstance(v, float) and np.isnan(v)) else str(v)
+    ))
+    table = np.array(
+        [int.from_bytes(hashlib.blake2b(u.encode("utf-8"), digest_size=8).digest(), "little") for u in uniques]
+        + [int(_KEY_NULL)],
+        dtype=np.uint64,
+    )
+    return table[codes]  # code -1 (NULL) picks the trailing _KEY_NULL
+
+
+def _row_keys(points, parameter_ids, ts, sources, values) -> np.ndarray:
+    """
+    BIGINT dedup keys for measurement rows from their normalized natural key:
+    sampling point UUID, parameter id, ts (UTC, rounded to microseconds like
+    timestamptz) and source column. Unique per dataset (dataset_key, row_key).
+
+    Rows without a timestamp have nothing else telling readings apart, so
+    their key also covers the value and its occurrence number among equal
+    (point, parameter, source, value) rows of the batch: re-persisting the
+    same file is skipped, while distinct readings of one file are all kept.
+    """
+    t = pd.to_datetime(pd.Series(list(ts), dtype=object), utc=True, errors="coerce").dt.round("us")
+    t_us = t.dt.tz_localize(None).to_numpy(dtype="datetime64[us]").view(np.int64).view(np.uint64)
+    no_ts = t.isna().to_numpy()
+    parts = [
+        _hash_texts(points),
+        _mix64(np.asarray(parameter_ids, dtype=np.int64).view(np.uint64)),
+        np.where(no_ts, _KEY_NULL, _mix64(t_us)),
+        _hash_texts(sources),
+    ]
+    h = np.full(len(t), _KEY_SEED, dtype=np.uint64)
+    for part in parts:
+        h = _mix64(h ^ part) * np.uint64(0x100000001B3)
+    if no_ts.any():
+        v = pd.to_numeric(pd.Series(list(values), dtype=object), errors="coerce").to_numpy(dtype=np.float64)
+        v_bits = np.where(np.isnan(v), _KEY_NULL, _mix64(v.view(np.uint64)))
+        nth = pd.Series(h).groupby([h, v_bits]).cumcount().to_numpy().astype(np.uint64)
+        extra = _mix64(v_bits ^ _mix64(nth + _KEY_SEED))
+        h = np.where(no_ts, _mix64(h ^ extra) * np.uint64(0x100000001B3), h)
+    return _mix64(h).view(np.int64)
+
+
+def _key_rows(cur, dataset_keys: Optional[List[int]] = None) -> List[str]:
+    """
+    Fill NULL row_keys (all datasets, or the given dataset_keys), deleting
+    rows whose key is already taken. Returns the dataset ids that lost rows;
+    their derived tables need rebuilding (_rebuild_derived).
+    """
+    if dataset_keys is None:
+        cur.execute("SELECT DISTINCT dataset_key FROM public.measurement_rows WHERE row_key IS NULL")
+        dataset_keys = [r[0] for r in cur.fetchall()]
+    affected = []
+    for dk in dataset_keys:
+        # rows already keyed go first so they win over the ones being keyed
+        cur.execute("""
+            SELECT m.measurement_id, m.row_key, sp.sampling_point_id::text, m.parameter_id, m.ts,
+                   s.source_column, m.value
+            FROM public.measurement_rows m
+            LEFT JOIN public.sampling_points sp ON sp.point_key = m.point_key
+            LEFT JOIN public.source_columns s ON s.source_id = m.source_id
+            WHERE m.dataset_key = %s
+            ORDER BY m.row_key IS NULL, m.measurement_id
+        """, (dk,))
+        rows = pd.DataFrame(cur.fetchall(), columns=["mid", "key", "sp", "pid", "ts", "src", "value"])
+        todo = rows["key"].isna().to_numpy()
+        if not todo.any():
+            continue
+        keys = rows["key"].to_numpy(dtype=object)
+        sub = rows.loc[todo]
+        keys[todo] = _row_keys(sub["sp"], sub["pid"], sub["ts"], sub["src"], sub["value"])
+        dup = pd.Series(keys).duplicated().to_numpy()
+        if dup.any():
+            cur.execute("DELETE FROM public.measurement_rows WHERE dataset_key = %s AND measurement_id = ANY(%s)",
+                        (dk, [int(x) for x in rows.loc[dup, "mid"]]))
+            cur.execute("SELECT dataset_id::text FROM public.datasets WHERE dataset_key = %s", (dk,))
+            affected.append(cur.fetchone()[0])
+        keep = todo & ~dup
+        pgx.execute_values(cur, f"""
+            UPDATE public.measurement_rows m SET row_key = v.key
+            FROM (VALUES %s) AS v(mid, key)
+            WHERE m.dataset_key = {int(dk)} AND m.measurement_id = v.mid
+        """, [(int(m), int(k)) for m, k in zip(rows.loc[keep, "mid"], keys[keep])], page_size=10000)
+    return affected
+
+
+def _rebuild_derived(conn, dataset_ids: Iterable[str]) -> None:
+    """Recompute every derived table of datasets whose rows were removed outside ingest."""
+    dataset_ids = list(dataset_ids)
+    if not dataset_ids:
+        return
+    for ds in dataset_ids:
+        rebuild_flag_counts(conn, ds)
+        rebuild_daily_rollup(conn, ds)
+        rebuild_latest(conn, ds)
+        rebuild_sketches(conn, ds)
+        bump_data_version(conn, ds)
+    with conn.cursor() as cur:
+        cur.execute("SELECT DISTINCT client_id::text FROM public.datasets WHERE dataset_id = ANY(%s::uuid[])",
+                    (dataset_ids,))
+        clients = [r[0] for r in cur.fetchall()]
+    for client_id in clients:
+        rebuild_baselines(conn, client_id)
+
+
+def backfill_row_keys(conn) -> Tuple[int, List[str]]:
+    """
+    Key rows stored before row_key existed, dropping the duplicates the old
+    NULL-blind UNIQUE let through and rebuilding those datasets' derived
+    tables. Returns (rows still unkeyed before, dataset ids deduplicated).
+    """
+    with conn.cursor() as cur:
+        cur.execute("SELECT COUNT(*) FROM public.measurement_rows WHERE row_key IS NULL")
+        pending = cur.fetchone()[0]
+        affected = _key_rows(cur)
+    conn.commit()
+    _rebuild_derived(conn, affected)
+    return pending, affected
+
 
-    qcode_to_id = QUALITY_FLAGS.copy()
+def _point_key(sp: pd.Series) -> pd.Series:
+    # NULL points are grouped under the nil UUID (mirrors the unique indexes)
+    return sp.where(sp.notna(), _NIL_UUID)
 
-    rows_in = 0
+
+def _point_or_none(sp: str) -> Optional[str]:
+    return None if sp == _NIL_UUID else sp
+
+
+def _bump_flag_counts(cur, dataset_id: str, ins: pd.DataFrame) -> None:
+    """
+    Add freshly inserted rows to public.dataset_flag_counts. Runs on the
+    caller's cursor so the counters commit (or roll back) together with the
+    measurements.
+    """
+    qid = ins["quality_flag_id"].fillna(QUALITY_FLAGS["ok"]).astype(int)
+    counts = qid.groupby([_point_key(ins["sampling_point_id"]), ins["parameter_id"], qid]).size()
+    pgx.execute_values(
+        cur,
+        f"""
+        INSERT INTO public.dataset_flag_counts
+          (dataset_id, sampling_point_id, parameter_id, quality_flag_id, n)
+        VALUES %s
+        ON CONFLICT (dataset_id, parameter_id, (COALESCE(sampling_point_id, '{_NIL_UUID}'::uuid)), quality_flag_id)
+        DO UPDATE SET n = public.dataset_flag_counts.n + EXCLUDED.n
+        """,
+        [(dataset_id, _point_or_none(sp), int(pid), int(q), int(n)) for (sp, pid, q), n in counts.items()],
+        page_size=1000,
+    )
+
+
+def _bump_daily_rollup(cur, dataset_id: str, ins: pd.DataFrame) -> None:
+    """
+    Merge freshly inserted values into public.measurement_daily (UTC days).
+    Rows without a timestamp or value do not contribute.
+    """
+    sub = ins.loc[ins["ts"].notna() & ins["value"].notna()]
+    if sub.empty:
+        return
+    v = sub["value"].astype(float)
+    day = pd.to_datetime(sub["ts"], utc=True).dt.date
+    grp = pd.DataFrame({"v": v, "v2": v * v}).groupby(
+        [_point_key(sub["sampling_point_id"]), sub["parameter_id"], day]
+    )
+    agg = pd.concat([grp["v"].agg(["count", "sum", "min", "max"]), grp["v2"].sum()], axis=1)
+    pgx.execute_values(
+        cur,
+        f"""
+        INSERT INTO public.measurement_daily
+          (dataset_id, sampling_point_id, parameter_id, day, n, vsum, vsum_sq, vmin, vmax)
+        VALUES %s
+        ON CONFLICT (dataset_id, parameter_id, (COALESCE(sampling_point_id, '{_NIL_UUID}'::uuid)), day)
+        DO UPDATE SET n       = public.measurement_daily.n + EXCLUDED.n,
+                      vsum    = public.measurement_daily.vsum + EXCLUDED.vsum,
+                      vsum_sq = public.measurement_daily.vsum_sq + EXCLUDED.vsum_sq,
+                      vmin    = LEAST(public.measurement_daily.vmin, EXCLUDED.vmin),
+                      vmax    = GREATEST(public.measurement_daily.vmax, EXCLUDED.vmax)
+        """,
+        [
+            (dataset_id, _point_or_none(sp), int(pid), d, int(r["count"]),
+             float(r["sum"]), float(r["v2"]), float(r["min"]), float(r["max"]))
+            for (sp, pid, d), r in agg.iterrows()
+        ],
+        page_size=1000,
+    )
+
+
+def _bump_latest(cur, dataset_id: str, ins: pd.DataFrame) -> None:
+    """
+    Advance public.latest_measurement with the newest freshly inserted value
+    per (point, parameter); an older incoming row never replaces a newer one.
+    """
+    sub = ins.loc[ins["ts"].notna() & ins["value"].notna()]
+    if sub.empty:
+        return
+    sub = sub.assign(point=_point_key(sub["sampling_point_id"]), utc=pd.to_datetime(sub["ts"], utc=True))
+    newest = sub.loc[sub.groupby(["point", "parameter_id"])["utc"].idxmax()]
+    pgx.execute_values(
+        cur,
+        f"""
+        INSERT INTO public.latest_measurement
+          (dataset_id, sampling_point_id, parameter_id, ts, value, quality_flag_id)
+        VALUES %s
+        ON CONFLICT (dataset_id, parameter_id, (COALESCE(sampling_point_id, '{_NIL_UUID}'::uuid)))
+        DO UPDATE SET ts = EXCLUDED.ts,
+                      value = EXCLUDED.value,
+                      quality_flag_id = EXCLUDED.quality_flag_id
+        WHERE EXCLUDED.ts >= public.latest_measurement.ts
+        """,
+        [
+            (dataset_id, _point_or_none(r.point), int(r.parameter_id), r.ts, float(r.value),
+             None if pd.isna(r.quality_flag_id) else int(r.quality_flag_id))
+            for r in newest.itertuples(index=False)
+        ],
+        page_size=1000,
+    )
+
+
+def _baseline_groups(rows: pd.DataFrame):
+    """(point key, parameter_id, UTC month) -> values of the rows baselines take in."""
+    sub = rows.loc[_baseline_scorable(rows)]
+    if sub.empty:
+        return {}
+    grp = sub["value"].astype(float).groupby([
+        _point_key(sub["sampling_point_id"]),
+        sub["parameter_id"].astype(int),
+        pd.to_datetime(sub["ts"], utc=True).dt.month,
+    ])
+    return {k: g.to_numpy() for k, g in grp}
+
+
+def _write_baselines(cur, client_id: str, digests: Dict[Tuple[str, int, int], TDigest]) -> None:
+    pgx.execute_values(
+        cur,
+        f"""
+        INSERT INTO public.climatology_baselines
+          (client_id, sampling_point_id, parameter_id, month, n, digest)
+        VALUES %s
+        ON CONFLICT (client_id, parameter_id, (COALESCE(sampling_point_id, '{_NIL_UUID}'::uuid)), month)
+        DO UPDATE SET n = EXCLUDED.n, digest = EXCLUDED.digest, updated_at = now()
+        """,
+        [
+            (client_id, _point_or_none(sp), int(pid), int(month), int(round(d.count)),
+             psycopg2.Binary(d.to_bytes()))
+            for (sp, pid, month), d in digests.items()
+        ],
+        page_size=500,
+    )
+
+
+def _bump_baselines(cur, client_id: str, ins: pd.DataFrame) -> None:
+    """
+    Merge freshly inserted rows into public.climatology_baselines. Rows
+    flagged outlier go in too: the median/IQR barely move for a single spike,
+    while a lasting level shift becomes the new normal instead of being
+    flagged forever. The per-client advisory lock serialises the
+    read-merge-write against concurrent persists of the same client.
+    """
+    groups = _baseline_groups(ins)
+    if not groups:
+        return
+    cur.execute("SELECT pg_advisory_xact_lock(hashtext('climatology_baselines'), hashtext(%s))", (client_id,))
+    cur.execute(
+        """
+        SELECT sampling_point_id, parameter_id, month, digest
+        FROM public.climatology_baselines
+        WHERE client_id = %s AND parameter_id = ANY(%s)
+        """,
+        (client_id, sorted({int(k[1]) for k in groups})),
+    )
+    stored = {
+        (sp if sp is not None else _NIL_UUID, int(pid), int(m)): TDigest.from_bytes(raw)
+        for sp, pid, m, raw in cur.fetchall()
+    }
+    merged = {}
+    for key, vals in groups.items():
+        d = TDigest.from_values(vals)
+        merged[key] = stored[key].merge(d) if key in stored else d
+    _write_baselines(cur, client_id, merged)
+
+
+def _sketch_groups(rows: pd.DataFrame):
+    """(point key, parameter_id, month) -> values; month 0 = all rows, 1..12 = UTC month."""
+    sub = rows.loc[rows["value"].notna()]
+    if sub.empty:
+        return {}
+    base = pd.DataFrame({
+        "point": _point_key(sub["sampling_point_id"]),
+        "parameter_id": sub["parameter_id"].astype(int),
+        "month": 0,
+        "value": sub["value"].astype(float),
+    })
+    ts = pd.to_datetime(sub["ts"], utc=True)
+    monthly = base.loc[ts.notna().to_numpy()].assign(month=ts.dropna().dt.month.to_numpy())
+    both = pd.concat([base, monthly], ignore_index=True)
+    return {k: g.to_numpy() for k, g in both.groupby(["point", "parameter_id", "month"])["value"]}
+
+
+def _write_sketches(cur, dataset_id: str, digests: Dict[Tuple[str, int, int], TDigest]) -> None:
+    pgx.execute_values(
+        cur,
+        f"""
+        INSERT INTO public.quantile_sketches
+          (dataset_id, sampling_point_id, parameter_id, month, n, digest)
+        VALUES %s
+        ON CONFLICT (dataset_id, parameter_id, (COALESCE(sampling_point_id, '{_NIL_UUID}'::uuid)), month)
+        DO UPDATE SET n = EXCLUDED.n, digest = EXCLUDED.digest
+        """,
+        [
+            (dataset_id, _point_or_none(sp), int(pid), int(month), int(round(d.count)), psycopg2.Binary(d.to_bytes()))
+            for (sp, pid, month), d in digests.items()
+        ],
+        page_size=500,
+    )
+
+
+def load_sketches(cur, dataset_id: str, parameter_ids: Iterable[int], month: Optional[int] = None,
+                  for_update: bool = False) -> Dict[Tuple[str, int, int], TDigest]:
+    """Stored digests of a dataset keyed (point key, parameter_id, month)."""
+    cur.execute(
+        """
+        SELECT sampling_point_id, parameter_id, month, digest
+        FROM public.quantile_sketches
+        WHERE dataset_id = %s AND parameter_id = ANY(%s)
+        """ + ("AND month = %s" if month is not None else "") + (" FOR UPDATE" if for_update else ""),
+        (dataset_id, [int(p) for p in parameter_ids]) + ((month,) if month is not None else ()),
+    )
+    return {
+        (sp if sp is not None else _NIL_UUID, int(pid), int(m)): TDigest.from_bytes(raw)
+        for sp, pid, m, raw in cur.fetchall()
+    }
+
+
+def _bump_sketches(cur, dataset_id: str, ins: pd.DataFrame) -> None:
+    """Merge freshly inserted values into the dataset's quantile sketches."""
+    groups = _sketch_groups(ins)
+    if not groups:
+        return
+    stored = load_sketches(cur, dataset_id, {k[1] for k in groups}, for_update=True)
+    merged = {}
+    for key, vals in groups.items():
+        d = TDigest.from_values(vals)
+        merged[key] = stored[key].merge(d) if key in stored else d
+    _write_sketches(cur, dataset_id, merged)
+
+
+def _history_quartiles(cur, dataset_id: str, long_df: pd.DataFrame, code_to_pid: Dict[str, int]):
+    """
+    Per parameter (q1, q3) of the dataset's stored values plus this batch,
+    from the month-0 sketches; only parameters that already have history.
+    """
+    pids = {c: code_to_pid[c] for c in long_df["parameter_code"].unique() if c in code_to_pid}
+    if not pids:
+        return {}
+    stored = load_sketches(cur, dataset_id, pids.values(), month=0)
+    out: Dict[str, Tuple[float, float]] = {}
+    for code, pid in pids.items():
+        parts = [d for (_, p, _), d in stored.items() if p == pid]
+        if not parts:
+            continue
+        vals = long_df.loc[long_df["parameter_code"] == code, "value"].to_numpy(float)
+        d = TDigest.merge_all(parts + [TDigest.from_values(vals)])
+        if d.count >= 5:
+            q1, q3 = d.quantile([0.25, 0.75])
+            out[code] = (float(q1), float(q3))
+    return out
+
+
+def rebuild_sketches(conn, dataset_id: Optional[str] = None) -> int:
+    """
+    Recompute public.quantile_sketches from public.measurements, one dataset
+    at a time (one dataset or all). Returns the number of sketches written.
+    """
+    written = 0
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT dataset_id FROM public.datasets" + (" WHERE dataset_id = %s" if dataset_id else ""),
+            (dataset_id,) if dataset_id else None,
+        )
+        ids = [r[0] for r in cur.fetchall()]
+    for ds in ids:
+        with conn.cursor() as cur:
+            cur.execute("LOCK TABLE public.quantile_sketches IN SHARE ROW EXCLUSIVE MODE")
+            cur.execute("DELETE FROM public.quantile_sketches WHERE dataset_id = %s", (ds,))
+            cur.execute("""
+                SELECT sampling_point_id, parameter_id, ts, value
+                FROM public.measurements WHERE dataset_id = %s AND value IS NOT NULL
+            """, (ds,))
+            rows = pd.DataFrame(cur.fetchall(), columns=["sampling_point_id", "parameter_id", "ts", "value"])
+            groups = _sketch_groups(rows)
+            if groups:
+                _write_sketches(cur, ds, {k: TDigest.from_values(v) for k, v in groups.items()})
+            written += len(groups)
+        conn.commit()
+    return written
+
+
+def _rebuild_from_measurements(conn, table: str, insert_select: str, dataset_id: Optional[str]) -> int:
+    """
+    Replace the rows of a derived table with `insert_select` (an INSERT ...
+    SELECT over `public.measurements m` whose `{where}` placeholder becomes a
+    WHERE clause that further conditions can AND onto), for one
+    dataset or all of them. The table lock keeps concurrent ingests from
+    bumping it mid-rebuild; they continue once we commit.
+    """
+    with conn.cursor() as cur:
+        cur.execute(f"LOCK TABLE {table} IN SHARE ROW EXCLUSIVE MODE")
+        if dataset_id:
+            cur.execute(f"DELETE FROM {table} WHERE dataset_id = %s", (dataset_id,))
+            cur.execute(insert_select.format(where="WHERE m.dataset_id = %s"), (dataset_id,))
+        else:
+            cur.execute(f"DELETE FROM {table}")
+            cur.execute(insert_select.format(where="WHERE TRUE"))
+        written = cur.rowcount
+    conn.commit()
+    return written
+
+
+def rebuild_flag_counts(conn, dataset_id: Optional[str] = None) -> int:
+    """
+    Recompute public.dataset_flag_counts from public.measurements, for one
+    dataset or for all of them. Used to backfill datasets ingested before the
+    counters existed. Returns the number of counter rows written.
+    """
+    return _rebuild_from_measurements(conn, "public.dataset_flag_counts", f"""
+        INSERT INTO public.dataset_flag_counts
+          (dataset_id, sampling_point_id, parameter_id, quality_flag_id, n)
+        SELECT m.dataset_id, m.sampling_point_id, m.parameter_id,
+               COALESCE(m.quality_flag_id, {QUALITY_FLAGS["ok"]}), COUNT(*)
+        FROM public.measurements m
+        {{where}}
+        GROUP BY 1, 2, 3, 4
+    """, dataset_id)
+
+
+def rebuild_daily_rollup(conn, dataset_id: Optional[str] = None) -> int:
+    """
+    Recompute public.measurement_daily from public.measurements (one dataset
+    or all). Returns the number of (point, parameter, day) rows written.
+    """
+    return _rebuild_from_measurements(conn, "public.measurement_daily", """
+        INSERT INTO public.measurement_daily
+          (dataset_id, sampling_point_id, parameter_id, day, n, vsum, vsum_sq, vmin, vmax)
+        SELECT m.dataset_id, m.sampling_point_id, m.parameter_id,
+               (m.ts AT TIME ZONE 'UTC')::date,
+               COUNT(*), SUM(m.value), SUM(m.value * m.value), MIN(m.value), MAX(m.value)
+        FROM public.measurements m
+        {where} AND m.ts IS NOT NULL AND m.value IS NOT NULL
+        GROUP BY 1, 2, 3, 4
+    """, dataset_id)
+
+
+def rebuild_latest(conn, dataset_id: Optional[str] = None) -> int:
+    """
+    Recompute public.latest_measurement from public.measurements (one dataset
+    or all). Returns the number of (point, parameter) rows written.
+    """
+    return _rebuild_from_measurements(conn, "public.latest_measurement", """
+        INSERT INTO public.latest_measurement
+          (dataset_id, sampling_point_id, parameter_id, ts, value, quality_flag_id)
+        SELECT DISTINCT ON (m.dataset_id, m.sampling_point_id, m.parameter_id)
+               m.dataset_id, m.sampling_point_id, m.parameter_id, m.ts, m.value, m.quality_flag_id
+        FROM public.measurements m
+        {where} AND m.ts IS NOT NULL AND m.value IS NOT NULL
+        ORDER BY m.dataset_id, m.sampling_point_id, m.parameter_id, m.ts DESC, m.measurement_id DESC
+    """, dataset_id)
+
+
+def rebuild_baselines(conn, client_id: Optional[str] = None) -> int:
+    """
+    Recompute public.climatology_baselines from the ok/outlier-flagged rows
+    of every dataset, one client at a time (one client or all), e.g. after
+    deleting datasets whose rows were merged in. Returns the number of
+    (point, parameter, month) slots written.
+    """
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT DISTINCT client_id::text FROM public.datasets" + (" WHERE client_id = %s" if client_id else ""),
+            (client_id,) if client_id else None,
+        )
+        clients = [r[0] for r in cur.fetchall()]
+        if client_id and client_id not in clients:
+            clients.append(client_id)  # no datasets left: still clear its slots
+    written = 0
+    for cid in clients:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_xact_lock(hashtext('climatology_baselines'), hashtext(%s))", (cid,))
+            cur.execute("DELETE FROM public.climatology_baselines WHERE client_id = %s", (cid,))
+            cur.execute("""
+                SELECT m.sampling_point_id, m.parameter_id, m.quality_flag_id, m.ts, m.value
+                FROM public.measurements m
+                JOIN public.datasets d ON d.dataset_id = m.dataset_id
+                WHERE d.client_id = %s AND m.ts IS NOT NULL AND m.value IS NOT NULL
+            """, (cid,))
+            rows = pd.DataFrame(cur.fetchall(), columns=_INSERTED_COLS)
+            rows["quality_flag_id"] = rows["quality_flag_id"].fillna(QUALITY_FLAGS["ok"])
+            groups = _baseline_groups(rows)
+            if groups:
+                _write_baselines(cur, cid, {k: TDigest.from_values(v) for k, v in groups.items()})
+            written += len(groups)
+        conn.commit()
+    return written
+
+
+def _measurement_payload(long_df: pd.DataFrame, dataset_id: str, code_to_pid: Dict[str, int],
+                         sp_map: dict) -> List[tuple]:
+    """
+    Legacy-layout tuples (dataset_id, sampling_point_id, parameter_id, ts, value,
+    unit, value_qualifier, source_column, method, quality_flag_id) for the rows
+    of a flagged long_df whose parameter is known.
+    """
     payload = []
     for _, r in long_df.iterrows():
         pcode = str(r["parameter_code"]).strip().lower()
@@ -813,7 +1945,36 @@ def insert_measurements(conn, client_id: str, dataset_id: str, long_df: pd.DataF
         src  = _norm_str(r.get("source_column"))
 
         payload.append((dataset_id, sp_id, pid, ts, val, unit, None, src, 'harmonized', qid))
-        rows_in += 1
+    return payload
+
+
+def insert_measurements(conn, client_id: str, dataset_id: str, long_df: pd.DataFrame, sp_map: dict) -> dict:
+    if not isinstance(long_df, pd.DataFrame) or long_df.empty:
+        return {"rows_in": 0, "rows_inserted": 0, "rows_skipped": 0}
+
+    required = ["parameter_code", "value", "source_column"]
+    for c in required:
+        if c not in long_df.columns:
+            raise ValueError(f"long_df missing required column: {c}")
+
+    # parameter_id map
+    param_codes = sorted(set(str(c).strip().lower() for c in long_df["parameter_code"].unique()))
+    with conn.cursor(cursor_factory=pgx.DictCursor) as cur:
+        cur.execute("SELECT parameter_id, code FROM public.parameters WHERE code = ANY(%s)", (param_codes,))
+        rows = cur.fetchall()
+        code_to_pid = {r["code"]: r["parameter_id"] for r in rows}
+        # appends: IQR fences from the dataset's history, not just this file
+        quartiles = _history_quartiles(cur, dataset_id, long_df, code_to_pid)
+
+    # derive quality flags for this long_df (uses value; marks NaNs as 'missing')
+    with stage("flags", rows=len(long_df)):
+        flags_series = _compute_quality_flags_df(long_df, quartiles)
+    long_df = long_df.copy()
+    long_df["quality_flag_code"] = flags_series
+
+    with stage("payload", rows=len(long_df)):
+        payload = _measurement_payload(long_df, dataset_id, code_to_pid, sp_map)
+    rows_in = len(payload)
 
     if not payload:
         return {"rows_in": 0, "rows_inserted": 0, "rows_skipped": 0}
@@ -821,17 +1982,52 @@ def insert_measurements(conn, client_id: str, dataset_id: str, long_df: pd.DataF
     inserted = 0
     try:
         with conn.cursor() as cur:
+            # seasonal re-scoring against the client's history (in-file IQR stays as the fallback)
+            with stage("baseline_scoring", rows=len(payload)):
+                scored = _score_against_baselines(cur, client_id, pd.DataFrame(
+                    [(t[1], t[2], t[3], t[4], t[9]) for t in payload],
+                    columns=["sampling_point_id", "parameter_id", "ts", "value", "quality_flag_id"],
+                ))
+            payload = [t[:9] + (int(q),) for t, q in zip(payload, scored)]
+
+            # compact row layout: surrogate keys + dictionary ids instead of text/UUIDs
+            cur.execute("SELECT dataset_key FROM public.datasets WHERE dataset_id = %s", (dataset_id,))
+            dataset_key = cur.fetchone()[0]
+            point_keys = _lookup_ids(cur, "public.sampling_points", "point_key", "sampling_point_id",
+                                     [t[1] for t in payload], create=False, key_type="uuid")
+            unit_ids = _lookup_ids(cur, "public.units", "unit_id", "unit", [t[5] for t in payload])
+            source_ids = _lookup_ids(cur, "public.source_columns", "source_id", "source_column",
+                                     [t[7] for t in payload])
+            row_keys = _row_keys([t[1] for t in payload], [t[2] for t in payload],
+                                 [t[3] for t in payload], [t[7] for t in payload],
+                                 [t[4] for t in payload])
+            rows = [
+                (int(key), ts, val, dataset_key, point_keys.get(str(sp)) if sp else None, pid,
+                 source_ids.get(src), method, unit_ids.get(unit), qid, qual)
+                for key, (_, sp, pid, ts, val, unit, qual, src, method, qid) in zip(row_keys, payload)
+            ]
             sql = """
-                INSERT INTO public.measurements
-                  (dataset_id, sampling_point_id, parameter_id, ts, value, unit,
-                   value_qualifier, source_column, method, quality_flag_id)
+                INSERT INTO public.measurement_rows
+                  (row_key, ts, value, dataset_key, point_key, parameter_id, source_id, method,
+                   unit_id, quality_flag_id, value_qualifier)
                 VALUES %s
-                ON CONFLICT (dataset_id, sampling_point_id, parameter_id, ts, source_column)
+                ON CONFLICT (dataset_key, row_key)
                 DO NOTHING
-                RETURNING 1
+                RETURNING point_key, parameter_id, quality_flag_id, ts, value
             """
-            ret = pgx.execute_values(cur, sql, payload, fetch=True, page_size=10000)
-            inserted = len(ret) if ret else 0
+            with stage("insert", rows=len(rows)):
+                ret = pgx.execute_values(cur, sql, rows, fetch=True, page_size=10000)
+                inserted = len(ret) if ret else 0
+            if ret:
+                with stage("derived", rows=inserted):
+                    point_ids = {k: sp for sp, k in point_keys.items()}
+                    ret = [(point_ids.get(r[0]),) + tuple(r[1:]) for r in ret]
+                    ins = pd.DataFrame(ret, columns=_INSERTED_COLS)
+                    _bump_flag_counts(cur, dataset_id, ins)
+                    _bump_daily_rollup(cur, dataset_id, ins)
+                    _bump_latest(cur, dataset_id, ins)
+                    _bump_baselines(cur, client_id, ins)
+                    _bump_sketches(cur, dataset_id, ins)
         conn.commit()
     except Exception:
         conn.rollback()
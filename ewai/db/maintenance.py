@@ -0,0 +1,158 @@
+# ewai/db/maintenance.py
+"""
+Maintenance commands for the derived tables kept next to public.measurements.
+
+Usage (from the repo root):
+    python -m ewai.db.maintenance backfill-flag-counts [--dataset-id UUID]
+    python -m ewai.db.maintenance backfill-daily-rollup [--dataset-id UUID]
+    python -m ewai.db.maintenance backfill-latest [--dataset-id UUID]
+    python -m ewai.db.maintenance backfill-geohash [--client-id UUID]
+    python -m ewai.db.maintenance rebuild-baselines [--client-id UUID]
+    python -m ewai.db.maintenance backfill-sketches [--dataset-id UUID]
+    python -m ewai.db.maintenance compact-measurements
+    python -m ewai.db.maintenance backfill-row-keys
+    python -m ewai.db.maintenance check-pruning [--dataset-id UUID]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+from typing import Any, List, Optional, Set
+
+from ewai.db.db_conn import get_connection
+from ewai.db.db_util import (
+    ensure_schema, rebuild_flag_counts, rebuild_daily_rollup, rebuild_latest,
+    backfill_geohashes, rebuild_baselines, rebuild_sketches,
+    compact_measurements, backfill_row_keys, MEASUREMENT_PARTITIONS,
+)
+
+
+def _backfill_flag_counts(conn, args) -> str:
+    n = rebuild_flag_counts(conn, dataset_id=args.dataset_id)
+    return f"dataset_flag_counts: {n} counter rows written"
+
+
+def _backfill_daily_rollup(conn, args) -> str:
+    n = rebuild_daily_rollup(conn, dataset_id=args.dataset_id)
+    return f"measurement_daily: {n} rows written"
+
+
+def _backfill_latest(conn, args) -> str:
+    n = rebuild_latest(conn, dataset_id=args.dataset_id)
+    return f"latest_measurement: {n} rows written"
+
+
+def _backfill_geohash(conn, args) -> str:
+    n = backfill_geohashes(conn, client_id=args.client_id)
+    return f"sampling_points: {n} geohashes updated"
+
+
+def _rebuild_baselines(conn, args) -> str:
+    n = rebuild_baselines(conn, client_id=args.client_id)
+    return f"climatology_baselines: {n} slots written"
+
+
+def _backfill_sketches(conn, args) -> str:
+    n = rebuild_sketches(conn, dataset_id=args.dataset_id)
+    return f"quantile_sketches: {n} sketches written"
+
+
+def _compact_measurements(conn, args) -> str:
+    n = compact_measurements(conn)
+    return f"measurement_rows: {n} rows moved into {MEASUREMENT_PARTITIONS} hash partitions"
+
+
+def _backfill_row_keys(conn, args) -> str:
+    pending, deduped = backfill_row_keys(conn)
+    return (f"measurement_rows: {pending} rows keyed; duplicates removed from "
+            f"{len(deduped)} datasets (derived tables rebuilt)")
+
+
+def _scanned_relations(plan: Any) -> Set[str]:
+    """Relations an EXPLAIN ANALYZE plan actually scanned (pruned-at-runtime nodes never loop)."""
+    found: Set[str] = set()
+    if isinstance(plan, dict):
+        if "Relation Name" in plan and plan.get("Actual Loops", 1) > 0:
+            found.add(plan["Relation Name"])
+        for v in plan.values():
+            found |= _scanned_relations(v)
+    elif isinstance(plan, list):
+        for v in plan:
+            found |= _scanned_relations(v)
+    return found
+
+
+# dataset-scoped shapes the API issues; each must touch exactly one partition.
+# Readers resolve dataset_key in an initplan (pruned at run time), the
+# ON DELETE CASCADE from datasets passes it as a parameter.
+_DATASET_KEY = "(SELECT dataset_key FROM public.datasets WHERE dataset_id = %(dataset_id)s)"
+_PRUNING_QUERIES = {
+    "measurements": f"""SELECT m.ts, m.value FROM public.measurement_rows m
+                        WHERE m.dataset_key = {_DATASET_KEY} ORDER BY m.ts""",
+    "window": f"""SELECT COUNT(*) FROM public.measurement_rows m
+                  WHERE m.dataset_key = {_DATASET_KEY} AND m.ts >= now() - interval '1 year'""",
+    "delete": "DELETE FROM public.measurement_rows WHERE dataset_key = %(dataset_key)s",
+}
+
+
+def _check_pruning(conn, args) -> str:
+    with conn.cursor() as cur:
+        dataset_id = args.dataset_id
+        if not dataset_id:
+            cur.execute("SELECT dataset_id FROM public.datasets ORDER BY uploaded_at DESC LIMIT 1")
+            row = cur.fetchone()
+            if not row:
+                return "no datasets to check"
+            dataset_id = row[0]
+        cur.execute("SELECT dataset_key FROM public.datasets WHERE dataset_id = %s", (dataset_id,))
+        row = cur.fetchone()
+        if not row:
+            raise SystemExit(f"dataset {dataset_id} not found")
+        args_sql = {"dataset_id": dataset_id, "dataset_key": row[0]}
+        lines, failed = [], False
+        for name, sql in _PRUNING_QUERIES.items():
+            # ANALYZE so run-time pruning shows; everything is rolled back below
+            cur.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + sql, args_sql)
+            plan = cur.fetchone()[0]
+            plan = json.loads(plan) if isinstance(plan, str) else plan
+            parts = sorted(r for r in _scanned_relations(plan) if r.startswith("measurement_rows_p"))
+            ok = len(parts) == 1
+            failed |= not ok
+            lines.append(f"{'ok  ' if ok else 'FAIL'} {name}: {', '.join(parts) or 'no partition'}")
+    conn.rollback()
+    report = "\n".join(lines)
+    if failed:
+        raise SystemExit(report)
+    return report
+
+
+COMMANDS = {
+    "backfill-flag-counts": _backfill_flag_counts,
+    "backfill-daily-rollup": _backfill_daily_rollup,
+    "backfill-latest": _backfill_latest,
+    "backfill-geohash": _backfill_geohash,
+    "rebuild-baselines": _rebuild_baselines,
+    "backfill-sketches": _backfill_sketches,
+    "compact-measurements": _compact_measurements,
+    "backfill-row-keys": _backfill_row_keys,
+    "check-pruning": _check_pruning,
+}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m ewai.db.maintenance")
+    ap.add_argument("command", choices=sorted(COMMANDS))
+    ap.add_argument("--dataset-id", default=None, help="limit to one dataset (default: all)")
+    ap.add_argument("--client-id", default=None, help="limit to one client (default: all)")
+    args = ap.parse_args(argv)
+
+    with get_connection() as conn:
+        # compact-measurements does the schema work itself (and reports it)
+        if args.command != "compact-measurements":
+            ensure_schema(conn, seed_all=False)
+        print(COMMANDS[args.command](conn, args))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,93 @@
+# ewai/geo.py
+"""
+Geohash helpers for bounding-box lookups without PostGIS.
+
+sampling_points.geohash is indexed with text_pattern_ops, so a bbox query
+becomes a handful of `geohash LIKE 'prefix%'` range scans (bbox_prefixes)
+followed by an exact lat/lon check.
+"""
+from __future__ import annotations
+
+import math
+from typing import List, Optional, Tuple
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+GEOHASH_PRECISION = 9  # ~5 m cells; plenty for sampling points
+MAX_BBOX_CELLS = 32
+
+BBox = Tuple[float, float, float, float]  # min_lon, min_lat, max_lon, max_lat
+
+
+def geohash_encode(lat: Optional[float], lon: Optional[float], precision: int = GEOHASH_PRECISION) -> Optional[str]:
+    if lat is None or lon is None:
+        return None
+    lat, lon = float(lat), float(lon)
+    if not (math.isfinite(lat) and math.isfinite(lon)) or abs(lat) > 90 or abs(lon) > 180:
+        return None
+    lat_lo, lat_hi = -90.0, 90.0
+    lon_lo, lon_hi = -180.0, 180.0
+    out, bits, ch, even = [], 0, 0, True
+    while len(out) < precision:
+        if even:
+            mid = (lon_lo + lon_hi) / 2
+            if lon >= mid:
+                ch, lon_lo = (ch << 1) | 1, mid
+            else:
+                ch, lon_hi = ch << 1, mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                ch, lat_lo = (ch << 1) | 1, mid
+            else:
+                ch, lat_hi = ch << 1, mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            out.append(_BASE32[ch])
+            bits, ch = 0, 0
+    return "".join(out)
+
+
+def _cell_size(precision: int) -> Tuple[float, float]:
+    """(width in degrees lon, height in degrees lat) of a geohash cell."""
+    nbits = 5 * precision
+    lon_bits = (nbits + 1) // 2
+    lat_bits = nbits // 2
+    return 360.0 / (1 << lon_bits), 180.0 / (1 << lat_bits)
+
+
+def parse_bbox(raw: Optional[str]) -> Optional[BBox]:
+    """'min_lon,min_lat,max_lon,max_lat' -> tuple; ValueError on bad input."""
+    if not raw:
+        return None
+    parts = [float(p) for p in raw.split(",")]
+    if len(parts) != 4 or not all(math.isfinite(p) for p in parts):
+        raise ValueError("bbox must be min_lon,min_lat,max_lon,max_lat")
+    min_lon, min_lat, max_lon, max_lat = parts
+    if min_lon > max_lon or min_lat > max_lat:
+        raise ValueError("bbox min must not exceed max (antimeridian boxes are not supported)")
+    return (max(min_lon, -180.0), max(min_lat, -90.0), min(max_lon, 180.0), min(max_lat, 90.0))
+
+
+def bbox_prefixes(bbox: BBox, max_cells: int = MAX_BBOX_CELLS) -> List[str]:
+    """
+    Geohash prefixes whose cells cover bbox: the finest precision needing at
+    most max_cells cells. Returns [''] (match everything) for huge boxes.
+    """
+    min_lon, min_lat, max_lon, max_lat = bbox
+    best: List[str] = [""]
+    for precision in range(1, GEOHASH_PRECISION + 1):
+        w, h = _cell_size(precision)
+        nx = math.floor(max_lon / w) - math.floor(min_lon / w) + 1
+        ny = math.floor(max_lat / h) - math.floor(min_lat / h) + 1
+        if nx * ny > max_cells:
+            break
+        cells = set()
+        for i in range(nx):
+            lon = min(max_lon, (math.floor(min_lon / w) + i + 0.5) * w)
+            for j in range(ny):
+                lat = min(max_lat, (math.floor(min_lat / h) + j + 0.5) * h)
+                cells.add(geohash_encode(lat, lon, precision))
+        best = sorted(c for c in cells if c)
+    return best
@@ -0,0 +1,177 @@
+# ewai/header_rules.py
+"""
+Rule-based header mapping, used when the LLM is unavailable (errors, budget
+exhausted, circuit open) or returns nothing usable.
+
+Matches the normalised header text (accents, case and punctuation folded,
+unit in [..] or (..) split off) against the controlled vocabularies and a
+small synonym table (English/Spanish names and the usual abbreviations),
+then picks the unit only if it is one of the parameter's allowed units.
+Output has the same shape as the LLM mapping; confidences stay at or below
+0.6 so the UI asks for confirmation.
+
+param_subset() uses the same matching to pick the parameter codes worth
+putting in an LLM mapping prompt, so a chunk of headers carries only the
+vocabulary it can plausibly need.
+"""
+from __future__ import annotations
+
+import difflib
+import re
+import unicodedata
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from ewai.db.db_util import CONTROLLED_META_VOCAB, CONTROLLED_UNIT_VOCAB
+
+UNIT_NOT_PRESENT = "not_present"
+
+# normalised header (see _norm) -> parameter code
+PARAM_SYNONYMS: Dict[str, str] = {
+    "temp": "temperature", "temperatura": "temperature", "water temperature": "temperature",
+    "t agua": "temperature", "temperatura agua": "temperature",
+    "oxigeno disuelto": "dissolved_oxygen", "od": "dissolved_oxygen", "do": "dissolved_oxygen",
+    "oxygen": "dissolved_oxygen", "oxigeno": "dissolved_oxygen",
+    "turbidez": "turbidity", "turbiedad": "turbidity",
+    "conductividad": "conductivity", "ce": "conductivity", "ec": "conductivity",
+    "specific conductance": "conductivity",
+    "chlorophyll a": "chlorophyll_a", "chl a": "chlorophyll_a", "chla": "chlorophyll_a",
+    "clorofila a": "chlorophyll_a", "clorofila": "chlorophyll_a",
+    "salinidad": "salinity", "secchi": "secchi_depth", "disco secchi": "secchi_depth",
+    "orp": "redox", "potencial redox": "redox",
+    "tp": "total_phosphorus", "p total": "total_phosphorus", "ptot": "total_phosphorus",
+    "fosforo total": "total_phosphorus",
+    "tn": "total_nitrogen", "nitrogeno total": "total_nitrogen",
+    "tkn": "organic_nitrogen", "nitrogeno organico": "organic_nitrogen",
+    "no3": "nitrate", "no3 n": "nitrate", "nitratos": "nitrate",
+    "no2": "nitrite", "no2 n": "nitrite", "nitritos": "nitrite",
+    "nh4": "ammonium", "nh4 n": "ammonium", "amonio": "ammonium",
+    "po4": "phosphate", "po4 p": "phosphate", "orthophosphate": "phosphate", "ortofosfato": "phosphate",
+    "srp": "phosphate", "drp": "phosphate", "fosfatos": "phosphate",
+    "sulfatos": "sulfate", "cloruros": "chloride", "fluoruros": "fluoride", "potasio": "potassium",
+    "co2": "carbon_dioxide", "toc": "toc", "cot": "toc", "color": "color_real",
+    "nivel embalse": "reservoir_level", "cota": "reservoir_level",
+    "zona fotica": "photic_zone_depth", "feopigmentos": "pheopigments", "pheophytin": "pheopigments",
+    "cianobacterias": "total_cyanobacteria", "cyanobacteria": "total_cyanobacteria",
+    "diatomeas": "diatoms", "microcistinas": "microcystins", "e coli": "e_coli",
+}
+
+META_SYNONYMS: Dict[str, str] = {
+    "fecha": "date", "fecha muestreo": "date", "fecha de muestreo": "date", "sampling date": "date",
+    "hora": "time", "fecha hora": "datetime", "date time": "datetime",
+    "punto": "sampling_point", "punto de muestreo": "sampling_point", "punto muestreo": "sampling_point",
+    "sampling point": "sampling_point", "sitio": "site", "estacion": "station",
+    "latitud": "latitude", "longitud": "longitude", "profundidad": "depth",
+    "muestra": "sample_id", "id muestra": "sample_id", "observaciones": "remarks", "notas": "notes",
+}
+
+# normalised unit text -> vocabulary spelling
+UNIT_SYNONYMS: Dict[str, str] = {
+    "c": "C", "°c": "C", "ºc": "C", "degc": "C", "k": "K", "f": "F", "°f": "F",
+    "mg/l": "mg/L", "ppm": "ppm", "ug/l": "µg/L", "µg/l": "µg/L", "μg/l": "µg/L",
+    "ntu": "NTU", "fnu": "FNU", "us/cm": "µS/cm", "µs/cm": "µS/cm", "μs/cm": "µS/cm", "ms/cm": "mS/cm",
+    "psu": "PSU", "m": "m", "mv": "mV", "ptco": "PtCo", "pt-co": "PtCo", "cells/ml": "cells/mL",
+    "cel/ml": "cells/mL", "cfu/100ml": "CFU/100mL", "ufc/100ml": "CFU/100mL",
+}
+
+# codes the prompt's disambiguation rules contrast; offered together
+FAMILIES: List[set] = [
+    {"total_phosphorus", "phosphate"},
+    {"total_nitrogen", "organic_nitrogen", "nitrate", "nitrite", "ammonium"},
+    {"chlorophyll_a", "pheopigments"},
+]
+
+_UNIT_RE = re.compile(r"\s*[\[(]([^\])]*)[\])]\s*$")
+
+
+def _fold(s: str) -> str:
+    s = unicodedata.normalize("NFKD", s)
+    return "".join(ch for ch in s if not unicodedata.combining(ch))
+
+
+def _norm(s: str) -> str:
+    s = _fold(str(s)).lower().replace("_", " ").replace("-", " ")
+    s = re.sub(r"[^a-z0-9/ ]+", " ", s)
+    return re.sub(r"\s+", " ", s).strip()
+
+
+def split_unit(header: str) -> tuple:
+    """('Temperature', '°C') for 'Temperature [°C]' / 'Temperature (°C)'; unit None when absent."""
+    m = _UNIT_RE.search(str(header))
+    if not m:
+        return str(header).strip(), None
+    return str(header)[: m.start()].strip(), m.group(1).strip() or None
+
+
+# normalised name (code with spaces, or synonym) -> parameter code
+_PARAM_NAMES: Dict[str, str] = {**{c.replace("_", " "): c for c in CONTROLLED_UNIT_VOCAB}, **PARAM_SYNONYMS}
+
+
+def _unit(code: str, unit_text: Optional[str]) -> str:
+    if unit_text is None:
+        return UNIT_NOT_PRESENT
+    allowed = CONTROLLED_UNIT_VOCAB.get(code, [])
+    u = UNIT_SYNONYMS.get(unit_text.strip().lower().replace(" ", ""), unit_text.strip())
+    return u if u in allowed else "unknown"
+
+
+def unit_for(code: str, header: str) -> str:
+    """Allowed unit of `code` written in the header, UNIT_NOT_PRESENT, or 'unknown'."""
+    return _unit(code, split_unit(header)[1])
+
+
+def candidates(header: str, k: int = 3) -> List[str]:
+    """Up to k parameter codes the header may name, best first (exact, contained, then fuzzy)."""
+    key = _norm(split_unit(header)[0])
+    out: List[str] = []
+    if key in _PARAM_NAMES:
+        out.append(_PARAM_NAMES[key])
+    padded = f" {key} "
+    for name in sorted(_PARAM_NAMES, key=len, reverse=True):
+        if len(out) >= k:
+            break
+        if len(name) >= 3 and f" {name} " in padded and _PARAM_NAMES[name] not in out:
+            out.append(_PARAM_NAMES[name])
+    for name in difflib.get_close_matches(key, list(_PARAM_NAMES), n=k, cutoff=0.75):
+        if len(out) < k and _PARAM_NAMES[name] not in out:
+            out.append(_PARAM_NAMES[name])
+    return out
+
+
+def param_subset(headers: Iterable[str], k: int = 3) -> Tuple[List[str], bool]:
+    """
+    (codes, covered): the candidate codes of all headers plus their families,
+    in vocabulary order; covered is False when some non-meta header matched
+    nothing locally (the prompt should then list every code by name).
+    """
+    wanted: set = set()
+    covered = True
+    for h in headers:
+        found = candidates(h, k)
+        if not found:
+            key = _norm(split_unit(h)[0])
+            covered = covered and (key.replace(" ", "_") in CONTROLLED_META_VOCAB or key in META_SYNONYMS)
+        wanted.update(found)
+    for fam in FAMILIES:
+        if wanted & fam:
+            wanted |= fam
+    return [c for c in CONTROLLED_UNIT_VOCAB if c in wanted], covered
+
+
+def map_header(header: str) -> Dict[str, Any]:
+    name, unit_text = split_unit(header)
+    key = _norm(name)
+    code_key = key.replace(" ", "_")
+    if code_key in CONTROLLED_META_VOCAB or key in META_SYNONYMS:
+        return {"raw_header": header, "category": "meta", "map_to": META_SYNONYMS.get(key, code_key),
+                "confidence": 0.6, "unit_map_to": "not_applicable", "unit_confidence": 1.0, "source": "rules"}
+    code = code_key if code_key in CONTROLLED_UNIT_VOCAB else PARAM_SYNONYMS.get(key)
+    if code:
+        unit = _unit(code, unit_text)
+        return {"raw_header": header, "category": "parameter", "map_to": code, "confidence": 0.55,
+                "unit_map_to": unit, "unit_confidence": 0.5 if unit == "unknown" else 0.6, "source": "rules"}
+    return {"raw_header": header, "category": "meta", "map_to": "unknown", "confidence": 0.0,
+            "unit_map_to": "not_applicable", "unit_confidence": 0.0, "source": "rules"}
+
+
+def map_headers(headers: Iterable[str]) -> List[Dict[str, Any]]:
+    return [map_header(h) for h in headers]
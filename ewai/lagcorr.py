@@ -0,0 +1,87 @@
+# ewai/lagcorr.py
+"""
+Lagged cross-correlation between every pair of parameters, via FFT.
+
+Input is a cube (S series-groups, e.g. sampling points) x (P parameters) x
+(T regular time steps) with NaN gaps. For a lag k the coefficient of pair
+(a, b) is the Pearson r over all (s, t) where both a[s, t] and b[s, t + k]
+are present, i.e. k > 0 means `a` leads `b` by k steps. Sampling points are
+pooled: their sufficient statistics are summed before normalizing.
+
+All the sums that Pearson r needs per lag (n, Σa, Σb, Σa², Σb², Σab over the
+overlapping support) are cross-correlations of masked series, so each one is
+a product of rFFTs summed over points: O(S·P·N log N + P²·N log N) overall.
+"""
+from __future__ import annotations
+
+from typing import Dict
+
+import numpy as np
+
+MAX_LAG_CAP = 260
+
+
+def _fft_len(n: int) -> int:
+    """Smallest 2^a·3^b·5^c >= n (fast sizes for numpy's pocketfft)."""
+    best = 1 << max(0, (n - 1).bit_length())
+    p5 = 1
+    while p5 < best:
+        p35 = p5
+        while p35 < best:
+            m = p35
+            while m < n:
+                m *= 2
+            best = min(best, m)
+            p35 *= 3
+        p5 *= 5
+    return best
+
+
+def lagged_correlation(cube: np.ndarray, max_lag: int, min_overlap: int = 10) -> Dict[str, np.ndarray]:
+    """
+    cube: (S, P, T) float array, NaN = missing.
+    Returns lags (2L+1,), r (P, P, 2L+1) and n (P, P, 2L+1), where
+    r[i, j, L + k] correlates parameter i at t with parameter j at t + k.
+    Entries with fewer than min_overlap pairs or zero variance are NaN.
+    """
+    S, P, T = cube.shape
+    L = int(max(0, min(max_lag, T - 1)))
+    N = _fft_len(T + L)
+
+    mask = ~np.isnan(cube)
+    x = np.where(mask, cube, 0.0)
+    m = mask.astype(float)
+
+    Fm = np.fft.rfft(m, n=N, axis=-1)
+    Fx = np.fft.rfft(x, n=N, axis=-1)
+    Fx2 = np.fft.rfft(x * x, n=N, axis=-1)
+
+    def xcorr(A, B):
+        # c[i, j, k] = sum_s sum_t A[s, i, t] * B[s, j, t + k]
+        return np.fft.irfft(np.einsum("sif,sjf->ijf", np.conj(A), B), n=N, axis=-1)
+
+    idx = np.r_[np.arange(N - L, N), np.arange(0, L + 1)]  # lags -L..L
+    n = np.rint(xcorr(Fm, Fm)[..., idx])
+    sa = xcorr(Fx, Fm)[..., idx]     # sum of a over the overlap
+    sb = xcorr(Fm, Fx)[..., idx]     # sum of b over the overlap
+    saa = xcorr(Fx2, Fm)[..., idx]
+    sbb = xcorr(Fm, Fx2)[..., idx]
+    sab = xcorr(Fx, Fx)[..., idx]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        va = n * saa - sa * sa
+        vb = n * sbb - sb * sb
+        # relative tolerance: FFT round-off leaves tiny non-zero variances for constant series
+        ok = (n >= min_overlap) & (va > 1e-9 * np.abs(n * saa)) & (vb > 1e-9 * np.abs(n * sbb))
+        r = np.where(ok, (n * sab - sa * sb) / np.sqrt(np.where(ok, va * vb, 1.0)), np.nan)
+    r = np.clip(r, -1.0, 1.0)
+    return {"lags": np.arange(-L, L + 1), "r": r, "n": n.astype(np.int64)}
+
+
+def best_lags(res: Dict[str, np.ndarray]):
+    """Per pair (i < j): index of the lag with the largest |r| (NaN-safe), or -1."""
+    r = res["r"]
+    absr = np.where(np.isnan(r), -1.0, np.abs(r))
+    best = absr.argmax(axis=-1)
+    has = absr.max(axis=-1) >= 0
+    return np.where(has, best, -1)
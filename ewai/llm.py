@@ -0,0 +1,437 @@
+# ewai/llm.py
+"""
+The one place that talks to the LLM.
+
+    content = llm.chat([{"role": "system", ...}, {"role": "user", ...}],
+                       temperature=0.0, max_tokens=600, response_format={"type": "json_object"})
+
+returns the assistant message text. Which provider answers depends on
+LLM_MODE:
+- live (default): Groq (GROQ_API_KEY, GROQ_MODEL; GROQ_BASE_URL points the
+  SDK at an OpenAI-compatible stand-in such as `python -m benchmarks.llm_stub`)
+- record: live, and every request/response pair is written to
+  LLM_CASSETTE_DIR/<request hash>.json
+- replay: answered from LLM_CASSETTE_DIR only, no network and no latency; a
+  request that was never recorded raises ReplayMiss
+
+The request hash covers model, messages, temperature, max_tokens and
+response_format, so a changed prompt or vocabulary is a miss rather than a
+stale answer. Anything with a complete(request, timeout) -> Completion
+method can be installed with set_provider() (benchmarks/llm_stub.py does).
+
+Every call runs under a Policy: each attempt gets a deadline (timeout_s),
+timeouts / connection errors / 408, 409, 429 and 5xx are retried with
+jittered exponential backoff, and all attempts together stay inside
+budget_s. A call that still fails raises LLMUnavailable; callers fall back
+to local logic (ewai.header_rules, fallback_light). After
+`failures` consecutive failed calls the CircuitBreaker opens and calls
+fail immediately with CircuitOpen for reset_s, after which one trial call is
+let through. Policy and breaker are per process (set_policy()). Latency,
+outcome and token counts go to ewai.metrics (ewai_llm_*).
+
+Every attempt first takes a slot from the installed scheduler. Waiting
+calls are served by start-time fair queueing over (purpose, client) flows,
+weighted by WEIGHTS: ingest mapping goes ahead of assistant chat, and one
+busy client cannot starve the others. FairScheduler does this within one
+process; ewai.llm_admission.SharedScheduler does it across every process
+sharing the database, which is what the server installs. Time spent waiting
+counts against the budget; a call that cannot get a slot in time raises
+LLMBusy. The client comes from chat(client=...) or an enclosing
+for_client() block.
+"""
+from __future__ import annotations
+
+import contextvars
+import hashlib
+import heapq
+import itertools
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, Protocol, Tuple
+
+from ewai.metrics import REGISTRY, record_llm_call
+
+DEFAULT_MODEL = "llama-3.3-70b-versatile"
+MODES = ("live", "record", "replay")
+RETRY_STATUS = (408, 409, 429)
+MIN_ATTEMPT_S = 1.0  # don't start an attempt with less budget than this left
+# scheduling weight per purpose (share of LLM slots when several flows wait)
+WEIGHTS = {"header_mapping": 4.0, "waterbody": 4.0, "assistant": 1.0}
+DEFAULT_WEIGHT = 2.0
+
+
+class ReplayMiss(RuntimeError):
+    """LLM_MODE=replay and the request is not in the cassette directory."""
+
+
+class LLMUnavailable(RuntimeError):
+    """The call failed after retries, ran out of budget, or the circuit is open."""
+
+
+class CircuitOpen(LLMUnavailable):
+    pass
+
+
+class LLMBusy(LLMUnavailable):
+    """No LLM slot freed up within the call's budget."""
+
+
+@dataclass
+class Completion:
+    content: str
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+
+
+class Provider(Protocol):
+    def complete(self, req: Dict[str, Any], timeout: Optional[float] = None) -> Completion: ...
+
+
+@dataclass
+class Policy:
+    timeout_s: float = 30.0      # per attempt
+    budget_s: float = 60.0       # all attempts and backoff together
+    retries: int = 2
+    backoff_s: float = 0.5       # first retry waits up to this, doubling after
+
+
+def request_key(req: Dict[str, Any]) -> str:
+    canon = json.dumps(req, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canon.encode("utf-8")).hexdigest()
+
+
+class GroqProvider:
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None):
+        self.api_key = api_key
+        self.base_url = base_url
+        self._client = None
+
+    def client(self):
+        if self._client is None:
+            from groq import Groq
+            key = self.api_key or os.getenv("GROQ_API_KEY")
+            if not key:
+                raise RuntimeError("GROQ_API_KEY not set")
+            # retries are ours (chat()), so they count against the budget
+            self._client = Groq(api_key=key, base_url=self.base_url or os.getenv("GROQ_BASE_URL") or None,
+                                max_retries=0)
+        return self._client
+
+    def complete(self, req: Dict[str, Any], timeout: Optional[float] = None) -> Completion:
+        kw = {"timeout": timeout} if timeout else {}
+        resp = self.client().chat.completions.create(**req, **kw)
+        usage = getattr(resp, "usage", None)
+        return Completion(resp.choices[0].message.content or "",
+                          getattr(usage, "prompt_tokens", None), getattr(usage, "completion_tokens", None))
+
+
+class Cassettes:
+    """request hash -> {"request", "response"} files in one directory."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ".json")
+
+    def get(self, req: Dict[str, Any]) -> Optional[Completion]:
+        try:
+            with open(self.path(request_key(req)), encoding="utf-8") as fh:
+                rec = json.load(fh)
+            usage = rec.get("usage") or {}
+            return Completion(rec["response"], usage.get("prompt_tokens"), usage.get("completion_tokens"))
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def put(self, req: Dict[str, Any], completion: Completion) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        # write-then-rename: job workers may record the same request concurrently
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as fh:
+            json.dump({"request": req, "response": completion.content,
+                       "usage": {"prompt_tokens": completion.prompt_tokens,
+                                 "completion_tokens": completion.completion_tokens}},
+                      fh, ensure_ascii=False, indent=1)
+        os.replace(tmp, self.path(request_key(req)))
+
+
+class RecordingProvider:
+    def __init__(self, inner: Provider, directory: str):
+        self.inner = inner
+        self.cassettes = Cassettes(directory)
+
+    def complete(self, req: Dict[str, Any], timeout: Optional[float] = None) -> Completion:
+        completion = self.inner.complete(req, timeout)
+        self.cassettes.put(req, completion)
+        return completion
+
+
+class ReplayProvider:
+    def __init__(self, directory: str):
+        self.cassettes = Cassettes(directory)
+
+    def complete(self, req: Dict[str, Any], timeout: Optional[float] = None) -> Completion:
+        response = self.cassettes.get(req)
+        if response is None:
+            raise ReplayMiss(f"no recorded LLM response for request {request_key(req)[:12]} "
+                             f"in {self.cassettes.directory}")
+        return response
+
+
+def build(mode: str = "live", cassette_dir: str = "") -> Provider:
+    mode = (mode or "live").lower()
+    if mode not in MODES:
+        raise ValueError(f"LLM_MODE must be one of {', '.join(MODES)}, got {mode!r}")
+    if mode != "live" and not cassette_dir:
+        raise ValueError(f"LLM_MODE={mode} needs LLM_CASSETTE_DIR")
+    if mode == "replay":
+        return ReplayProvider(cassette_dir)
+    if mode == "record":
+        return RecordingProvider(GroqProvider(), cassette_dir)
+    return GroqProvider()
+
+
+class CircuitBreaker:
+    """closed -> open after `failures` consecutive failed calls -> half-open after reset_s."""
+
+    def __init__(self, failures: int = 5, reset_s: float = 30.0):
+        self.failures = max(1, int(failures))
+        self.reset_s = reset_s
+        self._lock = threading.Lock()
+        self._consecutive = 0
+        self._opened_at: Optional[float] = None
+        self._trial_at: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half_open" if time.monotonic() - self._opened_at >= self.reset_s else "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            now = time.monotonic()
+            if now - self._opened_at < self.reset_s:
+                return False
+            if self._trial_at is not None and now - self._trial_at < self.reset_s:
+                return False  # one caller probes; the rest keep failing fast
+            self._trial_at = now
+            return True
+
+    def success(self) -> None:
+        with self._lock:
+            self._consecutive = 0
+            self._opened_at = None
+            self._trial_at = None
+
+    def release(self) -> None:
+        """Give back a half-open trial that ended without a verdict on the provider."""
+        with self._lock:
+            self._trial_at = None
+
+    def failure(self) -> None:
+        with self._lock:
+            self._consecutive += 1
+            if self._trial_at is not None or self._consecutive >= self.failures:
+                self._opened_at = time.monotonic()
+            self._trial_at = None
+
+
+class Scheduler(Protocol):
+    def slot(self, purpose: str, client: Optional[str], timeout: float) -> Any: ...
+
+    def depth(self) -> Dict[str, Tuple[int, int]]: ...
+
+
+class FairScheduler:
+    """
+    At most `slots` calls in flight in this process. Each waiting call gets
+    a start tag max(virtual time, its flow's last finish tag); its flow's
+    finish tag moves on by 1/weight, and the smallest start tag goes next.
+    """
+
+    def __init__(self, slots: int = 4, weights: Optional[Dict[str, float]] = None):
+        self.slots = max(1, int(slots))
+        self.weights = dict(WEIGHTS if weights is None else weights)
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._running: Dict[str, int] = {p: 0 for p in self.weights}
+        self._vtime = 0.0
+        self._finish: Dict[Tuple[str, Optional[str]], float] = {}
+        self._waiting: List[Tuple[float, int, str]] = []
+        self._seq = itertools.count()
+
+    def depth(self) -> Dict[str, Tuple[int, int]]:
+        """{purpose: (waiting, running)} in this process; every weighted purpose is listed."""
+        with self._cond:
+            out = {p: [0, n] for p, n in self._running.items()}
+            for _, _, purpose in self._waiting:
+                out.setdefault(purpose, [0, 0])[0] += 1
+            return {p: (w, r) for p, (w, r) in out.items()}
+
+    @contextmanager
+    def slot(self, purpose: str, client: Optional[str], timeout: float) -> Iterator[None]:
+        t0 = time.monotonic()
+        with self._cond:
+            flow = (purpose, client)
+            start = max(self._vtime, self._finish.get(flow, 0.0))
+            self._finish[flow] = start + 1.0 / self.weights.get(purpose, DEFAULT_WEIGHT)
+            ticket = (start, next(self._seq), purpose)
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while self._in_flight >= self.slots or self._waiting[0] != ticket:
+                    remaining = t0 + timeout - time.monotonic()
+                    if remaining <= 0:
+                        raise LLMBusy(f"no LLM slot within {timeout:.1f}s ({len(self._waiting)} waiting)")
+                    self._cond.wait(remaining)
+            except BaseException:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+                raise
+            heapq.heappop(self._waiting)
+            self._in_flight += 1
+            self._running[purpose] = self._running.get(purpose, 0) + 1
+            self._vtime = start
+            if not self._waiting and len(self._finish) > 1024:
+                self._finish = {f: t for f, t in self._finish.items() if t > self._vtime}
+        REGISTRY.observe("ewai_llm_queue_wait_seconds", time.monotonic() - t0, purpose=purpose)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._in_flight -= 1
+                self._running[purpose] -= 1
+                self._cond.notify_all()
+
+
+def _retryable(e: BaseException) -> bool:
+    status = getattr(e, "status_code", None)
+    if isinstance(status, int):
+        return status in RETRY_STATUS or status >= 500
+    if isinstance(e, (TimeoutError, ConnectionError)):
+        return True
+    # groq.APIConnectionError / APITimeoutError, without importing groq here
+    return any(c.__name__ == "APIConnectionError" for c in type(e).__mro__)
+
+
+def _retry_after(e: BaseException) -> float:
+    headers = getattr(getattr(e, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after") or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+_lock = threading.Lock()
+_provider: Optional[Provider] = None
+_policy = Policy()
+_breaker = CircuitBreaker()
+_scheduler: Scheduler = FairScheduler()
+_CLIENT: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("ewai_llm_client", default=None)
+
+
+@contextmanager
+def for_client(client_id: Optional[str]) -> Iterator[None]:
+    """LLM calls inside the block are scheduled as this client's."""
+    token = _CLIENT.set(client_id)
+    try:
+        yield
+    finally:
+        _CLIENT.reset(token)
+
+
+def set_provider(provider: Optional[Provider]) -> None:
+    """Install the provider every chat() call uses (None: back to LLM_MODE from the environment)."""
+    global _provider
+    with _lock:
+        _provider = provider
+
+
+def set_policy(policy: Policy, breaker: Optional[CircuitBreaker] = None,
+               scheduler: Optional[Scheduler] = None) -> None:
+    global _policy, _breaker, _scheduler
+    with _lock:
+        _policy = policy
+        if breaker is not None:
+            _breaker = breaker
+        if scheduler is not None:
+            _scheduler = scheduler
+
+
+def breaker_state() -> str:
+    return _breaker.state
+
+
+def queue_depth() -> Dict[str, Tuple[int, int]]:
+    """{purpose: (waiting, running)} as the installed scheduler sees it."""
+    return _scheduler.depth()
+
+
+def get_provider() -> Provider:
+    global _provider
+    with _lock:
+        if _provider is None:
+            _provider = build(os.getenv("LLM_MODE", "live"), os.getenv("LLM_CASSETTE_DIR", ""))
+        return _provider
+
+
+def chat(messages: List[Dict[str, str]], *, purpose: str = "chat", temperature: float = 0.0,
+         max_tokens: int = 1000, response_format: Optional[Dict[str, Any]] = None,
+         model: Optional[str] = None, client: Optional[str] = None) -> str:
+    """Assistant message text; raises LLMUnavailable (see Policy) or ReplayMiss."""
+    req: Dict[str, Any] = {
+        "model": model or os.getenv("GROQ_MODEL", DEFAULT_MODEL),
+        "messages": messages,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+    }
+    if response_format is not None:
+        req["response_format"] = response_format
+    provider, policy, breaker, scheduler = get_provider(), _policy, _breaker, _scheduler
+    client = client or _CLIENT.get()
+
+    if not breaker.allow():
+        record_llm_call(purpose, 0.0, "circuit_open")
+        raise CircuitOpen(f"LLM circuit open after repeated failures (retrying in <= {breaker.reset_s:g}s)")
+
+    deadline = time.monotonic() + policy.budget_s
+    attempt = 0
+    while True:
+        t0 = time.perf_counter()
+        try:
+            with scheduler.slot(purpose, client, max(0.0, deadline - time.monotonic())):
+                timeout = max(0.1, min(policy.timeout_s, deadline - time.monotonic()))
+                t0 = time.perf_counter()
+                completion = provider.complete(req, timeout)
+        except LLMBusy:
+            breaker.release()  # never reached the provider
+            record_llm_call(purpose, 0.0, "busy")
+            raise
+        except ReplayMiss:
+            breaker.release()  # a missing cassette says nothing about the provider
+            raise
+        except Exception as e:
+            record_llm_call(purpose, time.perf_counter() - t0, "error")
+            delay = max(random.uniform(0, policy.backoff_s * 2 ** attempt), _retry_after(e))
+            if (attempt < policy.retries and _retryable(e)
+                    and deadline - time.monotonic() - delay >= MIN_ATTEMPT_S):
+                attempt += 1
+                record_llm_call(purpose, 0.0, "retry")
+                time.sleep(delay)
+                continue
+            breaker.failure()
+            raise LLMUnavailable(f"LLM call ({purpose}) failed after {attempt + 1} attempt(s): {e}") from e
+        breaker.success()
+        record_llm_call(purpose, time.perf_counter() - t0, "ok",
+                        completion.prompt_tokens, completion.completion_tokens, max_tokens)
+        return completion.content
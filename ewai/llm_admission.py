@@ -0,0 +1,200 @@
+# ewai/llm_admission.py
+"""
+Cross-process admission for LLM calls (public.llm_tickets, public.llm_flows).
+
+Header mapping and waterbody calls run in job worker processes and the
+assistant in the web process, so an in-process queue never sees them
+compete and every process would add its own slots on top of the others'.
+SharedScheduler keeps one queue for all of them in Postgres:
+
+- a call takes a ticket whose tag follows start-time fair queueing over
+  (purpose, client) flows: tag = max(virtual time, flow's last finish),
+  flow finish += 1 / WEIGHTS[purpose]
+- it is admitted once fewer than `slots` tickets are running (across all
+  processes and hosts) and its ticket has the smallest waiting tag
+- every step runs under one transaction-scoped advisory lock; releases
+  NOTIFY the waiters, which also re-check every POLL_S (the only wake-up
+  behind a transaction-pooling proxy, where LISTEN does not stick)
+
+Crashed holders cannot leak slots: a running ticket is a lease that ends at
+the call's deadline plus LEASE_GRACE_S, a waiting ticket that has not polled
+for STALE_WAIT_S is dropped. When the database is unreachable calls fall
+back to an in-process FairScheduler of the same size.
+"""
+from __future__ import annotations
+
+import select
+import time
+import traceback
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+from ewai.llm import DEFAULT_WEIGHT, WEIGHTS, FairScheduler, LLMBusy
+from ewai.metrics import REGISTRY
+
+_LOCK_KEY = 0x6C6C6D71  # advisory lock key ('llmq')
+_CHANNEL = "ewai_llm_slots"
+_VTIME = ""  # llm_flows row holding the virtual time
+
+POLL_S = 0.25
+STALE_WAIT_S = 10.0
+LEASE_GRACE_S = 30.0
+
+_REAP_SQL = """
+DELETE FROM public.llm_tickets
+WHERE (NOT running AND seen_at < now() - make_interval(secs => %s))
+   OR (running AND expires_at < now())
+"""
+
+
+class SharedScheduler:
+    """At most `slots` LLM calls in flight across every process sharing the database."""
+
+    def __init__(self, conn_factory: Callable, slots: int = 4, weights: Optional[Dict[str, float]] = None):
+        self.conn_factory = conn_factory
+        self.slots = max(1, int(slots))
+        self.weights = dict(WEIGHTS if weights is None else weights)
+        self.local = FairScheduler(self.slots, self.weights)
+
+    # ---- ticket steps (each its own locked transaction) ----
+    def _enqueue(self, conn, purpose: str, client: Optional[str]) -> int:
+        flow = f"{purpose}|{client or ''}"
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_xact_lock(%s)", (_LOCK_KEY,))
+            cur.execute(_REAP_SQL, (STALE_WAIT_S,))
+            cur.execute("SELECT flow, finish FROM public.llm_flows WHERE flow = ANY(%s)", ([_VTIME, flow],))
+            tags = dict(cur.fetchall())
+            start = max(tags.get(_VTIME, 0.0), tags.get(flow, 0.0))
+            cur.execute(
+                """
+                INSERT INTO public.llm_flows (flow, finish) VALUES (%s, %s)
+                ON CONFLICT (flow) DO UPDATE SET finish = EXCLUDED.finish, updated_at = now()
+                """,
+                (flow, start + 1.0 / self.weights.get(purpose, DEFAULT_WEIGHT)),
+            )
+            cur.execute(
+                "INSERT INTO public.llm_tickets (purpose, client, tag) VALUES (%s, %s, %s) RETURNING ticket",
+                (purpose, client, start),
+            )
+            ticket = cur.fetchone()[0]
+        conn.commit()
+        return ticket
+
+    def _try_admit(self, conn, ticket: int, lease_s: float) -> bool:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_xact_lock(%s)", (_LOCK_KEY,))
+            cur.execute(_REAP_SQL, (STALE_WAIT_S,))
+            cur.execute("UPDATE public.llm_tickets SET seen_at = now() WHERE ticket = %s RETURNING tag", (ticket,))
+            row = cur.fetchone()
+            if row is None:
+                conn.commit()
+                raise LLMBusy("LLM ticket expired while waiting")
+            cur.execute("""
+                SELECT (SELECT COUNT(*) FROM public.llm_tickets WHERE running),
+                       (SELECT ticket FROM public.llm_tickets WHERE NOT running ORDER BY tag, ticket LIMIT 1)
+            """)
+            running, head = cur.fetchone()
+            admitted = running < self.slots and head == ticket
+            if admitted:
+                cur.execute(
+                    """
+                    UPDATE public.llm_tickets
+                    SET running = TRUE, expires_at = now() + make_interval(secs => %s)
+                    WHERE ticket = %s
+                    """,
+                    (lease_s, ticket),
+                )
+                cur.execute(
+                    """
+                    INSERT INTO public.llm_flows (flow, finish) VALUES (%s, %s)
+                    ON CONFLICT (flow) DO UPDATE SET finish = EXCLUDED.finish, updated_at = now()
+                    """,
+                    (_VTIME, row[0]),
+                )
+                # flows that finished before the virtual time carry no information
+                cur.execute("DELETE FROM public.llm_flows WHERE flow <> %s AND finish <= %s", (_VTIME, row[0]))
+        conn.commit()
+        return admitted
+
+    def _release(self, conn, ticket: int) -> None:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM public.llm_tickets WHERE ticket = %s", (ticket,))
+            cur.execute(f"NOTIFY {_CHANNEL}")
+        conn.commit()
+
+    @staticmethod
+    def _wait(conn, seconds: float) -> None:
+        if seconds <= 0:
+            return
+        if select.select([conn], [], [], seconds)[0]:
+            conn.poll()
+            conn.notifies.clear()
+
+    # ---- public ----
+    @contextmanager
+    def slot(self, purpose: str, client: Optional[str], timeout: float) -> Iterator[None]:
+        t0 = time.monotonic()
+        try:
+            conn = self.conn_factory()
+        except Exception:
+            traceback.print_exc()
+            with self.local.slot(purpose, client, timeout):
+                yield
+            return
+        ticket, admitted = None, False
+        try:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {_CHANNEL}")
+                conn.commit()
+                ticket = self._enqueue(conn, purpose, client)
+                while not admitted:
+                    remaining = t0 + timeout - time.monotonic()
+                    admitted = self._try_admit(conn, ticket, max(0.0, remaining) + LEASE_GRACE_S)
+                    if not admitted:
+                        if remaining <= 0:
+                            raise LLMBusy(f"no shared LLM slot within {timeout:.1f}s")
+                        self._wait(conn, min(POLL_S, remaining))
+            except LLMBusy:
+                raise
+            except Exception:
+                # database trouble: keep the process going on its local queue
+                traceback.print_exc()
+                self._drop(conn, ticket)
+                ticket = None
+            if admitted:
+                REGISTRY.observe("ewai_llm_queue_wait_seconds", time.monotonic() - t0, purpose=purpose)
+                yield
+            else:
+                with self.local.slot(purpose, client, max(0.0, t0 + timeout - time.monotonic())):
+                    yield
+        finally:
+            self._drop(conn, ticket)
+            conn.close()
+
+    def _drop(self, conn, ticket: Optional[int]) -> None:
+        if ticket is None or conn.closed:
+            return
+        try:
+            conn.rollback()
+            self._release(conn, ticket)
+        except Exception:
+            traceback.print_exc()  # the lease / stale-wait reaping frees it
+
+    def depth(self) -> Dict[str, Tuple[int, int]]:
+        """{purpose: (waiting, running)} over all processes; every weighted purpose is listed."""
+        out = {p: (0, 0) for p in self.weights}
+        conn = self.conn_factory()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(_REAP_SQL, (STALE_WAIT_S,))
+                cur.execute("""
+                    SELECT purpose, COUNT(*) FILTER (WHERE NOT running), COUNT(*) FILTER (WHERE running)
+                    FROM public.llm_tickets GROUP BY purpose
+                """)
+                for purpose, waiting, running in cur.fetchall():
+                    out[purpose] = (int(waiting), int(running))
+            conn.commit()
+        finally:
+            conn.close()
+        return out
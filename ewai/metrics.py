@@ -0,0 +1,292 @@
+# ewai/metrics.py
+"""
+Stage timings, row/byte counters and query stats in the Prometheus text format.
+
+    with stage("melt", rows=len(df_h)) as st:
+        long_df = ...
+        st.rows = len(long_df)
+
+records ewai_stage_seconds{stage="melt"} and adds to the stage's rows/bytes
+counters. Database queries are counted by the cursor class that
+ewai.db.db_conn installs (see record_query).
+
+A scope() (one per HTTP request or ingest job) additionally collects the
+per-stage breakdown and the query count/time of just that unit of work,
+for the slow-request log line.
+
+Each process keeps its own registry. Processes that share METRICS_DIR dump a
+snapshot there (dump()), and render() merges the snapshots, so /metrics on
+the web process also reports the job workers.
+"""
+from __future__ import annotations
+
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+
+_HELP = {
+    "ewai_stage_seconds": ("histogram", "Wall time per pipeline stage"),
+    "ewai_stage_rows_total": ("counter", "Rows handled per pipeline stage"),
+    "ewai_stage_bytes_total": ("counter", "Bytes handled per pipeline stage"),
+    "ewai_db_queries_total": ("counter", "Database statements executed"),
+    "ewai_db_query_seconds_total": ("counter", "Time spent in database statements"),
+    "ewai_http_request_seconds": ("histogram", "HTTP request latency"),
+    "ewai_http_request_queries": ("histogram", "Database statements per HTTP request"),
+    "ewai_http_request_query_seconds": ("histogram", "Database time per HTTP request"),
+    "ewai_job_seconds": ("histogram", "Ingest job run time"),
+    "ewai_job_queries": ("histogram", "Database statements per ingest job"),
+    "ewai_waterbody_resolutions_total": ("counter", "Waterbody resolutions by source (sampling_points, pattern, llm)"),
+    "ewai_llm_queue_depth": ("gauge", "LLM calls waiting for a shared slot (all processes)"),
+    "ewai_llm_in_flight": ("gauge", "LLM calls holding a shared slot (all processes)"),
+    "ewai_llm_queue_wait_seconds": ("histogram", "Time LLM calls waited for a slot"),
+    "ewai_rate_limited_total": ("counter", "Requests rejected with 429 by the rate limiter (per client and per address)"),
+    "ewai_llm_call_seconds": ("histogram", "LLM call attempt latency"),
+    "ewai_llm_calls_total": ("counter", "LLM call attempts by outcome (ok, error, retry, busy, circuit_open)"),
+    "ewai_llm_prompt_tokens": ("histogram", "Prompt tokens per LLM call"),
+    "ewai_llm_completion_tokens": ("histogram", "Completion tokens per LLM call"),
+    "ewai_llm_completion_budget_used": ("histogram", "Completion tokens / max_tokens per LLM call"),
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Registry:
+    """Counters, gauges and fixed-bucket histograms keyed by (name, labels)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+        self.gauges: Dict[Tuple[str, Labels], float] = {}
+        # name, labels -> [bucket counts..., sum, count]
+        self.histograms: Dict[Tuple[str, Labels], list] = {}
+        self.buckets: Dict[str, Tuple[float, ...]] = {}
+
+    def inc(self, name: str, value: float = 1.0, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0.0) + value
+
+    def set(self, name: str, value: float, **labels: str) -> None:
+        with self._lock:
+            self.gauges[(name, tuple(sorted(labels.items())))] = float(value)
+
+    def observe(self, name: str, value: float, buckets: Tuple[float, ...] = SECONDS_BUCKETS, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            h = self.histograms.get(key)
+            if h is None:
+                self.buckets[name] = buckets
+                h = self.histograms[key] = [0] * len(buckets) + [0.0, 0]
+            for i, b in enumerate(buckets):
+                if value <= b:
+                    h[i] += 1
+            h[-2] += value
+            h[-1] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "counters": [[n, list(map(list, l)), v] for (n, l), v in self.counters.items()],
+                "gauges": [[n, list(map(list, l)), v] for (n, l), v in self.gauges.items()],
+                "histograms": [[n, list(map(list, l)), list(h)] for (n, l), h in self.histograms.items()],
+                "buckets": {n: list(b) for n, b in self.buckets.items()},
+            }
+
+
+REGISTRY = Registry()
+
+
+# ---- per-request / per-job scope ----
+class ScopeStats:
+    __slots__ = ("started", "queries", "query_s", "stages")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.query_s = 0.0
+        self.stages: Dict[str, Dict[str, float]] = {}
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def summary(self) -> dict:
+        return {
+            "ms": round(self.elapsed * 1000, 1),
+            "queries": self.queries,
+            "query_ms": round(self.query_s * 1000, 1),
+            "stages": {k: {"ms": round(v["s"] * 1000, 1), "rows": int(v["rows"]), "bytes": int(v["bytes"])}
+                       for k, v in self.stages.items()},
+        }
+
+
+_SCOPE: contextvars.ContextVar[Optional[ScopeStats]] = contextvars.ContextVar("ewai_metrics_scope", default=None)
+
+
+def begin_scope() -> Tuple[ScopeStats, contextvars.Token]:
+    stats = ScopeStats()
+    return stats, _SCOPE.set(stats)
+
+
+def end_scope(token: contextvars.Token) -> None:
+    try:
+        _SCOPE.reset(token)
+    except ValueError:  # token from another context (the server switched threads)
+        _SCOPE.set(None)
+
+
+@contextmanager
+def scope() -> Iterator[ScopeStats]:
+    stats, token = begin_scope()
+    try:
+        yield stats
+    finally:
+        end_scope(token)
+
+
+# ---- recording ----
+class _Stage:
+    __slots__ = ("rows", "bytes")
+
+    def __init__(self, rows: Optional[int], nbytes: Optional[int]):
+        self.rows = rows
+        self.bytes = nbytes
+
+
+@contextmanager
+def stage(name: str, rows: Optional[int] = None, nbytes: Optional[int] = None) -> Iterator[_Stage]:
+    """Time a pipeline stage; set .rows / .bytes on the yielded record to count output."""
+    st = _Stage(rows, nbytes)
+    t0 = time.perf_counter()
+    try:
+        yield st
+    finally:
+        dt = time.perf_counter() - t0
+        REGISTRY.observe("ewai_stage_seconds", dt, stage=name)
+        if st.rows:
+            REGISTRY.inc("ewai_stage_rows_total", float(st.rows), stage=name)
+        if st.bytes:
+            REGISTRY.inc("ewai_stage_bytes_total", float(st.bytes), stage=name)
+        sc = _SCOPE.get()
+        if sc is not None:
+            agg = sc.stages.setdefault(name, {"s": 0.0, "rows": 0, "bytes": 0})
+            agg["s"] += dt
+            agg["rows"] += st.rows or 0
+            agg["bytes"] += st.bytes or 0
+
+
+def record_llm_call(purpose: str, seconds: float, outcome: str, prompt_tokens: Optional[int] = None,
+                    completion_tokens: Optional[int] = None, max_tokens: Optional[int] = None) -> None:
+    REGISTRY.inc("ewai_llm_calls_total", purpose=purpose, outcome=outcome)
+    if outcome in ("ok", "error"):
+        REGISTRY.observe("ewai_llm_call_seconds", seconds, purpose=purpose, outcome=outcome)
+    if prompt_tokens is not None:
+        REGISTRY.observe("ewai_llm_prompt_tokens", prompt_tokens, TOKEN_BUCKETS, purpose=purpose)
+    if completion_tokens is not None:
+        REGISTRY.observe("ewai_llm_completion_tokens", completion_tokens, TOKEN_BUCKETS, purpose=purpose)
+        if max_tokens:
+            REGISTRY.observe("ewai_llm_completion_budget_used", completion_tokens / max_tokens,
+                             (0.05, 0.1, 0.25, 0.5, 0.75, 0.9, 1.0), purpose=purpose)
+
+
+def record_query(seconds: float) -> None:
+    REGISTRY.inc("ewai_db_queries_total")
+    REGISTRY.inc("ewai_db_query_seconds_total", seconds)
+    sc = _SCOPE.get()
+    if sc is not None:
+        sc.queries += 1
+        sc.query_s += seconds
+
+
+# ---- multi-process export ----
+def dump(directory: str) -> None:
+    """Write this process's snapshot to directory/<pid>.json (atomic replace)."""
+    if not directory:
+        return
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{os.getpid()}.json")
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(REGISTRY.snapshot(), fh)
+    os.replace(tmp, path)
+
+
+def _snapshots(directory: Optional[str]) -> Iterable[dict]:
+    yield REGISTRY.snapshot()
+    if not directory or not os.path.isdir(directory):
+        return
+    own = f"{os.getpid()}.json"
+    for fn in os.listdir(directory):
+        if not fn.endswith(".json") or fn == own:
+            continue
+        try:
+            with open(os.path.join(directory, fn), encoding="utf-8") as fh:
+                yield json.load(fh)
+        except (OSError, ValueError):
+            continue  # being replaced or truncated; next scrape picks it up
+
+
+def _fmt_labels(labels: Iterable, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = [tuple(l) for l in labels] + ([extra] if extra else [])
+    if not items:
+        return ""
+    esc = lambda v: str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in items) + "}"
+
+
+def _fmt_num(v: float) -> str:
+    return repr(float(v)) if v != int(v) else str(int(v))
+
+
+def render(directory: Optional[str] = None,
+           gauges: Optional[Iterable[Tuple[str, Dict[str, str], float]]] = None) -> str:
+    """
+    Prometheus text exposition (0.0.4) of this process plus the dumped
+    snapshots. `gauges` are (name, labels, value) read at scrape time from a
+    shared source; they replace any snapshot series of the same name and are
+    exported as given, not summed across processes.
+    """
+    counters: Dict[Tuple[str, Labels], float] = {}
+    histograms: Dict[Tuple[str, Labels], list] = {}
+    buckets: Dict[str, list] = {}
+    for snap in _snapshots(directory):
+        buckets.update(snap.get("buckets", {}))
+        # per-process gauges add up across processes
+        for name, labels, v in snap.get("counters", []) + snap.get("gauges", []):
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0.0) + v
+        for name, labels, h in snap.get("histograms", []):
+            key = (name, tuple(map(tuple, labels)))
+            cur = histograms.get(key)
+            histograms[key] = list(h) if cur is None else [a + b for a, b in zip(cur, h)]
+    gauges = list(gauges or ())
+    shared = {name for name, _, _ in gauges}
+    counters = {k: v for k, v in counters.items() if k[0] not in shared}
+    for name, labels, v in gauges:
+        counters[(name, tuple(sorted(labels.items())))] = float(v)
+
+    out = []
+    for name in sorted({n for n, _ in counters} | {n for n, _ in histograms}):
+        kind, help_ = _HELP.get(name, ("untyped", name))
+        out.append(f"# HELP {name} {help_}")
+        out.append(f"# TYPE {name} {kind}")
+        for (n, labels), v in sorted(counters.items()):
+            if n == name:
+                out.append(f"{name}{_fmt_labels(labels)} {_fmt_num(v)}")
+        for (n, labels), h in sorted(histograms.items()):
+            if n != name:
+                continue
+            for b, c in zip(buckets[name], h):
+                out.append(f"{name}_bucket{_fmt_labels(labels, ('le', _fmt_num(b)))} {c}")
+            out.append(f"{name}_bucket{_fmt_labels(labels, ('le', '+Inf'))} {h[-1]}")
+            out.append(f"{name}_sum{_fmt_labels(labels)} {_fmt_num(h[-2])}")
+            out.append(f"{name}_count{_fmt_labels(labels)} {h[-1]}")
+    return "\n".join(out) + "\n"
@@ -0,0 +1,124 @@
+# ewai/tdigest.py
+"""
+Merging t-digest (Dunning & Ertl) on NumPy arrays.
+
+A digest is a sorted list of centroids (mean, weight) plus the exact min/max.
+Centroid sizes are bounded by the k1 scale function
+    k(q) = δ / (2π) · asin(2q − 1),
+so each centroid covers at most Δq ≈ (2π/δ)·√(q(1−q)) of the rank space:
+small centroids in the tails, large ones around the median.
+
+Error bound (δ = COMPRESSION = 200): the rank of an estimated quantile is
+within (π/δ)·√(q(1−q)) of q plus interpolation noise of the same order, i.e.
+≲ 0.8 % of rank at the median and ≲ 0.2 % at p01/p99; min and max are exact.
+Merging digests keeps the same bound. A digest holds at most ~δ/2 + 1
+centroids; serialized as float64 means + float32 weights that is ≲ 1.3 KB.
+"""
+from __future__ import annotations
+
+import math
+import struct
+from typing import Iterable, Optional, Sequence
+
+import numpy as np
+
+COMPRESSION = 200.0
+
+_HEADER = struct.Struct("<BHIdd")  # version, compression, centroid count, min, max
+_VERSION = 1
+
+
+class TDigest:
+    __slots__ = ("means", "weights", "vmin", "vmax", "compression")
+
+    def __init__(self, means=None, weights=None, vmin=math.inf, vmax=-math.inf,
+                 compression: float = COMPRESSION):
+        self.means = np.asarray(means if means is not None else [], dtype=np.float64)
+        self.weights = np.asarray(weights if weights is not None else [], dtype=np.float64)
+        self.vmin = float(vmin)
+        self.vmax = float(vmax)
+        self.compression = float(compression)
+
+    # ---- construction ----
+    @classmethod
+    def from_values(cls, values: Iterable[float], compression: float = COMPRESSION) -> "TDigest":
+        v = np.asarray(values, dtype=np.float64)
+        v = v[np.isfinite(v)]
+        if v.size == 0:
+            return cls(compression=compression)
+        d = cls(v, np.ones(v.size), v.min(), v.max(), compression)
+        d._compress()
+        return d
+
+    @property
+    def count(self) -> float:
+        return float(self.weights.sum())
+
+    def merge(self, *others: "TDigest") -> "TDigest":
+        parts = [self, *others]
+        d = TDigest(
+            np.concatenate([p.means for p in parts]),
+            np.concatenate([p.weights for p in parts]),
+            min(p.vmin for p in parts),
+            max(p.vmax for p in parts),
+            self.compression,
+        )
+        d._compress()
+        return d
+
+    @classmethod
+    def merge_all(cls, digests: Sequence["TDigest"], compression: float = COMPRESSION) -> "TDigest":
+        if not digests:
+            return cls(compression=compression)
+        return digests[0].merge(*digests[1:])
+
+    def _compress(self) -> None:
+        if self.means.size <= 1:
+            return
+        order = np.argsort(self.means, kind="stable")
+        m, w = self.means[order], self.weights[order]
+        # centroid j takes the inputs whose rank midpoint falls in k ∈ [j, j + 1)
+        q_mid = (np.cumsum(w) - w / 2) / w.sum()
+        k = self.compression / (2 * math.pi) * np.arcsin(2 * q_mid - 1)
+        group = np.floor(k - k[0]).astype(np.int64)
+        _, group = np.unique(group, return_inverse=True)
+        weights = np.bincount(group, w)
+        self.means = np.bincount(group, w * m) / weights
+        self.weights = weights
+
+    # ---- queries ----
+    def quantile(self, qs) -> np.ndarray:
+        """Estimated values at quantiles qs (array-like in [0, 1]); NaN when empty."""
+        q = np.atleast_1d(np.asarray(qs, dtype=np.float64))
+        n = self.count
+        if n == 0:
+            return np.full(q.shape, np.nan)
+        if self.means.size == 1:
+            return np.full(q.shape, self.means[0])
+        # piecewise-linear through (0, min), centroid centers, (n, max)
+        centers = np.cumsum(self.weights) - self.weights / 2
+        xs = np.concatenate(([0.0], centers, [n]))
+        ys = np.concatenate(([self.vmin], self.means, [self.vmax]))
+        return np.interp(np.clip(q, 0.0, 1.0) * n, xs, ys)
+
+    # ---- serialization ----
+    def to_bytes(self) -> bytes:
+        k = int(self.means.size)
+        return (
+            _HEADER.pack(_VERSION, int(self.compression), k, self.vmin, self.vmax)
+            + self.means.astype("<f8").tobytes()
+            + self.weights.astype("<f4").tobytes()
+        )
+
+    @classmethod
+    def from_bytes(cls, raw: Optional[bytes]) -> "TDigest":
+        if not raw:
+            return cls()
+        raw = bytes(raw)
+        version, compression, k, vmin, vmax = _HEADER.unpack_from(raw, 0)
+        if version != _VERSION:
+            raise ValueError(f"unsupported t-digest version {version}")
+        off = _HEADER.size
+        means = np.frombuffer(raw, dtype="<f8", count=k, offset=off)
+        weights = np.frombuffer(raw, dtype="<f4", count=k, offset=off + 8 * k).astype(np.float64)
+        return cls(means.copy(), weights, vmin, vmax, compression)
@@ -0,0 +1,234 @@
+# ewai/trends.py
+"""
+Vectorized trend statistics for every (sampling point, parameter) series of
+a dataset in one pass.
+
+Per series:
+  - OLS slope/intercept (closed form from grouped sums),
+  - Theil–Sen slope (median of pairwise slopes),
+  - Mann–Kendall S, Z (tie-corrected variance, continuity correction) and
+    two-sided p-value (normal approximation).
+
+Series are packed into NaN-padded (k, L) blocks so pairwise differences are
+computed as (k, L, L) array operations; blocks are sized to a pair budget so
+memory stays bounded. Large inputs are sharded across a process pool.
+Series longer than MAX_POINTS are block-averaged down to MAX_POINTS first
+(Theil–Sen / Mann–Kendall are O(L^2) per series).
+"""
+from __future__ import annotations
+
+import math
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+MAX_POINTS = 2000                # per series, after thinning
+PAIR_BUDGET = 2_000_000          # k * L * L elements per pairwise block
+PARALLEL_MIN_PAIRS = 4_000_000   # below this a pool costs more than it saves
+
+_POOL: Optional[ProcessPoolExecutor] = None
+_POOL_LOCK = threading.Lock()
+_erfc = np.vectorize(math.erfc, otypes=[float])
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Spawned, not forked: the web process has threads and open connections a
+    fork would inherit (same reason as jobs.start_workers).
+    """
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        return _POOL
+
+
+def _drop_pool(pool: ProcessPoolExecutor) -> None:
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is pool:
+            _POOL = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _ols(codes: np.ndarray, x: np.ndarray, y: np.ndarray, k: int):
+    n = np.bincount(codes, minlength=k).astype(float)
+    xm = np.bincount(codes, x, minlength=k) / n
+    ym = np.bincount(codes, y, minlength=k) / n
+    dx = x - xm[codes]
+    sxx = np.bincount(codes, dx * dx, minlength=k)
+    sxy = np.bincount(codes, dx * (y - ym[codes]), minlength=k)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = np.where(sxx > 0, sxy / sxx, np.nan)
+    return n, slope, ym - slope * xm
+
+
+def _pairwise_block(X: np.ndarray, Y: np.ndarray):
+    """X, Y: (k, L) NaN-padded rows sorted by x. Returns (theil_sen, mk_s)."""
+    k, L = X.shape
+    dx = X[:, None, :] - X[:, :, None]          # [s, i, j] = x_j - x_i
+    dy = Y[:, None, :] - Y[:, :, None]
+    valid = np.triu(np.ones((L, L), dtype=bool), 1) & ~np.isnan(dy)
+    mk_s = np.sign(np.where(valid, dy, 0.0)).sum(axis=(1, 2))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slopes = np.where(valid & (dx != 0), dy / dx, np.nan)
+    theil_sen = np.nanmedian(slopes.reshape(k, -1), axis=1)
+    return theil_sen, mk_s
+
+
+def _trend_arrays(codes: np.ndarray, x: np.ndarray, y: np.ndarray, k: int) -> Dict[str, np.ndarray]:
+    """Core computation; rows must be sorted by (codes, x), codes in 0..k-1."""
+    n, ols_slope, ols_intercept = _ols(codes, x, y, k)
+
+    lengths = n.astype(np.int64)
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    pos = np.arange(codes.size) - starts[codes]
+
+    theil_sen = np.full(k, np.nan)
+    mk_s = np.zeros(k)
+    # bucket series by length (next power of two) so padding wastes <= 4x
+    cls = np.ceil(np.log2(np.maximum(lengths, 2))).astype(int)
+    for c in np.unique(cls):
+        members = np.flatnonzero(cls == c)
+        L = int(lengths[members].max())
+        per_block = max(1, PAIR_BUDGET // (L * L))
+        for b in range(0, members.size, per_block):
+            ids = members[b:b + per_block]
+            slot = np.full(k, -1)
+            slot[ids] = np.arange(ids.size)
+            rows = np.flatnonzero(slot[codes] >= 0)
+            X = np.full((ids.size, L), np.nan)
+            Y = np.full((ids.size, L), np.nan)
+            X[slot[codes[rows]], pos[rows]] = x[rows]
+            Y[slot[codes[rows]], pos[rows]] = y[rows]
+            theil_sen[ids], mk_s[ids] = _pairwise_block(X, Y)
+
+    # Mann–Kendall variance with tie correction: sum t(t-1)(2t+5) over tied y groups
+    tie_sizes = pd.DataFrame({"c": codes, "y": y}).groupby(["c", "y"]).size()
+    t = tie_sizes.to_numpy(dtype=float)
+    tie_term = np.bincount(
+        tie_sizes.index.get_level_values("c").to_numpy(), t * (t - 1) * (2 * t + 5), minlength=k
+    )
+    var_s = (n * (n - 1) * (2 * n + 5) - tie_term) / 18.0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = np.where(var_s > 0, (mk_s - np.sign(mk_s)) / np.sqrt(var_s), 0.0)
+    p = _erfc(np.abs(z) / math.sqrt(2.0))
+
+    return {
+        "n": lengths,
+        "ols_slope": ols_slope,
+        "ols_intercept": ols_intercept,
+        "theil_sen_slope": theil_sen,
+        "mk_s": mk_s,
+        "mk_z": z,
+        "mk_p": p,
+    }
+
+
+def _thin(df: pd.DataFrame, code_col: str, x: str, y: str, max_points: int) -> pd.DataFrame:
+    """Block-average series longer than max_points into max_points bins."""
+    sizes = df.groupby(code_col)[x].transform("size")
+    long_mask = sizes > max_points
+    if not long_mask.any():
+        return df
+    lg = df.loc[long_mask]
+    rank = lg.groupby(code_col).cumcount()
+    bin_id = (rank * max_points // sizes[long_mask]).astype(int)
+    thinned = (
+        lg.assign(_bin=bin_id)
+        .groupby([code_col, "_bin"], sort=False)[[x, y]].mean()
+        .reset_index(level=0)
+        .reset_index(drop=True)
+    )
+    return pd.concat([df.loc[~long_mask, [code_col, x, y]], thinned], ignore_index=True)
+
+
+def series_trends(
+    df: pd.DataFrame,
+    by: Sequence[str],
+    x: str = "x",
+    y: str = "y",
+    min_points: int = 6,
+    alpha: float = 0.05,
+    workers: int = 0,
+) -> pd.DataFrame:
+    """
+    Trend statistics for every group of `by` in a long frame.
+    Returns one row per series with >= min_points finite points:
+      *by, n, x_start, x_end, ols_slope, ols_intercept, theil_sen_slope,
+      mk_s, mk_z, mk_p, trend ('increasing' | 'decreasing' | 'no_trend').
+    Slopes are in y-units per x-unit.
+    """
+    cols = list(by) + [x, y]
+    out_cols = cols[:-2] + ["n", "x_start", "x_end", "ols_slope", "ols_intercept",
+                            "theil_sen_slope", "mk_s", "mk_z", "mk_p", "trend"]
+    d = df[cols].dropna(subset=[x, y])
+    d = d.loc[np.isfinite(d[x].to_numpy(float)) & np.isfinite(d[y].to_numpy(float))]
+    if d.empty:
+        return pd.DataFrame(columns=out_cols)
+
+    d = d.assign(_code=d.groupby(list(by), sort=True).ngroup())
+    sizes = d.groupby("_code")[x].transform("size")
+    d = d.loc[sizes >= min_points]
+    if d.empty:
+        return pd.DataFrame(columns=out_cols)
+
+    keys = d.groupby("_code")[list(by)].first()
+    span = d.groupby("_code")[x].agg(["min", "max"])
+    d = _thin(d[["_code", x, y]], "_code", x, y, MAX_POINTS).sort_values(["_code", x], kind="stable")
+
+    # re-index codes densely (0..k-1) in key order
+    code_index = np.sort(d["_code"].unique())
+    codes = np.searchsorted(code_index, d["_code"].to_numpy())
+    xs = d[x].to_numpy(float)
+    ys = d[y].to_numpy(float)
+    k = code_index.size
+
+    lengths = np.bincount(codes, minlength=k)
+    pairs = float((lengths.astype(float) ** 2).sum())
+    if workers > 1 and pairs >= PARALLEL_MIN_PAIRS and k > 1:
+        res = _parallel(codes, xs, ys, k, lengths, workers)
+    else:
+        res = _trend_arrays(codes, xs, ys, k)
+
+    out = keys.loc[code_index].reset_index(drop=True)
+    out["n"] = res["n"]
+    out["x_start"] = span.loc[code_index, "min"].to_numpy()
+    out["x_end"] = span.loc[code_index, "max"].to_numpy()
+    for name in ("ols_slope", "ols_intercept", "theil_sen_slope", "mk_s", "mk_z", "mk_p"):
+        out[name] = res[name]
+    sig = out["mk_p"] < alpha
+    out["trend"] = np.where(sig & (out["mk_z"] > 0), "increasing",
+                            np.where(sig & (out["mk_z"] < 0), "decreasing", "no_trend"))
+    return out[out_cols]
+
+
+def _parallel(codes, xs, ys, k, lengths, workers) -> Dict[str, np.ndarray]:
+    """Shard contiguous code ranges with roughly equal pair counts across the pool."""
+    cost = np.cumsum(lengths.astype(float) ** 2)
+    bounds = np.searchsorted(cost, cost[-1] * np.arange(1, workers) / workers, side="right")
+    edges = np.unique(np.concatenate(([0], bounds, [k])))
+    row_edges = np.searchsorted(codes, edges)
+    shards = [(codes[r0:r1] - lo, xs[r0:r1], ys[r0:r1], int(hi - lo))
+              for lo, hi, r0, r1 in zip(edges[:-1], edges[1:], row_edges[:-1], row_edges[1:])]
+    for attempt in (1, 2):
+        pool = _get_pool(workers)
+        try:
+            parts = [f.result() for f in [pool.submit(_trend_arrays, *s) for s in shards]]
+            break
+        except BrokenProcessPool:
+            # a worker died (OOM kill, ...); the pool is unusable, build a fresh one once
+            _drop_pool(pool)
+            if attempt == 2:
+                raise
+    return {name: np.concatenate([p[name] for p in parts]) for name in parts[0]}
+
+
+def default_workers() -> int:
+    return max(1, min(4, (os.cpu_count() or 1) - 1))
@@ -0,0 +1,222 @@
+# ewai/waterbody_cache.py
+"""
+Local-first waterbody resolution for uploads.
+
+resolve() tries, in order:
+1. sampling points: every point in the file (normalised with
+   _norm_point_key) is already in public.sampling_points for this client and
+   they all link to the same waterbody -> that waterbody
+2. naming pattern: the filename and sheet names with dates and numbers
+   folded ("Monitoreo La Fe 2024-03.xlsx" -> "monitoreo la fe # #") were
+   resolved before -> the recorded waterbody (public.waterbody_hints)
+3. the LLM resolver (resolve_waterbody); a confident answer is recorded
+   under the pattern
+
+Only answers that did not need confirmation are recorded (a regex fallback
+guess never is), and a recalled answer below CONFIRMED keeps
+needs_confirmation, so a generic name like "Book1.xlsx" cannot turn a guess
+into a silent default.
+
+Both lookups are served from per-process memory after the first query for a
+client (points are re-read after POINT_INDEX_TTL_S, or at once when a persist
+in this process changes them via learn()). Uploads without a client_id only
+use the in-memory pattern cache.
+"""
+from __future__ import annotations
+
+import re
+import threading
+import time
+import unicodedata
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from ewai.db.db_util import _norm_point_key
+from ewai.metrics import REGISTRY
+
+POINT_INDEX_TTL_S = 300.0
+MAX_CLIENTS = 256
+MAX_PATTERNS = 4096
+CONFIDENT = 0.6   # answers at least this sure (and not needing confirmation) are recorded
+CONFIRMED = 0.75  # recalled answers below this still ask the user to confirm
+
+_MONTHS = (
+    "enero febrero marzo abril mayo junio julio agosto septiembre setiembre octubre noviembre diciembre "
+    "ene feb mar abr may jun jul ago sep set oct nov dic "
+    "january february march april june july august september october november december "
+    "jan apr aug dec"
+).split()
+_MONTH_RE = re.compile(r"\b(" + "|".join(sorted(set(_MONTHS), key=len, reverse=True)) + r")\b")
+_EXT_RE = re.compile(r"\.(xlsx|xls|csv)$", re.I)
+
+
+def _fold(s: str) -> str:
+    s = unicodedata.normalize("NFKD", str(s)).encode("ascii", "ignore").decode("ascii").lower()
+    s = _EXT_RE.sub("", s)
+    s = re.sub(r"[^a-z0-9]+", " ", s)
+    s = _MONTH_RE.sub("#", s)
+    s = re.sub(r"\d+", "#", s)
+    s = re.sub(r"#(\s*#)*", "#", s)
+    return " ".join(s.split())
+
+
+def pattern_key(filename: str, sheet_names: Iterable[str]) -> str:
+    """Filename and sheet names with extensions, dates, month names and numbers folded."""
+    sheets = sorted({_fold(s) for s in sheet_names or [] if s})
+    return _fold(filename or "") + " | " + " , ".join(sheets)
+
+
+def learnable(wb: Optional[Dict[str, Any]]) -> bool:
+    """A named answer that did not need confirmation and is at least CONFIDENT."""
+    return bool(
+        wb and wb.get("name") and wb.get("name") != "unknown"
+        and not wb.get("needs_confirmation")
+        and float(wb.get("confidence") or 0.0) >= CONFIDENT
+    )
+
+
+def _client_uuid(client_id: Optional[str]) -> Optional[str]:
+    try:
+        return str(uuid.UUID(str(client_id))) if client_id else None
+    except ValueError:
+        return None
+
+
+class WaterbodyCache:
+    def __init__(self, ttl_s: float = POINT_INDEX_TTL_S):
+        self.ttl_s = ttl_s
+        self._lock = threading.Lock()
+        # client_id -> (loaded_at, {point key: (waterbody_id, name, type)})
+        self._points: "OrderedDict[str, Tuple[float, Dict[str, Tuple[str, str, str]]]]" = OrderedDict()
+        # (client_id, pattern) -> waterbody dict (as resolve_waterbody returns it)
+        self._patterns: "OrderedDict[Tuple[Optional[str], str], Dict[str, Any]]" = OrderedDict()
+
+    # ---- sampling points ----
+    def _point_index(self, conn_factory, client_id: str) -> Dict[str, Tuple[str, str, str]]:
+        with self._lock:
+            hit = self._points.get(client_id)
+            if hit and time.monotonic() - hit[0] < self.ttl_s:
+                self._points.move_to_end(client_id)
+                return hit[1]
+        index: Dict[str, Tuple[str, str, str]] = {}
+        with conn_factory() as conn, conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT sp.code, w.waterbody_id::text, w.name, w.type
+                FROM public.sampling_points sp
+                JOIN public.waterbodies w ON w.waterbody_id = sp.waterbody_id
+                WHERE sp.client_id = %s
+                """,
+                (client_id,),
+            )
+            for code, wid, name, wtype in cur.fetchall():
+                key = _norm_point_key(code)
+                if key:
+                    index[key] = (wid, name, wtype)
+        with self._lock:
+            self._points[client_id] = (time.monotonic(), index)
+            while len(self._points) > MAX_CLIENTS:
+                self._points.popitem(last=False)
+        return index
+
+    def by_points(self, conn_factory, client_id: str, points: Iterable[str]) -> Optional[Dict[str, Any]]:
+        keys = {k for k in (_norm_point_key(p) for p in points or []) if k}
+        if not keys:
+            return None
+        index = self._point_index(conn_factory, client_id)
+        found = {index.get(k) for k in keys}
+        if None in found or len(found) != 1:
+            return None
+        wid, name, wtype = found.pop()
+        return {"name": name, "type": wtype, "confidence": 0.95, "provenance": ["sampling_points"],
+                "needs_confirmation": False, "evidence": [f"{len(keys)} known sampling point(s)"],
+                "waterbody_id": wid}
+
+    # ---- naming pattern ----
+    def by_pattern(self, conn_factory, client_id: Optional[str], pattern: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            wb = self._patterns.get((client_id, pattern))
+            if wb is not None:
+                self._patterns.move_to_end((client_id, pattern))
+                return dict(wb)
+        if client_id is None:
+            return None
+        with conn_factory() as conn, conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT name, type, confidence, waterbody_id::text FROM public.waterbody_hints
+                WHERE client_id = %s AND pattern = %s
+                """,
+                (client_id, pattern),
+            )
+            row = cur.fetchone()
+        if not row:
+            return None
+        wb = {"name": row[0], "type": row[1], "confidence": float(row[2]), "provenance": ["pattern"],
+              "needs_confirmation": float(row[2]) < CONFIRMED,
+              "evidence": [f"earlier uploads named like '{pattern}'"], "waterbody_id": row[3]}
+        self._remember(client_id, pattern, wb)
+        return dict(wb)
+
+    def _remember(self, client_id: Optional[str], pattern: str, wb: Dict[str, Any]) -> None:
+        with self._lock:
+            self._patterns[(client_id, pattern)] = dict(wb)
+            self._patterns.move_to_end((client_id, pattern))
+            while len(self._patterns) > MAX_PATTERNS:
+                self._patterns.popitem(last=False)
+
+    def learn(self, conn, client_id: Optional[str], pattern: Optional[str], wb: Dict[str, Any],
+              waterbody_id: Optional[str] = None) -> None:
+        """
+        Record wb under pattern (memory, and public.waterbody_hints for a known
+        client) on conn if it is trustworthy (see learnable), and drop this
+        client's point index so points just written are seen. Called by the
+        map job for LLM answers and by persist with the stored waterbody.
+        """
+        client_id = _client_uuid(client_id)
+        if client_id:
+            with self._lock:
+                self._points.pop(client_id, None)
+        if not pattern or not learnable(wb):
+            return
+        wb = {**wb, "provenance": ["pattern"], "needs_confirmation": float(wb["confidence"]) < CONFIRMED,
+              "evidence": [f"earlier uploads named like '{pattern}'"]}
+        if waterbody_id:
+            wb["waterbody_id"] = str(waterbody_id)
+        self._remember(client_id, pattern, wb)
+        if client_id:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    INSERT INTO public.waterbody_hints (client_id, pattern, waterbody_id, name, type, confidence)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                    ON CONFLICT (client_id, pattern) DO UPDATE SET
+                      waterbody_id = COALESCE(EXCLUDED.waterbody_id, public.waterbody_hints.waterbody_id),
+                      name = EXCLUDED.name, type = EXCLUDED.type,
+                      confidence = EXCLUDED.confidence, updated_at = now()
+                    """,
+                    (client_id, pattern, wb.get("waterbody_id"), wb["name"], wb.get("type") or "unknown",
+                     min(0.999, float(wb.get("confidence") or 0.0))),
+                )
+
+    # ---- entry point ----
+    def resolve(self, conn_factory, client_id: Optional[str], filename: str, sheet_names: List[str],
+                points: Iterable[str], llm_resolve: Callable[[], Optional[Dict[str, Any]]]) -> Optional[Dict[str, Any]]:
+        """Points, then pattern, then llm_resolve(); the result's "provenance" says which answered."""
+        client_id = _client_uuid(client_id)
+        pattern = pattern_key(filename, sheet_names)
+        wb = self.by_points(conn_factory, client_id, points) if client_id else None
+        source = "sampling_points"
+        if wb is None:
+            wb, source = self.by_pattern(conn_factory, client_id, pattern), "pattern"
+        if wb is None:
+            wb, source = llm_resolve(), "llm"
+            if learnable(wb):
+                with conn_factory() as conn:
+                    self.learn(conn, client_id, pattern, wb)
+        REGISTRY.inc("ewai_waterbody_resolutions_total", source=source)
+        return wb
+
+
+CACHE = WaterbodyCache()
@@ -4,7 +4,7 @@ import json, re, os
 from typing import List, Dict, Any, Tuple
 
 import pandas as pd
-from groq import Groq
+from ewai.llm import DEFAULT_MODEL, LLMUnavailable, chat as llm_chat
 
 WATERBODY_TYPES = ["reservoir","lake","river","lagoon","wetland","canal","unknown"]
 
@@ -93,22 +93,21 @@ def build_snippets(
     }
 
 def call_groq_name_type(snippets: Dict[str, Any]) -> Dict[str, Any]:
-    client = Groq(api_key=_get_secret("GROQ_API_KEY"))
-    model_name = _get_secret("GROQ_MODEL", "llama-3.3-70b-versatile")
+    model_name = _get_secret("GROQ_MODEL", DEFAULT_MODEL)
     user_prompt = (
         "Use these snippets to identify the waterbody:\n\n"
         + json.dumps(snippets, ensure_ascii=False, indent=2)
         + "\n\nReturn STRICT JSON with fields name,type,confidence,evidence."
     )
-    resp = client.chat.completions.create(
+    raw = llm_chat(
+        [{"role":"system","content":SYSTEM_PROMPT},
+         {"role":"user","content":user_prompt}],
+        purpose="waterbody",
         model=model_name,
         temperature=0.0,
         max_tokens=600,
         response_format={"type":"json_object"},
-        messages=[{"role":"system","content":SYSTEM_PROMPT},
-                  {"role":"user","content":user_prompt}]
-    )
-    raw = resp.choices[0].message.content.strip()
+    ).strip()
     j = _coerce_json_obj(raw)
 
     # sanitize
@@ -147,7 +146,11 @@ def fallback_light(snips: Dict[str,Any]) -> Tuple[str,str,float]:
 
 def resolve_waterbody(df: pd.DataFrame, filename: str, sheet_names: List[str]) -> Dict[str, Any]:
     snips = build_snippets(df, filename, sheet_names)
-    llm = call_groq_name_type(snips)
+    try:
+        llm = call_groq_name_type(snips)
+    except LLMUnavailable:
+        # LLM down / circuit open: the regex fallback alone, flagged for confirmation
+        llm = {"name": "unknown", "type": "unknown", "confidence": 0.0, "evidence": []}
     if llm["confidence"] >= 0.6 and llm["name"] != "unknown":
         return {
             "name": llm["name"],
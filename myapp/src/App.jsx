@@ -342,6 +342,7 @@ export default function App() {
     dateFrom, dateTo, selectedPoints, selectedParams, tempUnit,
     setDateFrom, setDateTo, setSelectedPoints, setSelectedParams, setTempUnit,
     datasets, datasetId, setDatasetId,
+    clientId: user?.client_id,
     // NEW: expose so Ingestion/Datasets can refresh immediately
     refreshDatasets,
     setDatasets,
@@ -479,7 +480,7 @@ export default function App() {
       <Route path="/ingestion" element={<ProtectedRoute user={user}><Ingestion /></ProtectedRoute>} />
       <Route path="/datasets" element={<ProtectedRoute user={user}><Datasets /></ProtectedRoute>} />
       <Route path="/parameters" element={<ProtectedRoute user={user}><Parameters /></ProtectedRoute>} />
-      <Route path="/talk2csv" element={<ProtectedRoute user={user}><Talk2Csv /></ProtectedRoute>} />
+      <Route path="/talk2csv" element={<ProtectedRoute user={user}><Talk2Csv user={user} /></ProtectedRoute>} />
       <Route path="*" element={user ? <Navigate to="/" replace /> : <Navigate to="/login" replace />} />
     </Routes>
   )
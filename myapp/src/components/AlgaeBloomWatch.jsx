@@ -1,6 +1,7 @@
 import dayjs from 'dayjs'
-import { useContext, useMemo } from 'react'
+import { useContext, useEffect, useMemo, useState } from 'react'
 import { FiltersContext } from '../utils/filtersContext'
+import { api } from '../utils/api'
 import { BLOOM_RULES, BLOOM_CODES, pickLevelByCode } from '../utils/bloom'
 
 // Fallback labels/units if your BLOOM_RULES doesn't include them
@@ -81,7 +82,36 @@ export default function AlgaeBloomWatch() {
     return { text: `${selectedPointsArr.length} points`, kind: 'many' }
   }, [selectedPointsArr, spById, totalPoints])
 
-  const items = useMemo(() => {
+  // Server-side evaluation over latest_measurement; the row scan below is the fallback
+  const [serverItems, setServerItems] = useState(null)
+  const clientId = ctx?.clientId
+  const datasetId = ctx?.datasetId
+  const pointsKey = selectedPointsArr.join('\u0000')
+  useEffect(() => {
+    let cancelled = false
+    setServerItems(null)
+    if (!clientId || !datasetId) return
+    api.fetchBloom({ clientId, datasetId, points: selectedPointsArr })
+      .then(res => {
+        if (cancelled) return
+        setServerItems((res.items || []).map(it => ({
+          key: it.parameter,
+          label: it.label || LABEL_FALLBACK[it.parameter] || it.parameter,
+          unit: it.unit || UNIT_FALLBACK[it.parameter] || '',
+          value: it.value,
+          when: it.ts ? dayjs(it.ts).format('YYYY-MM-DD HH:mm') : null,
+          point: it.sampling_point ?? null,
+          level: it.level,
+          hint: it.hint,
+        })))
+      })
+      .catch(() => { if (!cancelled) setServerItems(null) })
+    return () => { cancelled = true }
+    // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, [clientId, datasetId, pointsKey])
+
+  const localItems = useMemo(() => {
+    if (serverItems) return null
     return BLOOM_CODES.map(code => {
       const rule = BLOOM_RULES[code] || {}
       const latest = latestByCode(data, code)
@@ -99,7 +129,9 @@ export default function AlgaeBloomWatch() {
         hint: lvl.msg,
       }
     })
-  }, [data])
+  }, [data, serverItems])
+
+  const items = serverItems || localItems
 
   const worst = useMemo(() => {
     const rank = { alert: 3, watch: 2, ok: 1, na: 0 }
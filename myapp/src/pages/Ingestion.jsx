@@ -66,7 +66,7 @@ export default function Ingestion() {
 
     setError(''); setBusy(true)
     try {
-      const res = await api.ingestMap(useFile, useSheet)
+      const res = await api.ingestMap(useFile, useSheet, user?.client_id || user?.clientId)
       setPreview(res)
       setSessionId(res.session_id)
       setSheetsFound(res.availableSheets || [])
@@ -11,7 +11,7 @@ import {
   ScatterChart, Scatter
 } from 'recharts'
 
-export default function Talk2Csv() {
+export default function Talk2Csv({ user }) {
   const [messages, setMessages] = useState([
     { role: 'assistant', content: 'Hi! Ask me about your data. I can run read-only SQL and draw charts.' }
   ])
@@ -28,7 +28,7 @@ export default function Talk2Csv() {
     setInput('')
     setBusy(true)
     try {
-      const res = await api.assistantChat([...messages, userTurn])
+      const res = await api.assistantChat([...messages, userTurn], 300, user?.client_id)
       const assistantTurn = {
         role: 'assistant',
         content: res.answer || '(no answer)',
@@ -16,6 +16,18 @@ async function http(method, path, body, isForm = false) {
   return data;
 }
 
+// Ingest endpoints answer 202 {job_id}; poll /jobs/<id> until the job finishes.
+async function waitForJob(jobId, { clientId, onProgress, intervalMs = 1000 } = {}) {
+  const q = clientId ? `?client_id=${encodeURIComponent(clientId)}` : "";
+  for (;;) {
+    const job = await http("GET", `/jobs/${encodeURIComponent(jobId)}${q}`);
+    if (onProgress) onProgress(job);
+    if (job.status === "done") return job.result;
+    if (job.status === "failed") throw new Error(job.error || "ingest job failed");
+    await new Promise((r) => setTimeout(r, intervalMs));
+  }
+}
+
 async function handle(r) {
   const text = await r.text();
   if (!r.ok) {
@@ -25,6 +37,8 @@ async function handle(r) {
   try { return JSON.parse(text) } catch { throw new Error(text || 'Bad JSON') }
 }
 
+export { waitForJob };
+
 export const api = {
   login: (email, password) => http("POST", "/auth/login", { email, password }),
   
@@ -49,10 +63,103 @@ export const api = {
       `/analytics/correlation?client_id=${encodeURIComponent(clientId)}&dataset_id=${encodeURIComponent(datasetId)}&method=${method}`
     ),
 
+  fetchLaggedCorrelation: ({ clientId, datasetId, maxLag = 52, interval = "week", params: codes, point, curves }) => {
+    const params = new URLSearchParams();
+    params.set("client_id", clientId);
+    params.set("dataset_id", datasetId);
+    params.set("max_lag", String(maxLag));
+    params.set("interval", interval);
+    if (codes && codes.length) params.set("params", codes.join(","));
+    if (point) params.set("point", point);
+    if (curves) params.set("curves", "1");
+    return http("GET", `/analytics/lagged_correlation?${params.toString()}`);
+  },
   fetchAnomalies: ({ clientId, datasetId }) =>
     http("GET",
       `/analytics/anomalies?client_id=${encodeURIComponent(clientId)}&dataset_id=${encodeURIComponent(datasetId)}`
     ),
+
+  // server-side time buckets: interval = hour|day|week|month|season|year
+  fetchAggregate: ({ clientId, datasetId, interval = "day", stats, parameter, point, from, to }) => {
+    const params = new URLSearchParams();
+    params.set("client_id", clientId);
+    params.set("dataset_id", datasetId);
+    params.set("interval", interval);
+    if (stats) params.set("stats", Array.isArray(stats) ? stats.join(",") : stats);
+    if (parameter) params.set("parameter", parameter);
+    if (point) params.set("point", point);
+    if (from) params.set("from", from);
+    if (to) params.set("to", to);
+    return http("GET", `/analytics/aggregate?${params.toString()}`);
+  },
+
+  fetchPivot: ({ clientId, datasetId, params: codes, interval = "day", point, from, to, complete, sample, maxRows, seed }) => {
+    const params = new URLSearchParams();
+    params.set("client_id", clientId);
+    params.set("dataset_id", datasetId);
+    params.set("params", (codes || []).join(","));
+    params.set("interval", interval);
+    if (point) params.set("point", point);
+    if (from) params.set("from", from);
+    if (to) params.set("to", to);
+    if (complete) params.set("complete", "1");
+    if (sample) params.set("sample", sample);
+    if (maxRows) params.set("max_rows", String(maxRows));
+    if (seed != null) params.set("seed", String(seed));
+    return http("GET", `/analytics/pivot?${params.toString()}`);
+  },
+
+  fetchQuantiles: ({ clientId, datasetId, q, by = "parameter", parameter, point }) => {
+    const params = new URLSearchParams();
+    params.set("client_id", clientId);
+    params.set("dataset_id", datasetId);
+    params.set("by", by);
+    if (q && q.length) params.set("q", q.join(","));
+    if (parameter) params.set("parameter", parameter);
+    if (point) params.set("point", point);
+    return http("GET", `/analytics/quantiles?${params.toString()}`);
+  },
+
+  fetchDistribution: ({ clientId, datasetId, parameter, point, bins = 30, scale = "linear", from, to }) => {
+    const params = new URLSearchParams();
+    params.set("client_id", clientId);
+    params.set("dataset_id", datasetId);
+    params.set("parameter", parameter);
+    params.set("bins", String(bins));
+    params.set("scale", scale);
+    if (point) params.set("point", point);
+    if (from) params.set("from", from);
+    if (to) params.set("to", to);
+    return http("GET", `/analytics/distribution?${params.toString()}`);
+  },
+
+  fetchTrends: ({ clientId, datasetId, parameter, point, minPoints, alpha }) => {
+    const params = new URLSearchParams();
+    params.set("client_id", clientId);
+    params.set("dataset_id", datasetId);
+    if (parameter) params.set("parameter", parameter);
+    if (point) params.set("point", point);
+    if (minPoints) params.set("min_points", String(minPoints));
+    if (alpha) params.set("alpha", String(alpha));
+    return http("GET", `/analytics/trends?${params.toString()}`);
+  },
+
+  fetchBloom: ({ clientId, datasetId, points }) => {
+    const params = new URLSearchParams();
+    params.set("client_id", clientId);
+    params.set("dataset_id", datasetId);
+    for (const p of points || []) params.append("point", p);
+    return http("GET", `/analytics/bloom?${params.toString()}`);
+  },
+
+  // bbox: [minLon, minLat, maxLon, maxLat]
+  fetchSamplingPoints: ({ clientId, datasetId, bbox }) => {
+    const params = new URLSearchParams();
+    params.set("client_id", clientId);
+    if (datasetId) params.set("dataset_id", datasetId);
+    if (bbox) params.set("bbox", bbox.join(","));
+    return http("GET", `/sampling_points?${params.toString()}`);
+  },
  deleteDataset: ({ clientId, datasetId }) =>
     http("DELETE", `/datasets/${encodeURIComponent(datasetId)}?client_id=${encodeURIComponent(clientId)}`),
  ingestSheets: (file) => {
@@ -61,11 +168,13 @@ export const api = {
     return http("POST", "/ingest/sheets", form, true);
   },
   // ingestion endpoints already in your project (kept for completeness)
-  ingestMap: (file, sheet) => {
+  ingestMap: async (file, sheet, clientId, onProgress) => {
     const form = new FormData();
     form.append("file", file);
     if (sheet) form.append("sheet", sheet);
-    return http("POST", "/ingest/map", form, true);
+    if (clientId) form.append("client_id", clientId);
+    const { job_id } = await http("POST", "/ingest/map", form, true);
+    return waitForJob(job_id, { clientId, onProgress });
   },
    // NEW: apply units to columns in current session
   ingestOverrideUnits: ({ sessionId, overrides }) =>
@@ -78,6 +187,7 @@ export const api = {
     useContentHash = true, valueQualifier = "", email,
     mode = "new",             // "new" | "append_auto" | "append_to"
     targetDatasetId = null,   // required if mode === "append_to"
+    onProgress,
   }) =>
     http("POST", "/ingest/persist", {
       client_id: clientId,
@@ -89,13 +199,13 @@ export const api = {
       email,
       mode,
       target_dataset_id: targetDatasetId,
-    }),
+    }).then(({ job_id }) => waitForJob(job_id, { clientId, onProgress })),
   assistantSchema: () => fetch(`${API_BASE}/assistant/schema`).then(handle),
-  assistantChat: (messages, limit = 300) =>
+  assistantChat: (messages, limit = 300, clientId) =>
     fetch(`${API_BASE}/assistant/chat`, {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify({ messages, limit }),
+      body: JSON.stringify({ messages, limit, client_id: clientId }),
     }).then(handle),
 };
   
@@ -1,12 +1,13 @@
 from __future__ import annotations
 
-import os, sys, io, json, re, uuid, hashlib, traceback, decimal
+import os, sys, io, json, re, uuid, traceback, decimal, math, pickle, time, logging, contextvars
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Dict, List, Optional, Tuple
-from datetime import date, datetime
 import re
 
-from flask import Flask, request, jsonify, make_response
+from flask import Flask, request, make_response, g
 
+import numpy as np
 import pandas as pd
 import psycopg2
 import psycopg2.extras as pgx
@@ -29,20 +30,49 @@ from ewai.db.db_util import (
     register_dataset, melt_harmonized, insert_measurements,
     CONTROLLED_META_VOCAB, CONTROLLED_UNIT_VOCAB,
     upsert_parameters_for_codes, upsert_non_params_for_cols,
+    bump_data_version,
 )
 from ewai.unit_convertor import convert_series
 from ewai.waterbody_llm_resolver import resolve_waterbody
+from ewai.trends import series_trends, default_workers
+from ewai.geo import parse_bbox, bbox_prefixes
+from ewai.tdigest import TDigest
+from ewai.lagcorr import lagged_correlation, best_lags, MAX_LAG_CAP
+from ewai import header_rules, llm, metrics, waterbody_cache
+from ewai.llm_admission import SharedScheduler
+from ewai.metrics import stage
+from ewai.bloom import BLOOM_RULES, BLOOM_CODES, pick_level, worst_level, level_to_safety
 from ewai.auth.local_auth import login_local  # ensure this exists (see file below)
 
 from config import Settings
 from utils import allowed_file, json_error, content_sha256, clamp_preview
+from http_cache import DatasetCache
+from responses import json_response, compress_response, dumps
+import jobs
+from jobs import JobError
+import profiling
+from ratelimit import RateLimiter
 
 # ===== App =====
 settings = Settings()
+llm.set_provider(llm.build(settings.llm_mode, settings.llm_cassette_dir))
+llm.set_policy(
+    llm.Policy(settings.llm_timeout_s, settings.llm_budget_s, settings.llm_retries),
+    llm.CircuitBreaker(settings.llm_breaker_failures, settings.llm_breaker_reset_s),
+    SharedScheduler(get_connection, settings.llm_concurrency),
+)
+rate_limiter = RateLimiter({
+    "chat": (settings.rate_chat_per_min, settings.rate_chat_burst),
+    "ingest": (settings.rate_ingest_per_min, settings.rate_ingest_burst),
+}, settings.rate_addr_factor)
 ALLOWED_ORIGINS = set(settings.cors_origins)
 
 app = Flask(__name__)
 app.config["MAX_CONTENT_LENGTH"] = settings.max_upload_mb * 1024 * 1024
+dataset_cache = DatasetCache(
+    max_bytes=settings.response_cache_mb * 1024 * 1024,
+    max_age=settings.cache_max_age,
+)
 _UNIT_IN_BRACKETS = re.compile(r"\s*\[[^\]]+\]\s*$")
 # ---- Precise CORS (manual, no Flask-CORS) ----
 def _normalize_origin(o: str | None) -> str | None:
@@ -59,7 +89,7 @@ def _handle_preflight():
         resp = make_response("", 200)
         if origin and origin in ALLOWED_ORIGINS:
             resp.headers["Access-Control-Allow-Origin"] = origin_raw  # echo exactly
-            resp.headers["Vary"] = "Origin"
+            resp.vary.add("Origin")
         resp.headers["Access-Control-Allow-Methods"] = "GET,POST,PUT,DELETE,OPTIONS"
         resp.headers["Access-Control-Allow-Headers"] = "Content-Type,Authorization"
         return resp
@@ -84,22 +114,30 @@ def _detect_header_index(df_noheader: pd.DataFrame, scan_rows: int = 30) -> int:
 def _read_table_with_header_detection(raw: bytes, filename: str, sheet: Optional[str]):
     is_excel = filename.lower().endswith((".xlsx", ".xls"))
     if is_excel:
-        xls = pd.ExcelFile(io.BytesIO(raw))
-        if not sheet:
-            sheet = xls.sheet_names[0]
-        # first pass: no header
-        df0 = pd.read_excel(xls, sheet_name=sheet, header=None)
-        hdr = _detect_header_index(df0)
+        with stage("read", nbytes=len(raw)) as st:
+            xls = pd.ExcelFile(io.BytesIO(raw))
+            if not sheet:
+                sheet = xls.sheet_names[0]
+            # first pass: no header
+            df0 = pd.read_excel(xls, sheet_name=sheet, header=None)
+            st.rows = len(df0)
+        with stage("header_detection", rows=min(30, len(df0))):
+            hdr = _detect_header_index(df0)
         # second pass: with detected header index
-        df  = pd.read_excel(xls, sheet_name=sheet, header=hdr)
+        with stage("read"):
+            df  = pd.read_excel(xls, sheet_name=sheet, header=hdr)
         return df, xls.sheet_names, sheet
     else:
         # CSV
         buf = io.BytesIO(raw)
-        df0 = pd.read_csv(buf, header=None)
-        hdr = _detect_header_index(df0)
+        with stage("read", nbytes=len(raw)) as st:
+            df0 = pd.read_csv(buf, header=None)
+            st.rows = len(df0)
+        with stage("header_detection", rows=min(30, len(df0))):
+            hdr = _detect_header_index(df0)
         buf.seek(0)
-        df  = pd.read_csv(buf, header=hdr)
+        with stage("read"):
+            df  = pd.read_csv(buf, header=hdr)
         return df, ["csv"], None
 @app.after_request
 def _add_cors_headers(resp):
@@ -107,10 +145,57 @@ def _add_cors_headers(resp):
     origin = _normalize_origin(origin_raw)
     if origin and origin in ALLOWED_ORIGINS:
         resp.headers["Access-Control-Allow-Origin"] = origin_raw  # echo exactly
-        resp.headers["Vary"] = "Origin"
+        resp.vary.add("Origin")
     resp.headers.setdefault("Access-Control-Allow-Methods", "GET,POST,PUT,DELETE,OPTIONS")
     resp.headers.setdefault("Access-Control-Allow-Headers", "Content-Type,Authorization")
     return resp
+
+@app.after_request
+def _compress(resp):
+    return compress_response(resp, request.headers.get("Accept-Encoding"), settings.compress_min_bytes)
+
+profiler = profiling.from_settings(settings)
+profiler.install(app)
+
+# ---- Request metrics (ewai/metrics.py; exported on /metrics) ----
+request_log = logging.getLogger("ewai.requests")
+_METRICS_DUMP_EVERY_S = 10.0
+_last_metrics_dump = 0.0
+
+@app.before_request
+def _metrics_begin():
+    g.metrics_stats, g.metrics_token = metrics.begin_scope()
+
+@app.after_request
+def _metrics_finish(resp):
+    global _last_metrics_dump
+    stats = g.pop("metrics_stats", None)
+    if stats is None:  # preflight answered before the scope started
+        return resp
+    metrics.end_scope(g.pop("metrics_token"))
+    endpoint = request.url_rule.rule if request.url_rule else "<unmatched>"
+    elapsed = stats.elapsed
+    metrics.REGISTRY.observe("ewai_http_request_seconds", elapsed, method=request.method,
+                             endpoint=endpoint, status=str(resp.status_code))
+    metrics.REGISTRY.observe("ewai_http_request_queries", stats.queries, metrics.COUNT_BUCKETS,
+                             method=request.method, endpoint=endpoint)
+    metrics.REGISTRY.observe("ewai_http_request_query_seconds", stats.query_s,
+                             method=request.method, endpoint=endpoint)
+    if elapsed * 1000 >= settings.slow_request_ms:
+        request_log.warning(dumps({
+            "event": "slow_request", "method": request.method, "path": request.path,
+            "endpoint": endpoint, "status": resp.status_code,
+            "bytes_in": request.content_length or 0, "bytes_out": resp.calculate_content_length(),
+            **stats.summary(),
+        }).decode())
+    now = time.monotonic()
+    if settings.metrics_dir and now - _last_metrics_dump >= _METRICS_DUMP_EVERY_S:
+        _last_metrics_dump = now
+        try:
+            metrics.dump(settings.metrics_dir)
+        except OSError:
+            traceback.print_exc()
+    return resp
 # -----------------------------------------------
 
 # ---------- LLM header mapping helpers ----------
@@ -179,7 +264,7 @@ PARAM_VOCAB:
 META_VOCAB:
 {meta_vocab}
 
-CONTROLLED_UNIT_VOCAB (allowed units per parameter):
+CONTROLLED_UNIT_VOCAB (allowed units per parameter; for a map_to not listed here, copy the unit text from the header):
 {unit_vocab}
 
 Return EXACTLY {n_headers} objects, in the SAME ORDER as the given headers:
@@ -223,49 +308,165 @@ def _norm_col(s: str) -> str:
     s = re.sub(r"\s+", " ", str(s))
     return s.strip()
 
-def _groq_client():
-    from groq import Groq
-    key = os.getenv("GROQ_API_KEY")
-    if not key:
-        raise RuntimeError("GROQ_API_KEY not set")
-    return Groq(api_key=key)
+# completion budget for header mapping: one JSON object (~100 tokens) per header
+MAP_BASE_TOKENS = 256
+MAP_TOKENS_PER_HEADER = 160
+MAP_MAX_TOKENS = 20000
+llm_log = logging.getLogger("ewai.llm")
 
-def call_groq_map_headers(headers: List[str]) -> List[Dict[str, Any]]:
-    client = _groq_client()
-    model_name = os.getenv("GROQ_MODEL", "llama-3.3-70b-versatile")
-    CONTROLLED_PARAM_VOCAB = list(CONTROLLED_UNIT_VOCAB.keys())
+def _compact(obj: Any) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+def _map_chunk(headers: List[str]) -> List[Dict[str, Any]]:
+    """One mapping call; the prompt lists only the parameter codes the chunk's headers may need."""
+    likely, covered = header_rules.param_subset(headers)
     user_prompt = USER_PROMPT_TEMPLATE.format(
-        param_vocab=json.dumps(CONTROLLED_PARAM_VOCAB, ensure_ascii=False),
-        meta_vocab=json.dumps(CONTROLLED_META_VOCAB, ensure_ascii=False),
-        unit_vocab=json.dumps(CONTROLLED_UNIT_VOCAB, ensure_ascii=False),
+        param_vocab=_compact(likely if covered else list(CONTROLLED_UNIT_VOCAB)),
+        meta_vocab=_compact(CONTROLLED_META_VOCAB),
+        unit_vocab=_compact({code: CONTROLLED_UNIT_VOCAB[code] for code in likely}),
         unit_not_present=UNIT_NOT_PRESENT,
         n_headers=len(headers),
-        headers_json=json.dumps(headers, ensure_ascii=False),
-    )
-    resp = client.chat.completions.create(
-        model=model_name,
-        temperature=0.0,
-        max_tokens=20000,
-        response_format={"type": "json_object"},
-        messages=[{"role":"system","content":SYSTEM_PROMPT},
-                  {"role":"user","content":user_prompt}],
+        headers_json=_compact(headers),
     )
-    arr = _coerce_json_array(resp.choices[0].message.content.strip())
-    if not arr:
-        arr = [{"raw_header": h, "map_to": "unknown", "unit_map_to": UNIT_NOT_PRESENT,
-                "confidence": 0.0, "unit_confidence": 0.0} for h in headers]
-    return arr
+    try:
+        content = llm.chat(
+            [{"role":"system","content":SYSTEM_PROMPT},
+             {"role":"user","content":user_prompt}],
+            purpose="header_mapping",
+            temperature=0.0,
+            max_tokens=min(MAP_MAX_TOKENS, MAP_BASE_TOKENS + MAP_TOKENS_PER_HEADER * len(headers)),
+            response_format={"type": "json_object"},
+        )
+    except llm.LLMUnavailable as e:
+        llm_log.warning(dumps({"event": "llm_fallback", "purpose": "header_mapping",
+                               "headers": len(headers), "error": str(e)}).decode())
+        return header_rules.map_headers(headers)
+    return [item for item in _coerce_json_array(content.strip()) if isinstance(item, dict)]
 
-# In-memory session cache for /ingest/map → /ingest/persist
-SESSION_CACHE: Dict[str, Dict[str, Any]] = {}
+def call_groq_map_headers(headers: List[str]) -> List[Dict[str, Any]]:
+    """
+    Wide sheets are mapped in chunks of settings.llm_map_chunk headers,
+    settings.llm_map_parallel at a time, and reassembled in header order.
+    Headers the model skipped (or an unparsable reply) get the rule-based mapping.
+    """
+    size = max(1, settings.llm_map_chunk)
+    chunks = [headers[i:i + size] for i in range(0, len(headers), size)]
+    if len(chunks) <= 1:
+        results = [_map_chunk(c) for c in chunks]
+    else:
+        with ThreadPoolExecutor(max_workers=max(1, min(len(chunks), settings.llm_map_parallel))) as ex:
+            # copy the context per chunk so the job's LLM client (llm.for_client) carries over
+            futures = [ex.submit(contextvars.copy_context().run, _map_chunk, c) for c in chunks]
+            results = [f.result() for f in futures]
+
+    by_header: Dict[str, Dict[str, Any]] = {}
+    for item in (item for chunk in results for item in chunk):
+        by_header.setdefault(_norm_col(str(item.get("raw_header", ""))), item)
+    out = []
+    for h in headers:
+        item = by_header.get(_norm_col(h)) or header_rules.map_header(h)
+        code = str(item.get("map_to", ""))
+        # codes outside the chunk's unit vocabulary: read the unit off the header locally
+        if code in CONTROLLED_UNIT_VOCAB and item.get("unit_map_to") not in (
+                *CONTROLLED_UNIT_VOCAB[code], "unknown", UNIT_NOT_PRESENT):
+            item = {**item, "unit_map_to": header_rules.unit_for(code, h)}
+        out.append(item)
+    return out
+
+# /ingest/map → /ingest/persist sessions live in public.ingest_sessions so the
+# web process and the job workers see the same (latest) state
+SESSION_TTL_HOURS = 24
+
+
+def _save_session(session_id: str, sess: Dict[str, Any]) -> None:
+    jobs.ensure_tables()
+    with stage("session_save") as st:
+        data = pickle.dumps(sess, protocol=pickle.HIGHEST_PROTOCOL)
+        st.bytes = len(data)
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "DELETE FROM public.ingest_sessions WHERE created_at < now() - make_interval(hours => %s)",
+                (SESSION_TTL_HOURS,),
+            )
+            cur.execute(
+                """
+                INSERT INTO public.ingest_sessions (session_id, data) VALUES (%s, %s)
+                ON CONFLICT (session_id) DO UPDATE SET data = EXCLUDED.data
+                """,
+                (session_id, psycopg2.Binary(data)),
+            )
+
+
+def _load_session(session_id: Optional[str]) -> Optional[Dict[str, Any]]:
+    try:
+        uuid.UUID(str(session_id))
+    except ValueError:
+        return None
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT data FROM public.ingest_sessions WHERE session_id = %s", (session_id,))
+            row = cur.fetchone()
+    return pickle.loads(bytes(row[0])) if row else None
+
+
+def _job_accepted(job_id: str):
+    """202 for a queued job; starts the in-process worker pool on first use."""
+    if settings.job_workers > 0:
+        jobs.start_workers(settings.job_workers, settings.job_client_concurrency)
+    resp = json_response({"job_id": job_id, "status": "queued"}, status=202)
+    resp.headers["Location"] = f"/jobs/{job_id}"
+    return resp
 
 # ===================================================
 # Routes
 # ===================================================
 
+@app.get("/metrics")
+def metrics_endpoint():
+    """Prometheus text exposition: this process plus the processes sharing METRICS_DIR."""
+    gauges = []
+    try:
+        # the shared LLM queue, read once here instead of summed over per-process snapshots
+        for purpose, (waiting, running) in sorted(llm.queue_depth().items()):
+            gauges.append(("ewai_llm_queue_depth", {"purpose": purpose}, waiting))
+            gauges.append(("ewai_llm_in_flight", {"purpose": purpose}, running))
+    except Exception:
+        traceback.print_exc()
+    resp = make_response(metrics.render(settings.metrics_dir, gauges))
+    resp.headers["Content-Type"] = "text/plain; version=0.0.4; charset=utf-8"
+    return resp
+
+@app.get("/debug/profiles")
+def debug_profiles():
+    """Saved profiles, newest first. Needs the X-Profile admin token."""
+    if not profiler.authorized(request):
+        return json_error("not found", 404)
+    return json_response({"profiles": profiler.list()})
+
+@app.get("/debug/profiles/<name>")
+def debug_profile(name):
+    """?format=prof (default) is the pstats dump for snakeviz/pstats; ?format=text the top functions."""
+    if not profiler.authorized(request):
+        return json_error("not found", 404)
+    fmt = request.args.get("format", "prof")
+    path = profiler.path(name, ".json" if fmt == "text" else ".prof")
+    if not path:
+        return json_error("profile not found", 404)
+    with open(path, "rb") as fh:
+        body = fh.read()
+    if fmt == "text":
+        resp = make_response(json.loads(body).get("top", ""))
+        resp.headers["Content-Type"] = "text/plain; charset=utf-8"
+    else:
+        resp = make_response(body)
+        resp.headers["Content-Type"] = "application/octet-stream"
+        resp.headers["Content-Disposition"] = f'attachment; filename="{name}.prof"'
+    return resp
+
 @app.get("/health")
 def health():
-    return jsonify({"ok": True})
+    return json_response({"ok": True})
 
 @app.post("/auth/login")
 def auth_login():
@@ -294,7 +495,7 @@ def auth_login():
             # 3) Upsert (by client_id) so name is set and row exists
             ensure_client(conn, client_id=client_id, email=email, display_name=email.split("@")[0])
 
-        return jsonify({"client_id": client_id, "email": email})
+        return json_response({"client_id": client_id, "email": email})
     except Exception as e:
         traceback.print_exc()
         return json_error(str(e), 500)
@@ -316,13 +517,13 @@ def ingest_sheets():
         is_excel = f.filename.lower().endswith((".xlsx", ".xls"))
         if is_excel:
             xls = pd.ExcelFile(io.BytesIO(raw))
-            return jsonify({
+            return json_response({
                 "kind": "excel",
                 "available_sheets": xls.sheet_names or []
             })
         else:
             # treat as CSV (single logical sheet)
-            return jsonify({
+            return json_response({
                 "kind": "csv",
                 "available_sheets": ["csv"]
             })
@@ -340,7 +541,7 @@ def ingest_override_units():
         data = request.get_json(force=True) or {}
         sid = data.get("session_id")
         overrides = data.get("overrides") or []
-        sess = SESSION_CACHE.get(sid)
+        sess = _load_session(sid)
         if not sess:
             return json_error("invalid session_id", 400)
 
@@ -360,9 +561,10 @@ def ingest_override_units():
         if rename_map:
             df_h = df_h.rename(columns=rename_map)
             sess["df_h"] = df_h
+            _save_session(sid, sess)
 
         preview = clamp_preview(df_h, rows=20, cols=30)
-        return jsonify({
+        return json_response({
             "columns": list(df_h.columns.astype(str)),
             "preview": preview,
             "row_count": int(len(df_h)),
@@ -372,7 +574,12 @@ def ingest_override_units():
         traceback.print_exc()
         return json_error(str(e), 500)
 @app.post("/ingest/map")
+@rate_limiter.limit("ingest")
 def ingest_map():
+    """
+    Queue header mapping for an upload; 202 {job_id}. Poll /jobs/<job_id>:
+    the result is the mapping preview with its session_id.
+    """
     try:
         if "file" not in request.files:
             return json_error("missing file", 400)
@@ -385,134 +592,157 @@ def ingest_map():
         if not raw:
             return json_error("empty upload", 400)
 
-        # ---- ONLY CHANGE STARTS HERE ----
-        try:
-            df, available_sheets, sheet_name = _read_table_with_header_detection(raw, f.filename, sheet)
-        except Exception as e:
-            traceback.print_exc()
-            return json_error(str(e), 400)
-        # ---- ONLY CHANGE ENDS HERE ----
-
-        if df is None or df.empty:
-            return json_error("empty dataframe", 400)
+        client_id = request.form.get("client_id") or None
+        params = {"filename": f.filename, "sheet": sheet, "client_id": client_id}
+        job_id = jobs.enqueue(client_id, "map", params, payload=raw, profile=profiling.profiled_request())
+        return _job_accepted(job_id)
+    except Exception as e:
+        traceback.print_exc()
+        return json_error(str(e), 500)
 
-        headers = [str(c) for c in df.columns.tolist()]
-        mapping = call_groq_map_headers(headers)
 
-        # Build harmonized wide df
-        norm_index = {_norm_col(c): c for c in df.columns}
-        param_set = set(CONTROLLED_UNIT_VOCAB.keys())
-        meta_set = set(CONTROLLED_META_VOCAB)
+@jobs.register("map")
+def _map_job(params: Dict[str, Any], raw: bytes, progress) -> Dict[str, Any]:
+    filename = params["filename"]
+    sheet = params.get("sheet")
+    progress("reading", bytes=len(raw))
+    try:
+        df, available_sheets, sheet_name = _read_table_with_header_detection(raw, filename, sheet)
+    except Exception as e:
+        traceback.print_exc()
+        raise JobError(str(e), 400)
 
-        meta_src, meta_names = [], []
-        param_src, param_labels = [], []
-        used_src = set()
+    if df is None or df.empty:
+        raise JobError("empty dataframe", 400)
 
-        for item in mapping:
-            raw_display = str(item.get("raw_header", ""))
-            src = norm_index.get(_norm_col(raw_display))
-            if src is None or src in used_src:
-                continue
-            used_src.add(src)
-            mapped = str(item.get("map_to", "unknown")).strip()
-            unit_mapped = str(item.get("unit_map_to", UNIT_NOT_PRESENT)).strip()
-
-            if mapped in meta_set:
-                meta_src.append(src)
-                meta_names.append(mapped)
-            elif mapped in param_set:
-                label = mapped if unit_mapped in ("unknown", UNIT_NOT_PRESENT) else f"{mapped} [{unit_mapped}]"
-                param_src.append(src)
-                param_labels.append(label)
-
-        ordered_src = meta_src + param_src
-        df_h = df[ordered_src].copy() if ordered_src else pd.DataFrame()
-
-        # Unit conversions toward standard
-        final_names: List[str] = []
-        for src, label in zip(meta_src, meta_names):
-            final_names.append(label)
-
-        for i, src in enumerate(param_src):
-            label = param_labels[i]
-            if " [" in label and label.endswith("]"):
-                param = label.split(" [", 1)[0]
-                from_unit = label.split(" [", 1)[1][:-1]
-            else:
-                param = label
-                from_unit = UNIT_NOT_PRESENT
-            if from_unit not in ("unknown", UNIT_NOT_PRESENT):
-                series_converted, unit_to, did_convert = convert_series(param, from_unit, df_h[src])
-                if did_convert:
-                    df_h[src] = series_converted
-                    label = f"{param} [{unit_to}]"
-            final_names.append(label)
-
-        # uniqueify
-        seen: Dict[str, int] = {}
-        def uniq(n: str) -> str:
-            if n in seen:
-                seen[n] += 1
-                return f"{n} ({seen[n]})"
-            seen[n] = 0
-            return n
-
-        final_names = [uniq(n) for n in final_names]
-        rename_map = {src: new for src, new in zip(ordered_src, final_names)}
-        if rename_map:
-            df_h.rename(columns=rename_map, inplace=True)
-
-        # Sampling points df
-        if "sampling_point" in df_h.columns:
-            df_sampling = (
-                df_h[["sampling_point"]]
-                .dropna()
-                .assign(sampling_point=lambda d: d["sampling_point"].astype(str).str.strip())
-                .loc[lambda d: d["sampling_point"] != ""]
-                .drop_duplicates()
-                .reset_index(drop=True)
-            )
-            sampling_points = df_sampling["sampling_point"].tolist()
+    progress("mapping", rows_read=int(len(df)), columns=int(df.shape[1]))
+    headers = [str(c) for c in df.columns.tolist()]
+    with stage("llm_mapping", rows=len(headers)):
+        mapping = call_groq_map_headers(headers)
+    rule_mapped = sum(1 for item in mapping if item.get("source") == "rules")
+
+    # Build harmonized wide df
+    norm_index = {_norm_col(c): c for c in df.columns}
+    param_set = set(CONTROLLED_UNIT_VOCAB.keys())
+    meta_set = set(CONTROLLED_META_VOCAB)
+
+    meta_src, meta_names = [], []
+    param_src, param_labels = [], []
+    used_src = set()
+
+    for item in mapping:
+        raw_display = str(item.get("raw_header", ""))
+        src = norm_index.get(_norm_col(raw_display))
+        if src is None or src in used_src:
+            continue
+        used_src.add(src)
+        mapped = str(item.get("map_to", "unknown")).strip()
+        unit_mapped = str(item.get("unit_map_to", UNIT_NOT_PRESENT)).strip()
+
+        if mapped in meta_set:
+            meta_src.append(src)
+            meta_names.append(mapped)
+        elif mapped in param_set:
+            label = mapped if unit_mapped in ("unknown", UNIT_NOT_PRESENT) else f"{mapped} [{unit_mapped}]"
+            param_src.append(src)
+            param_labels.append(label)
+
+    ordered_src = meta_src + param_src
+    df_h = df[ordered_src].copy() if ordered_src else pd.DataFrame()
+
+    # Unit conversions toward standard
+    final_names: List[str] = []
+    for src, label in zip(meta_src, meta_names):
+        final_names.append(label)
+
+    progress("converting", columns_mapped=len(ordered_src))
+    values_converted = 0
+    for i, src in enumerate(param_src):
+        label = param_labels[i]
+        if " [" in label and label.endswith("]"):
+            param = label.split(" [", 1)[0]
+            from_unit = label.split(" [", 1)[1][:-1]
         else:
-            df_sampling = pd.DataFrame({"sampling_point": []})
-            sampling_points = []
+            param = label
+            from_unit = UNIT_NOT_PRESENT
+        if from_unit not in ("unknown", UNIT_NOT_PRESENT):
+            with stage("conversion", rows=len(df_h)):
+                series_converted, unit_to, did_convert = convert_series(param, from_unit, df_h[src])
+            if did_convert:
+                df_h[src] = series_converted
+                label = f"{param} [{unit_to}]"
+                values_converted += int(series_converted.notna().sum())
+        final_names.append(label)
+
+    # uniqueify
+    seen: Dict[str, int] = {}
+    def uniq(n: str) -> str:
+        if n in seen:
+            seen[n] += 1
+            return f"{n} ({seen[n]})"
+        seen[n] = 0
+        return n
+
+    final_names = [uniq(n) for n in final_names]
+    rename_map = {src: new for src, new in zip(ordered_src, final_names)}
+    if rename_map:
+        df_h.rename(columns=rename_map, inplace=True)
+
+    # Sampling points df
+    if "sampling_point" in df_h.columns:
+        df_sampling = (
+            df_h[["sampling_point"]]
+            .dropna()
+            .assign(sampling_point=lambda d: d["sampling_point"].astype(str).str.strip())
+            .loc[lambda d: d["sampling_point"] != ""]
+            .drop_duplicates()
+            .reset_index(drop=True)
+        )
+        sampling_points = df_sampling["sampling_point"].tolist()
+    else:
+        df_sampling = pd.DataFrame({"sampling_point": []})
+        sampling_points = []
 
-        try:
-            is_excel = f.filename.lower().endswith((".xlsx", ".xls"))
-            waterbody = resolve_waterbody(
-                df=df,
-                filename=f.filename,
-                sheet_names=[sheet_name] if (is_excel and sheet_name) else ["csv"]
+    progress("waterbody", values_converted=values_converted)
+    is_excel = filename.lower().endswith((".xlsx", ".xls"))
+    wb_sheets = [sheet_name] if (is_excel and sheet_name) else ["csv"]
+    try:
+        # known sampling points / naming pattern first; the LLM only when both miss
+        with stage("waterbody", rows=len(df)):
+            waterbody = waterbody_cache.CACHE.resolve(
+                get_connection, params.get("client_id"), filename, wb_sheets, sampling_points,
+                lambda: resolve_waterbody(df=df, filename=filename, sheet_names=wb_sheets),
             )
-        except Exception:
-            traceback.print_exc()
-            waterbody = None
-
-        session_id = str(uuid.uuid4())
-        SESSION_CACHE[session_id] = {
-            "df_h": df_h,
-            "df_sampling": df_sampling,
-            "waterbody": waterbody,
-            "file_name": f.filename,
-            "sheet_name": sheet_name,
-            "raw_bytes": raw,
-            "available_sheets": available_sheets,
-        }
-
-        preview = clamp_preview(df_h, rows=20, cols=30)
-        return jsonify({
-            "columns": list(df_h.columns.astype(str)),
-            "preview": preview,
-            "sampling_points": sampling_points,
-            "availableSheets": available_sheets,
-            "waterbody": waterbody,
-            "session_id": session_id,
-            "row_count": int(len(df_h)),
-            "col_count": int(df_h.shape[1]),
-        })
-    except Exception as e:
+    except Exception:
         traceback.print_exc()
-        return json_error(str(e), 500)
+        waterbody = None
+
+    session_id = str(uuid.uuid4())
+    _save_session(session_id, {
+        "df_h": df_h,
+        "df_sampling": df_sampling,
+        "waterbody": waterbody,
+        "file_name": filename,
+        "sheet_name": sheet_name,
+        "raw_bytes": raw,
+        "available_sheets": available_sheets,
+        "waterbody_pattern": waterbody_cache.pattern_key(filename, wb_sheets),
+    })
+
+    preview = clamp_preview(df_h, rows=20, cols=30)
+    return {
+        "columns": list(df_h.columns.astype(str)),
+        "preview": preview,
+        "sampling_points": sampling_points,
+        "availableSheets": available_sheets,
+        "waterbody": waterbody,
+        "session_id": session_id,
+        "row_count": int(len(df_h)),
+        "col_count": int(df_h.shape[1]),
+        # "rules" / "mixed": the LLM was unavailable for some headers; confirm the mapping
+        "mapping_source": "llm" if not rule_mapped else ("rules" if rule_mapped == len(mapping) else "mixed"),
+    }
+
 @app.delete("/datasets/<dataset_id>")
 def delete_dataset(dataset_id):
     try:
@@ -530,113 +760,176 @@ def delete_dataset(dataset_id):
                 row = cur.fetchone()
                 if not row:
                     return json_error("dataset not found", 404)
-            conn.commit()
+            # commits the delete together with the version bump
+            bump_data_version(conn, dataset_id)
 
         # Measurements are removed via ON DELETE CASCADE
-        return jsonify({"ok": True, "deleted": dataset_id})
+        return json_response({"ok": True, "deleted": dataset_id})
     except Exception as e:
         traceback.print_exc()
         return json_error(str(e), 500)
 @app.post("/ingest/persist")
 def ingest_persist():
+    """
+    Queue writing a mapped session to the database; 202 {job_id}. Poll
+    /jobs/<job_id>: the result has dataset_id and the inserted/skipped counts.
+    """
     try:
-        data = request.get_json(force=True)
-        session_id = data.get("session_id")
-        client_id = data.get("client_id")
-        email = data.get("email") or "unknown@example.com"
-        use_hash = bool(data.get("use_content_hash", True))
-        value_qualifier = (data.get("value_qualifier") or "").strip()
+        data = request.get_json(force=True) or {}
+        mode = (data.get("mode") or "new").lower()
+        if mode == "append_to" and not data.get("target_dataset_id"):
+            return json_error("target_dataset_id required for mode=append_to", 400)
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1 FROM public.ingest_sessions WHERE session_id::text = %s",
+                            (str(data.get("session_id")),))
+                if not cur.fetchone():
+                    return json_error("invalid session_id", 400)
 
-        # NEW: merge policy
-        mode = (data.get("mode") or "new").lower()  # "new" | "append_auto" | "append_to"
-        target_dataset_id = data.get("target_dataset_id")  # used when mode == "append_to"
+        job_id = jobs.enqueue(data.get("client_id"), "persist", data, profile=profiling.profiled_request())
+        return _job_accepted(job_id)
+    except Exception as e:
+        traceback.print_exc()
+        return json_error(str(e), 500)
 
-        sess = SESSION_CACHE.get(session_id)
-        if not sess:
-            return json_error("invalid session_id", 400)
 
-        df_h = sess["df_h"]
-        df_sampling = sess["df_sampling"]
-        wb = sess["waterbody"]
-        file_name = data.get("file_name") or sess["file_name"]
-        sheet_name = data.get("sheet_name") or sess["sheet_name"]
-        raw_bytes = sess["raw_bytes"]
+@jobs.register("persist")
+def _persist_job(data: Dict[str, Any], _payload, progress) -> Dict[str, Any]:
+    session_id = data.get("session_id")
+    client_id = data.get("client_id")
+    email = data.get("email") or "unknown@example.com"
+    use_hash = bool(data.get("use_content_hash", True))
+    value_qualifier = (data.get("value_qualifier") or "").strip()
 
-        chash = content_sha256(raw_bytes, extra=(sheet_name or "")) if use_hash else None
+    # NEW: merge policy
+    mode = (data.get("mode") or "new").lower()  # "new" | "append_auto" | "append_to"
+    target_dataset_id = data.get("target_dataset_id")  # used when mode == "append_to"
 
-        with get_connection() as conn:
-            ensure_schema(conn, seed_all=False)
-            ensure_client(conn, client_id, email, email.split("@")[0] if email else None)
+    sess = _load_session(session_id)
+    if not sess:
+        raise JobError("invalid session_id", 400)
+
+    df_h = sess["df_h"]
+    df_sampling = sess["df_sampling"]
+    wb = sess["waterbody"]
+    file_name = data.get("file_name") or sess["file_name"]
+    sheet_name = data.get("sheet_name") or sess["sheet_name"]
+    raw_bytes = sess["raw_bytes"]
+
+    chash = content_sha256(raw_bytes, extra=(sheet_name or "")) if use_hash else None
 
+    progress("upserting")
+    # schema DDL once per worker process: per-job ALTER/CREATE OR REPLACE VIEW
+    # takes AccessExclusiveLocks that deadlock against concurrent persists
+    jobs.ensure_tables()
+    with get_connection() as conn:
+        ensure_client(conn, client_id, email, email.split("@")[0] if email else None)
+
+        with stage("upserts", rows=len(df_sampling)):
             waterbody_id = upsert_waterbody(conn, client_id, wb) if wb else None
             sp_map = upsert_sampling_points(conn, client_id, waterbody_id, df_sampling)
+            if wb:
+                waterbody_cache.CACHE.learn(conn, client_id, sess.get("waterbody_pattern"), wb, waterbody_id)
+
+        # ---------- decide dataset_id based on mode ----------
+        dataset_id = None
+
+        if mode == "append_to":
+            if not target_dataset_id:
+                raise JobError("target_dataset_id required for mode=append_to", 400)
+            dataset_id = target_dataset_id
 
-            # ---------- decide dataset_id based on mode ----------
-            dataset_id = None
-
-            if mode == "append_to":
-                if not target_dataset_id:
-                    return json_error("target_dataset_id required for mode=append_to", 400)
-                dataset_id = target_dataset_id
-
-            elif mode == "append_auto" and waterbody_id:
-                # pick the most recent dataset for this client + waterbody
-                with conn.cursor() as cur:
-                    cur.execute(
-                        """
-                        SELECT dataset_id
-                        FROM public.datasets
-                        WHERE client_id = %s AND waterbody_id = %s
-                        ORDER BY uploaded_at DESC
-                        LIMIT 1
-                        """,
-                        (client_id, waterbody_id),
-                    )
-                    row = cur.fetchone()
-                if row:
-                    dataset_id = row[0]
-
-            if not dataset_id:
-                # create new dataset row
-                dataset_id = register_dataset(
-                    conn, client_id,
-                    file_name=file_name,
-                    sheet_name=sheet_name,
-                    row_count=len(df_h), col_count=df_h.shape[1],
-                    waterbody_id=waterbody_id,
-                    content_hash=chash if use_hash else None,
+        elif mode == "append_auto" and waterbody_id:
+            # pick the most recent dataset for this client + waterbody
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    SELECT dataset_id
+                    FROM public.datasets
+                    WHERE client_id = %s AND waterbody_id = %s
+                    ORDER BY uploaded_at DESC
+                    LIMIT 1
+                    """,
+                    (client_id, waterbody_id),
                 )
-            else:
-                # appending → bump timestamp
-                with conn.cursor() as cur:
-                    cur.execute(
-                        "UPDATE public.datasets SET uploaded_at = now() WHERE dataset_id = %s",
-                        (dataset_id,),
-                    )
-                conn.commit()
-            # ------------------------------------------------------
+                row = cur.fetchone()
+            if row:
+                dataset_id = row[0]
+
+        if not dataset_id:
+            # create new dataset row
+            dataset_id = register_dataset(
+                conn, client_id,
+                file_name=file_name,
+                sheet_name=sheet_name,
+                row_count=len(df_h), col_count=df_h.shape[1],
+                waterbody_id=waterbody_id,
+                content_hash=chash if use_hash else None,
+            )
+        else:
+            # appending → bump timestamp
+            with conn.cursor() as cur:
+                cur.execute(
+                    "UPDATE public.datasets SET uploaded_at = now() WHERE dataset_id = %s",
+                    (dataset_id,),
+                )
+            conn.commit()
+        # ------------------------------------------------------
 
+        with stage("melt") as st:
             long_df = melt_harmonized(df_h)
+            st.rows = len(long_df)
+        progress("inserting", rows_melted=int(len(long_df)))
 
-            used_param_codes = long_df["parameter_code"].dropna().astype(str).str.lower().unique().tolist()
+        used_param_codes = long_df["parameter_code"].dropna().astype(str).str.lower().unique().tolist()
+        used_meta_cols = [c for c in df_h.columns if c in CONTROLLED_META_VOCAB]
+        with stage("upserts", rows=len(used_param_codes) + len(used_meta_cols)):
             upsert_parameters_for_codes(conn, used_param_codes)
-            used_meta_cols = [c for c in df_h.columns if c in CONTROLLED_META_VOCAB]
             upsert_non_params_for_cols(conn, used_meta_cols)
 
-            if value_qualifier:
-                long_df["value_qualifier"] = value_qualifier
-
-            result = insert_measurements(conn, client_id, dataset_id, long_df, sp_map)
-
-        return jsonify({
-            "dataset_id": dataset_id,
-            "waterbody_id": waterbody_id,
-            "rows_in": int(result["rows_in"]),
-            "rows_inserted": int(result["rows_inserted"]),
-            "rows_skipped": int(result["rows_in"] - result["rows_inserted"]),
-            "mode": mode,
-            "appended_to_existing": mode in ("append_auto","append_to")
-        })
+        if value_qualifier:
+            long_df["value_qualifier"] = value_qualifier
+
+        result = insert_measurements(conn, client_id, dataset_id, long_df, sp_map)
+        if result["rows_inserted"]:
+            bump_data_version(conn, dataset_id)
+        progress("inserting", rows_inserted=int(result["rows_inserted"]))
+
+    return {
+        "dataset_id": dataset_id,
+        "waterbody_id": waterbody_id,
+        "rows_in": int(result["rows_in"]),
+        "rows_inserted": int(result["rows_inserted"]),
+        "rows_skipped": int(result["rows_in"] - result["rows_inserted"]),
+        "mode": mode,
+        "appended_to_existing": mode in ("append_auto","append_to")
+    }
+
+@app.get("/jobs/<job_id>")
+def job_status(job_id):
+    """
+    Status of an ingest job. Only the client that queued it can see it.
+    `result` is the endpoint's former response body once status is "done";
+    a failed job reports `error` and the HTTP status it would have answered.
+    """
+    try:
+        client_id = request.args.get("client_id")
+        try:
+            uuid.UUID(job_id)
+        except ValueError:
+            return json_error("job not found", 404)
+        job = jobs.get_job(job_id)
+        if not job or (job["client_id"] or None) != (client_id or None):
+            return json_error("job not found", 404)
+
+        out = {k: job[k] for k in ("job_id", "kind", "status", "stage", "progress",
+                                   "created_at", "started_at", "finished_at")}
+        if job["status"] == "done":
+            out["result"] = job["result"]
+        elif job["status"] == "failed":
+            out["error"] = job["error"]
+            out["error_status"] = job["error_status"]
+        return json_response(out)
     except Exception as e:
         traceback.print_exc()
         return json_error(str(e), 500)
@@ -667,34 +960,138 @@ def list_datasets():
                 "uploaded_at": r[5].isoformat() if r[5] else None,
                 "waterbody_name": r[6], "waterbody_type": r[7]
             })
-        return jsonify({"items": out})
+        return json_response({"items": out})
+    except Exception as e:
+        traceback.print_exc()
+        return json_error(str(e), 500)
+
+@app.get("/sampling_points")
+@dataset_cache.cached("sampling_points", points=True)
+def sampling_points():
+    """
+    A client's sampling points, each once, with its newest value per parameter
+    and quality-flag counts.
+    Query: client_id, optional bbox=min_lon,min_lat,max_lon,max_lat (geohash
+    prefix scan + exact check), optional dataset_id (points measured in that
+    dataset; summaries restricted to it).
+    """
+    try:
+        client_id = request.args.get("client_id")
+        if not client_id:
+            return json_error("client_id is required", 400)
+        dataset_id = request.args.get("dataset_id")
+        try:
+            bbox = parse_bbox(request.args.get("bbox"))
+        except ValueError as e:
+            return json_error(str(e), 400)
+
+        where = ["sp.client_id = %s"]
+        params: List[Any] = [client_id]
+        if bbox:
+            prefixes = [p for p in bbox_prefixes(bbox) if p]
+            if prefixes:
+                where.append("(" + " OR ".join(["sp.geohash LIKE %s"] * len(prefixes)) + ")")
+                params.extend(f"{p}%" for p in prefixes)
+            where.append("sp.lon BETWEEN %s AND %s AND sp.lat BETWEEN %s AND %s")
+            params.extend([bbox[0], bbox[2], bbox[1], bbox[3]])
+        if dataset_id:
+            where.append("""EXISTS (SELECT 1 FROM public.dataset_flag_counts c
+                                    WHERE c.dataset_id = %s AND c.sampling_point_id = sp.sampling_point_id)""")
+            params.append(dataset_id)
+        ds_latest = "AND l.dataset_id = %s" if dataset_id else ""
+        ds_flags = "AND c.dataset_id = %s" if dataset_id else ""
+        params = ([dataset_id] if dataset_id else []) * 2 + params
+
+        sql = f"""
+            SELECT sp.sampling_point_id, sp.code, sp.name, sp.lat, sp.lon, sp.depth_m,
+                   sp.waterbody_id, lv.latest, fc.flags
+            FROM public.sampling_points sp
+            LEFT JOIN LATERAL (
+              SELECT jsonb_object_agg(p.code, jsonb_build_object('value', x.value, 'ts', x.ts)) AS latest
+              FROM (
+                SELECT DISTINCT ON (l.parameter_id) l.parameter_id, l.value, l.ts
+                FROM public.latest_measurement l
+                WHERE l.sampling_point_id = sp.sampling_point_id {ds_latest}
+                ORDER BY l.parameter_id, l.ts DESC
+              ) x
+              JOIN public.parameters p ON p.parameter_id = x.parameter_id
+            ) lv ON TRUE
+            LEFT JOIN LATERAL (
+              SELECT jsonb_object_agg(q.code, q.n) AS flags
+              FROM (
+                SELECT COALESCE(qf.code, 'ok') AS code, SUM(c.n)::bigint AS n
+                FROM public.dataset_flag_counts c
+                LEFT JOIN public.quality_flags qf ON qf.quality_flag_id = c.quality_flag_id
+                WHERE c.sampling_point_id = sp.sampling_point_id {ds_flags}
+                GROUP BY 1
+              ) q
+            ) fc ON TRUE
+            WHERE {" AND ".join(where)}
+            ORDER BY sp.code
+        """
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(sql, params)
+                rows = cur.fetchall()
+
+        items = [{
+            "sampling_point_id": r[0], "code": r[1], "name": r[2],
+            "lat": r[3], "lon": r[4], "depth_m": r[5], "waterbody_id": r[6],
+            "latest": r[7] or {}, "flags": r[8] or {},
+        } for r in rows]
+        return json_response({"items": items})
     except Exception as e:
         traceback.print_exc()
         return json_error(str(e), 500)
 
+# measurement_rows carries integer keys; the scalar subquery is an initplan,
+# so partition pruning still happens (at executor start-up)
+_ROWS_DATASET = "m.dataset_key = (SELECT dataset_key FROM public.datasets WHERE dataset_id = %s)"
+
+
+def _point_join(rows: bool) -> str:
+    col = "point_key" if rows else "sampling_point_id"
+    return f"LEFT JOIN public.sampling_points sp ON sp.{col} = m.{col}"
+
+
+def _measurement_filters(dataset_id: str, ts_col: str = "m.ts", rows: bool = False) -> Tuple[List[str], List[Any]]:
+    """
+    WHERE fragments + params for the /measurements query-string filters
+    (parameter, point, from, to). Expects aliases m, p, sp: m is a rollup
+    keyed by dataset_id, or measurement_rows when `rows` is set; `ts_col` is
+    the column the window applies to.
+    """
+    params: List[Any] = [dataset_id]
+    where = [_ROWS_DATASET if rows else "m.dataset_id = %s"]
+    parameter = request.args.get("parameter")
+    point = request.args.get("point")
+    t_from = request.args.get("from")
+    t_to = request.args.get("to")
+    if parameter:
+        where.append("p.code = %s"); params.append(parameter.lower())
+    if point:
+        where.append("sp.code = %s"); params.append(point)
+    if t_from:
+        where.append(f"{ts_col} >= %s"); params.append(t_from)
+    if t_to:
+        where.append(f"{ts_col} <= %s"); params.append(t_to)
+    return where, params
+
+_MEASUREMENT_KEYS = (
+    "ts", "sampling_point", "parameter", "parameter_display",
+    "value", "unit", "quality_flag_id", "lat", "lon",
+)
+
 @app.get("/measurements")
+@dataset_cache.cached("measurements")
 def measurements():
     try:
         client_id = request.args.get("client_id")
         dataset_id = request.args.get("dataset_id")
-        parameter = request.args.get("parameter")
-        point = request.args.get("point")
-        t_from = request.args.get("from")
-        t_to = request.args.get("to")
         if not client_id or not dataset_id:
             return json_error("client_id and dataset_id required", 400)
 
-        params = [dataset_id]
-        where = ["m.dataset_id = %s"]
-
-        if parameter:
-            where.append("p.code = %s"); params.append(parameter.lower())
-        if point:
-            where.append("sp.code = %s"); params.append(point)
-        if t_from:
-            where.append("m.ts >= %s"); params.append(t_from)
-        if t_to:
-            where.append("m.ts <= %s"); params.append(t_to)
+        where, params = _measurement_filters(dataset_id, rows=True)
 
         sql = f"""
             SELECT
@@ -707,13 +1104,14 @@ def measurements():
                 ELSE p.display_name
               END                               AS parameter_display,    -- 3
               m.value,                                                   -- 4
-              COALESCE(m.unit, p.standard_unit) AS unit,                -- 5
+              COALESCE(u.unit, p.standard_unit) AS unit,                -- 5
               m.quality_flag_id,                                        -- 6
               sp.lat,                                                   -- 7
               sp.lon                                                    -- 8
-            FROM public.measurements AS m
+            FROM public.measurement_rows AS m
             JOIN public.parameters  AS p  ON p.parameter_id = m.parameter_id
-            LEFT JOIN public.sampling_points AS sp ON sp.sampling_point_id = m.sampling_point_id
+            LEFT JOIN public.sampling_points AS sp ON sp.point_key = m.point_key
+            LEFT JOIN public.units AS u ON u.unit_id = m.unit_id
             WHERE { ' AND '.join(where) }
             ORDER BY m.ts NULLS LAST
             LIMIT 50000
@@ -723,24 +1121,16 @@ def measurements():
                 cur.execute(sql, params)
                 rows = cur.fetchall()
 
-        data = [{
-            "ts": (r[0].isoformat() if r[0] else None),
-            "sampling_point": r[1],
-            "parameter": r[2],
-            "parameter_display": r[3],
-            "value": None if r[4] is None else float(r[4]),
-            "unit": r[5],
-            "quality_flag_id": r[6],
-            "lat": None if r[7] is None else float(r[7]),
-            "lon": None if r[8] is None else float(r[8]),
-        } for r in rows]
+        # DB types (timestamptz, double precision) serialize natively
+        data = [dict(zip(_MEASUREMENT_KEYS, r)) for r in rows]
 
-        return jsonify({"data": data})
+        return json_response({"data": data})
     except Exception as e:
         traceback.print_exc()
         return json_error(str(e), 500)
 
 @app.get("/analytics/correlation")
+@dataset_cache.cached("correlation")
 def correlation():
     try:
         client_id = request.args.get("client_id")
@@ -751,34 +1141,119 @@ def correlation():
         if not client_id or not dataset_id:
             return json_error("client_id and dataset_id required", 400)
 
-        sql = """
+        sql = f"""
             SELECT
               m.ts::date                           AS d,
               COALESCE(sp.code,'')                 AS point,
               p.code                                AS param,
               AVG(m.value)                          AS value
-            FROM public.measurements m
+            FROM public.measurement_rows m
             JOIN public.parameters p ON p.parameter_id = m.parameter_id
-            LEFT JOIN public.sampling_points sp ON sp.sampling_point_id = m.sampling_point_id
-            WHERE m.dataset_id = %s
+            LEFT JOIN public.sampling_points sp ON sp.point_key = m.point_key
+            WHERE {_ROWS_DATASET}
               AND m.value IS NOT NULL
             GROUP BY 1,2,3
         """
         with get_connection() as conn:
             df = pd.read_sql(sql, conn, params=(dataset_id,))
         if df.empty:
-            return jsonify({"labels": [], "matrix": []})
+            return json_response({"labels": [], "matrix": []})
 
         # pivot to (date,point) × param and compute correlations across rows
         df_p = df.pivot_table(index=["d", "point"], columns="param", values="value", aggfunc="mean")
         df_p = df_p.dropna(axis=1, how="all")  # drop empty columns
         corr = df_p.corr(method=method).fillna(0)
-        return jsonify({"labels": list(corr.columns.astype(str)), "matrix": corr.values.tolist()})
+        return json_response({"labels": list(corr.columns.astype(str)), "matrix": corr.values.tolist()})
+    except Exception as e:
+        traceback.print_exc()
+        return json_error(str(e), 500)
+
+_LAG_GRIDS = {"day": "D", "week": "W-MON", "month": "MS"}
+
+@app.get("/analytics/lagged_correlation")
+@dataset_cache.cached("lagged_correlation")
+def lagged_correlation_view():
+    """
+    Cross-correlation of every parameter pair over lags -max_lag..max_lag on a
+    regular grid (interval=day|week|month, default week), pooled over
+    sampling points. A positive best_lag means `a` leads `b` by that many steps.
+    Query: client_id, dataset_id, max_lag (default 52), optional params=a,b,c,
+           point, min_overlap (default 10), curves=1 to include r per lag.
+    """
+    try:
+        client_id = request.args.get("client_id")
+        dataset_id = request.args.get("dataset_id")
+        if not client_id or not dataset_id:
+            return json_error("client_id and dataset_id required", 400)
+        interval = (request.args.get("interval") or "week").lower()
+        if interval not in _LAG_GRIDS:
+            return json_error(f"interval must be one of {'|'.join(_LAG_GRIDS)}", 400)
+        try:
+            max_lag = min(MAX_LAG_CAP, max(0, int(request.args.get("max_lag") or 52)))
+            min_overlap = max(3, int(request.args.get("min_overlap") or 10))
+        except ValueError:
+            return json_error("max_lag and min_overlap must be integers", 400)
+        codes = [x.strip().lower() for x in (request.args.get("params") or "").split(",") if x.strip()]
+        curves = request.args.get("curves") in ("1", "true", "yes")
+
+        where, params = _measurement_filters(dataset_id, ts_col="m.day")
+        if codes:
+            where.append("p.code = ANY(%s)"); params.append(codes)
+        sql = f"""
+            SELECT {_bucket_expr(interval, "m.day::timestamp")} AS t,
+                   COALESCE(sp.code,'') AS point,
+                   p.code AS param,
+                   SUM(m.vsum) / SUM(m.n) AS value
+            FROM public.measurement_daily m
+            JOIN public.parameters p ON p.parameter_id = m.parameter_id
+            LEFT JOIN public.sampling_points sp ON sp.sampling_point_id = m.sampling_point_id
+            WHERE {" AND ".join(where)}
+            GROUP BY 1, 2, 3
+        """
+        with get_connection() as conn:
+            df = pd.read_sql(sql, conn, params=params)
+        empty = {"interval": interval, "params": [], "lags": [], "items": []}
+        if df.empty:
+            return json_response(empty)
+
+        grid = pd.date_range(df["t"].min(), df["t"].max(), freq=_LAG_GRIDS[interval])
+        labels = sorted(df["param"].unique())
+        points = sorted(df["point"].unique())
+        cube = np.full((len(points), len(labels), len(grid)), np.nan)
+        cube[
+            pd.Index(points).get_indexer(df["point"]),
+            pd.Index(labels).get_indexer(df["param"]),
+            grid.get_indexer(pd.to_datetime(df["t"])),
+        ] = df["value"].to_numpy(float)
+        if len(grid) < 2 or len(labels) < 2:
+            return json_response({**empty, "params": labels})
+
+        res = lagged_correlation(cube, max_lag=max_lag, min_overlap=min_overlap)
+        lags, r, n = res["lags"], res["r"], res["n"]
+        best = best_lags(res)
+        zero = int(np.flatnonzero(lags == 0)[0])
+        items = []
+        for i in range(len(labels)):
+            for j in range(i + 1, len(labels)):
+                b = int(best[i, j])
+                item = {
+                    "a": labels[i], "b": labels[j],
+                    "best_lag": int(lags[b]) if b >= 0 else None,
+                    "r": float(r[i, j, b]) if b >= 0 else None,
+                    "n": int(n[i, j, b]) if b >= 0 else 0,
+                    "r_lag0": r[i, j, zero],
+                }
+                if curves:
+                    item["curve"] = r[i, j].tolist()  # NaN -> null
+                items.append(item)
+        items.sort(key=lambda it: -abs(it["r"]) if it["r"] is not None else 0.0)
+        return json_response({"interval": interval, "params": labels, "lags": lags.tolist(), "items": items})
     except Exception as e:
         traceback.print_exc()
         return json_error(str(e), 500)
 
 @app.get("/analytics/anomalies")
+@dataset_cache.cached("anomalies")
 def anomalies():
     try:
         client_id = request.args.get("client_id")
@@ -787,13 +1262,14 @@ def anomalies():
             return json_error("client_id and dataset_id required", 400)
         with get_connection() as conn:
             with conn.cursor() as cur:
+                # counters are maintained at ingest (see dataset_flag_counts)
                 cur.execute("""
-                    SELECT p.code, COALESCE(sp.code,''), qf.code, COUNT(*)
-                    FROM public.measurements m
-                    JOIN public.parameters p ON p.parameter_id = m.parameter_id
-                    LEFT JOIN public.sampling_points sp ON sp.sampling_point_id = m.sampling_point_id
-                    LEFT JOIN public.quality_flags qf ON qf.quality_flag_id = m.quality_flag_id
-                    WHERE m.dataset_id = %s
+                    SELECT p.code, COALESCE(sp.code,''), qf.code, SUM(c.n)::bigint
+                    FROM public.dataset_flag_counts c
+                    JOIN public.parameters p ON p.parameter_id = c.parameter_id
+                    LEFT JOIN public.sampling_points sp ON sp.sampling_point_id = c.sampling_point_id
+                    LEFT JOIN public.quality_flags qf ON qf.quality_flag_id = c.quality_flag_id
+                    WHERE c.dataset_id = %s
                     GROUP BY 1,2,3
                 """, (dataset_id,))
                 rows = cur.fetchall()
@@ -807,7 +1283,542 @@ def anomalies():
             spk = spcode or ""
             by_point.setdefault(spk, {"ok":0,"out_of_range":0,"missing":0,"outlier":0})
             by_point[spk][q] = by_point[spk].get(q, 0) + cnt
-        return jsonify({"by_parameter": by_param, "by_sampling_point": by_point})
+        return json_response({"by_parameter": by_param, "by_sampling_point": by_point})
+    except Exception as e:
+        traceback.print_exc()
+        return json_error(str(e), 500)
+
+_AGG_INTERVALS = ("hour", "day", "week", "month", "season", "year")
+_AGG_STATS = ("mean", "min", "max", "median", "p10", "p90", "count")
+_ROLLUP_STATS = {"mean", "min", "max", "count"}
+_SEASONS = {12: "DJF", 3: "MAM", 6: "JJA", 9: "SON"}
+
+def _bucket_expr(interval: str, col: str) -> str:
+    if interval == "season":
+        # meteorological seasons; buckets start on Dec/Mar/Jun/Sep 1st
+        return f"(date_trunc('quarter', {col} + interval '1 month') - interval '1 month')"
+    return f"date_trunc('{interval}', {col})"
+
+@app.get("/analytics/aggregate")
+@dataset_cache.cached("aggregate")
+def aggregate():
+    """
+    Time-bucketed statistics per (sampling point, parameter), in UTC.
+    Query: client_id, dataset_id, interval=hour|day|week|month|season|year,
+           stats=mean,min,max,median,p10,p90,count (default mean,min,max,count)
+           + the /measurements filters (parameter, point, from, to).
+    Day-or-coarser mean/min/max/count without a time window are answered from
+    the daily rollup; everything else aggregates the raw rows.
+    """
+    try:
+        client_id = request.args.get("client_id")
+        dataset_id = request.args.get("dataset_id")
+        if not client_id or not dataset_id:
+            return json_error("client_id and dataset_id required", 400)
+        interval = (request.args.get("interval") or "day").lower()
+        if interval not in _AGG_INTERVALS:
+            return json_error(f"interval must be one of {'|'.join(_AGG_INTERVALS)}", 400)
+        stats = [x.strip().lower() for x in (request.args.get("stats") or "mean,min,max,count").split(",") if x.strip()]
+        if not stats or any(x not in _AGG_STATS for x in stats):
+            return json_error(f"stats must be a subset of {','.join(_AGG_STATS)}", 400)
+        stats = list(dict.fromkeys(stats))
+
+        use_rollup = (
+            interval != "hour"
+            and set(stats) <= _ROLLUP_STATS
+            and not request.args.get("from") and not request.args.get("to")
+        )
+        where, params = _measurement_filters(dataset_id, rows=not use_rollup)
+        if use_rollup:
+            source = "public.measurement_daily m"
+            bucket = _bucket_expr(interval, "m.day::timestamp")
+            exprs = {
+                "mean": "SUM(m.vsum) / NULLIF(SUM(m.n), 0)",
+                "min": "MIN(m.vmin)",
+                "max": "MAX(m.vmax)",
+                "count": "SUM(m.n)::bigint",
+            }
+        else:
+            source = "public.measurement_rows m"
+            bucket = _bucket_expr(interval, "(m.ts AT TIME ZONE 'UTC')")
+            where += ["m.ts IS NOT NULL", "m.value IS NOT NULL"]
+            exprs = {
+                "mean": "AVG(m.value)",
+                "min": "MIN(m.value)",
+                "max": "MAX(m.value)",
+                "median": "percentile_cont(0.5) WITHIN GROUP (ORDER BY m.value)",
+                "p10": "percentile_cont(0.1) WITHIN GROUP (ORDER BY m.value)",
+                "p90": "percentile_cont(0.9) WITHIN GROUP (ORDER BY m.value)",
+                "count": "COUNT(m.value)",
+            }
+
+        sql = f"""
+            SELECT {bucket} AS t,
+                   COALESCE(sp.code,'') AS point,
+                   p.code AS param,
+                   {", ".join(f"{exprs[x]} AS {x}" for x in stats)}
+            FROM {source}
+            JOIN public.parameters p ON p.parameter_id = m.parameter_id
+            {_point_join(not use_rollup)}
+            WHERE {" AND ".join(where)}
+            GROUP BY 1, 2, 3
+            ORDER BY 2, 3, 1
+            LIMIT 50000
+        """
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(sql, params)
+                rows = cur.fetchall()
+
+        keys = ("t", "sampling_point", "parameter", *stats)
+        data = [dict(zip(keys, r)) for r in rows]
+        if interval == "season":
+            for d in data:
+                d["season"] = _SEASONS.get(d["t"].month)
+        return json_response({
+            "interval": interval,
+            "stats": stats,
+            "source": "rollup" if use_rollup else "raw",
+            "data": data,
+        })
+    except Exception as e:
+        traceback.print_exc()
+        return json_error(str(e), 500)
+
+_PIVOT_MAX_PARAMS = 40
+_PIVOT_MAX_ROWS = 50000  # unsampled responses are cut here (reported as truncated)
+_PIVOT_SAMPLING = ("random", "stratified")
+
+
+def _stratified_sample(df: pd.DataFrame, key: str, max_rows: int, seed: int) -> pd.DataFrame:
+    """
+    At most max_rows rows, allocated per `key` group: max(1, round(n_i * frac))
+    capped at n_i, so sparse groups keep at least one row. When rounding
+    overshoots, the largest allocations are cut down to a common level; with
+    more groups than max_rows, a random max_rows groups keep one row each.
+    """
+    sizes = df.groupby(key, sort=False).size()
+    alloc = np.minimum(sizes, np.maximum(1, np.rint(sizes * (max_rows / len(df))))).astype(int)
+    if int(alloc.sum()) > max_rows:
+        if len(alloc) >= max_rows:
+            alloc[:] = 0
+            alloc[alloc.sample(n=max_rows, random_state=seed).index] = 1
+        else:
+            # highest level L with sum(min(alloc, L)) <= max_rows, then hand the
+            # remainder to the groups above L, one row each
+            lo, hi = 1, int(alloc.max())
+            while lo < hi:
+                mid = (lo + hi + 1) // 2
+                lo, hi = (mid, hi) if int(np.minimum(alloc, mid).sum()) <= max_rows else (lo, mid - 1)
+            capped = np.minimum(alloc, lo)
+            extra = max_rows - int(capped.sum())
+            above = capped.index[alloc > lo][:extra]
+            capped[above] += 1
+            alloc = capped
+    shuffled = df.sample(frac=1.0, random_state=seed)
+    keep = shuffled.groupby(key, sort=False).cumcount().to_numpy() < shuffled[key].map(alloc).to_numpy()
+    return shuffled[keep]
+
+@app.get("/analytics/pivot")
+@dataset_cache.cached("pivot")
+def pivot():
+    """
+    Time-aligned wide rows: one row per (bucket, sampling point), one mean
+    column per requested parameter (crosstab via FILTER aggregates).
+    Query: client_id, dataset_id, params=a,b,c, interval (default day),
+           optional point/from/to, complete=1 (drop rows with any gap),
+           sample=random|stratified (per sampling point) + max_rows
+           (default 5000) + seed. Unsampled results stop at _PIVOT_MAX_ROWS
+           rows with truncated=true; total_rows is the full count.
+    Day-or-coarser buckets without a time window read the daily rollup.
+    """
+    try:
+        client_id = request.args.get("client_id")
+        dataset_id = request.args.get("dataset_id")
+        if not client_id or not dataset_id:
+            return json_error("client_id and dataset_id required", 400)
+        codes = list(dict.fromkeys(
+            x.strip().lower() for x in (request.args.get("params") or "").split(",") if x.strip()
+        ))
+        if not codes or len(codes) > _PIVOT_MAX_PARAMS:
+            return json_error(f"params must list 1..{_PIVOT_MAX_PARAMS} parameter codes", 400)
+        interval = (request.args.get("interval") or "day").lower()
+        if interval not in _AGG_INTERVALS:
+            return json_error(f"interval must be one of {'|'.join(_AGG_INTERVALS)}", 400)
+        sample = (request.args.get("sample") or "").lower() or None
+        if sample is not None and sample not in _PIVOT_SAMPLING:
+            return json_error("sample must be random|stratified", 400)
+        try:
+            max_rows = max(1, int(request.args.get("max_rows") or 5000))
+            seed = int(request.args.get("seed") or 0)
+        except ValueError:
+            return json_error("max_rows and seed must be integers", 400)
+        complete = request.args.get("complete") in ("1", "true", "yes")
+
+        use_rollup = interval != "hour" and not request.args.get("from") and not request.args.get("to")
+        where, params = _measurement_filters(dataset_id, rows=not use_rollup)
+        where.append("p.code = ANY(%s)"); params.append(codes)
+        if use_rollup:
+            source = "public.measurement_daily m"
+            bucket = _bucket_expr(interval, "m.day::timestamp")
+            col = "SUM(m.vsum) FILTER (WHERE p.code = %s) / NULLIF(SUM(m.n) FILTER (WHERE p.code = %s), 0)"
+            col_params = [c for code in codes for c in (code, code)]
+        else:
+            source = "public.measurement_rows m"
+            bucket = _bucket_expr(interval, "(m.ts AT TIME ZONE 'UTC')")
+            where += ["m.ts IS NOT NULL", "m.value IS NOT NULL"]
+            col = "AVG(m.value) FILTER (WHERE p.code = %s)"
+            col_params = list(codes)
+
+        sql = f"""
+            SELECT {bucket} AS t,
+                   COALESCE(sp.code,'') AS point,
+                   {", ".join(f"{col} AS c{i}" for i in range(len(codes)))}
+            FROM {source}
+            JOIN public.parameters p ON p.parameter_id = m.parameter_id
+            {_point_join(not use_rollup)}
+            WHERE {" AND ".join(where)}
+            GROUP BY 1, 2
+            ORDER BY 1, 2
+        """
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(sql, col_params + params)
+                rows = cur.fetchall()
+
+        columns = ["t", "sampling_point", *codes]
+        df = pd.DataFrame(rows, columns=columns)
+        if complete:
+            df = df.dropna(subset=codes)
+        total = len(df)
+        sampled = sample is not None and total > max_rows
+        if sampled:
+            if sample == "random":
+                df = df.sample(n=max_rows, random_state=seed)
+            else:
+                # proportional allocation per point, at least one row each, so sparse points stay visible
+                df = _stratified_sample(df, "sampling_point", max_rows, seed)
+            df = df.sort_index()
+        truncated = not sampled and total > _PIVOT_MAX_ROWS
+        if truncated:
+            df = df.iloc[:_PIVOT_MAX_ROWS]
+
+        out_rows = list(df.itertuples(index=False, name=None))
+        return json_response({
+            "interval": interval,
+            "source": "rollup" if use_rollup else "raw",
+            "columns": columns,
+            "rows": out_rows,
+            "total_rows": total,
+            "sampled": sampled,
+            "truncated": truncated,
+        })
+    except Exception as e:
+        traceback.print_exc()
+        return json_error(str(e), 500)
+
+_DIST_QUANTILES = (0.05, 0.1, 0.25, 0.5, 0.75, 0.9, 0.95)
+
+
+def _quantile_key(q: float) -> str:
+    """Response key of quantile q: 0.05 -> p05, 0.5 -> p50, 0.025 -> p02.5, 0.999 -> p99.9."""
+    head, _, tail = f"{round(q * 100, 6):g}".partition(".")
+    return "p" + head.zfill(2) + ("." + tail if tail else "")
+
+def _sketches(cur, dataset_id: str, month: Optional[int] = None) -> pd.DataFrame:
+    """
+    Stored t-digests of a dataset matching the parameter/point query-string
+    filters: columns sampling_point, parameter, month, digest.
+    """
+    where, params = _measurement_filters(dataset_id)
+    if month is not None:
+        where.append("m.month = %s"); params.append(month)
+    cur.execute(f"""
+        SELECT COALESCE(sp.code,''), p.code, m.month, m.digest
+        FROM public.quantile_sketches m
+        JOIN public.parameters p ON p.parameter_id = m.parameter_id
+        LEFT JOIN public.sampling_points sp ON sp.sampling_point_id = m.sampling_point_id
+        WHERE {" AND ".join(where)}
+    """, params)
+    return pd.DataFrame(
+        [(sp, pc, mo, TDigest.from_bytes(raw)) for sp, pc, mo, raw in cur.fetchall()],
+        columns=["sampling_point", "parameter", "month", "digest"],
+    )
+
+_QUANTILE_GROUPS = {
+    "parameter": ["parameter"],
+    "point": ["parameter", "sampling_point"],
+    "month": ["parameter", "month"],
+}
+
+@app.get("/analytics/quantiles")
+@dataset_cache.cached("quantiles")
+def quantiles():
+    """
+    Quantiles (KPI tiles, box plots) answered from the stored t-digests in
+    O(sketch size); rank error is documented in ewai/tdigest.py.
+    Query: client_id, dataset_id, q=0.1,0.5,0.9 (default quartiles + p10/p90),
+           by=parameter|point|month (default parameter), optional parameter/point.
+    """
+    try:
+        client_id = request.args.get("client_id")
+        dataset_id = request.args.get("dataset_id")
+        if not client_id or not dataset_id:
+            return json_error("client_id and dataset_id required", 400)
+        if request.args.get("from") or request.args.get("to"):
+            return json_error("sketches cover whole months; use /analytics/distribution for a time window", 400)
+        by = (request.args.get("by") or "parameter").lower()
+        if by not in _QUANTILE_GROUPS:
+            return json_error(f"by must be one of {'|'.join(_QUANTILE_GROUPS)}", 400)
+        try:
+            qs = [float(x) for x in (request.args.get("q") or "0.1,0.25,0.5,0.75,0.9").split(",") if x.strip()]
+        except ValueError:
+            return json_error("q must be a comma-separated list of numbers", 400)
+        if not qs or any(not 0.0 <= q <= 1.0 for q in qs):
+            return json_error("q values must lie in [0, 1]", 400)
+
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                sk = _sketches(cur, dataset_id, month=None if by == "month" else 0)
+        if by == "month":
+            sk = sk.loc[sk["month"] > 0]
+        keys = _QUANTILE_GROUPS[by]
+        items = []
+        for key, grp in sk.groupby(keys, sort=True):
+            d = TDigest.merge_all(list(grp["digest"]))
+            if not d.count:
+                continue
+            item = dict(zip(keys, key if isinstance(key, tuple) else (key,)))
+            item["n"] = int(round(d.count))
+            item["min"], item["max"] = d.vmin, d.vmax
+            item["quantiles"] = {_quantile_key(q): v for q, v in zip(qs, d.quantile(qs).tolist())}
+            items.append(item)
+        return json_response({"by": by, "q": qs, "items": items})
+    except Exception as e:
+        traceback.print_exc()
+        return json_error(str(e), 500)
+
+@app.get("/analytics/distribution")
+@dataset_cache.cached("distribution")
+def distribution():
+    """
+    Histogram + summary statistics for one parameter, computed in SQL.
+    Query: client_id, dataset_id, parameter, bins (default 30, max 200),
+           scale=linear|log, plus point/from/to filters.
+    The payload size depends only on `bins`. With scale=log the bins are
+    equal-width in ln(value) and non-positive values are counted separately.
+    """
+    try:
+        client_id = request.args.get("client_id")
+        dataset_id = request.args.get("dataset_id")
+        if not client_id or not dataset_id:
+            return json_error("client_id and dataset_id required", 400)
+        if not request.args.get("parameter"):
+            return json_error("parameter is required", 400)
+        scale = (request.args.get("scale") or "linear").lower()
+        if scale not in ("linear", "log"):
+            return json_error("scale must be linear|log", 400)
+        try:
+            bins = max(1, min(200, int(request.args.get("bins") or 30)))
+        except ValueError:
+            return json_error("bins must be an integer", 400)
+
+        where, params = _measurement_filters(dataset_id, rows=True)
+        where.append("m.value IS NOT NULL")
+        base = f"""
+            FROM public.measurement_rows m
+            JOIN public.parameters p ON p.parameter_id = m.parameter_id
+            {_point_join(True)}
+            WHERE {" AND ".join(where)}
+        """
+        # without a time window the quantiles come from the t-digests (no sort)
+        from_sketch = not request.args.get("from") and not request.args.get("to")
+        q_expr = "NULL" if from_sketch else (
+            "percentile_cont(ARRAY[" + ",".join(str(q) for q in _DIST_QUANTILES) + "]) "
+            "WITHIN GROUP (ORDER BY m.value)"
+        )
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"""
+                    SELECT COUNT(m.value), MIN(m.value), MAX(m.value),
+                           AVG(m.value), STDDEV_SAMP(m.value),
+                           {q_expr},
+                           MIN(m.value) FILTER (WHERE m.value > 0),
+                           COUNT(*) FILTER (WHERE m.value <= 0)
+                    {base}
+                """, params)
+                n, vmin, vmax, mean, std, qs, pos_min, n_nonpos = cur.fetchone()
+                if from_sketch and n:
+                    digest = TDigest.merge_all(list(_sketches(cur, dataset_id, month=0)["digest"]))
+                    qs = digest.quantile(_DIST_QUANTILES).tolist() if digest.count else None
+
+                out = {
+                    "parameter": request.args.get("parameter").lower(),
+                    "scale": scale,
+                    "n": int(n or 0),
+                    "mean": mean, "std": std, "min": vmin, "max": vmax,
+                    "quantiles": {_quantile_key(q): v for q, v in zip(_DIST_QUANTILES, qs or [])},
+                    "quantiles_source": "sketch" if from_sketch else "exact",
+                    "edges": [], "counts": [],
+                }
+                if scale == "log":
+                    out["n_nonpositive"] = int(n_nonpos or 0)
+                    lo, hi = pos_min, vmax
+                    if lo is None or hi is None or hi <= 0:
+                        return json_response(out)
+                    x, lo_t, hi_t, extra = "ln(m.value)", math.log(lo), math.log(hi), " AND m.value > 0"
+                else:
+                    lo, hi = vmin, vmax
+                    if lo is None:
+                        return json_response(out)
+                    x, lo_t, hi_t, extra = "m.value", lo, hi, ""
+
+                if hi_t <= lo_t:
+                    # a single distinct value: one degenerate bin
+                    out["edges"] = [lo, hi]
+                    out["counts"] = [out["n"] - out.get("n_nonpositive", 0)]
+                    return json_response(out)
+
+                # width_bucket puts x == hi in bucket bins+1; fold it into the last bin
+                cur.execute(f"""
+                    SELECT LEAST(width_bucket({x}, %s::float8, %s::float8, %s), %s) AS b, COUNT(*)
+                    {base}{extra}
+                    GROUP BY 1
+                """, [lo_t, hi_t, bins, bins] + params)
+                counts = [0] * bins
+                for b, c in cur.fetchall():
+                    counts[max(1, b) - 1] += int(c)
+
+        step = (hi_t - lo_t) / bins
+        edges = [lo_t + i * step for i in range(bins + 1)]
+        out["edges"] = [math.exp(e) for e in edges] if scale == "log" else edges
+        out["counts"] = counts
+        return json_response(out)
+    except Exception as e:
+        traceback.print_exc()
+        return json_error(str(e), 500)
+
+@app.get("/analytics/trends")
+@dataset_cache.cached("trends")
+def trends():
+    """
+    Trend statistics for every (sampling point, parameter) series of a dataset,
+    fitted on daily means from the rollup: OLS and Theil–Sen slopes (units per
+    year) and Mann–Kendall significance.
+    Query: client_id, dataset_id, optional parameter/point/from/to,
+           min_points (default 6), alpha (default 0.05).
+    """
+    try:
+        client_id = request.args.get("client_id")
+        dataset_id = request.args.get("dataset_id")
+        if not client_id or not dataset_id:
+            return json_error("client_id and dataset_id required", 400)
+        try:
+            min_points = max(3, int(request.args.get("min_points") or 6))
+            alpha = float(request.args.get("alpha") or 0.05)
+        except ValueError:
+            return json_error("min_points must be an integer and alpha a number", 400)
+
+        where, params = _measurement_filters(dataset_id, ts_col="m.day")
+        sql = f"""
+            SELECT COALESCE(sp.code,'') AS sampling_point,
+                   p.code                AS parameter,
+                   m.day,
+                   m.vsum / m.n          AS value
+            FROM public.measurement_daily m
+            JOIN public.parameters p ON p.parameter_id = m.parameter_id
+            LEFT JOIN public.sampling_points sp ON sp.sampling_point_id = m.sampling_point_id
+            WHERE {" AND ".join(where)}
+        """
+        with get_connection() as conn:
+            df = pd.read_sql(sql, conn, params=params)
+        if df.empty:
+            return json_response({"unit": "per_year", "items": []})
+
+        # the rollup can hold two rows per day for one point code (NULL vs '' point)
+        df = df.groupby(["sampling_point", "parameter", "day"], as_index=False)["value"].mean()
+        df["x"] = (pd.to_datetime(df["day"]) - pd.Timestamp("1970-01-01")).dt.days.astype(float)
+        res = series_trends(
+            df, by=["sampling_point", "parameter"], x="x", y="value",
+            min_points=min_points, alpha=alpha,
+            workers=settings.trend_workers or default_workers(),
+        )
+        for col in ("ols_slope", "theil_sen_slope"):
+            res[col] = res[col] * 365.25  # per day -> per year
+        res["start"] = pd.to_datetime(res["x_start"], unit="D").dt.date
+        res["end"] = pd.to_datetime(res["x_end"], unit="D").dt.date
+        items = res[["sampling_point", "parameter", "n", "start", "end", "ols_slope",
+                     "theil_sen_slope", "mk_s", "mk_z", "mk_p", "trend"]].to_dict("records")
+        return json_response({"unit": "per_year", "alpha": alpha, "items": items})
+    except Exception as e:
+        traceback.print_exc()
+        return json_error(str(e), 500)
+
+@app.get("/analytics/bloom")
+@dataset_cache.cached("bloom")
+def bloom():
+    """
+    Algal-bloom risk from the newest reading of each BLOOM_CODES parameter,
+    for every sampling point at once (reads public.latest_measurement).
+    Query: client_id, dataset_id, optional point (repeatable) to restrict
+    both the per-point list and the overall summary.
+    """
+    try:
+        client_id = request.args.get("client_id")
+        dataset_id = request.args.get("dataset_id")
+        if not client_id or not dataset_id:
+            return json_error("client_id and dataset_id required", 400)
+        points = [p for p in request.args.getlist("point") if p]
+
+        where = ["l.dataset_id = %s", "p.code = ANY(%s)"]
+        params: List[Any] = [dataset_id, BLOOM_CODES]
+        if points:
+            where.append("COALESCE(sp.code,'') = ANY(%s)"); params.append(points)
+        sql = f"""
+            SELECT COALESCE(sp.code,''), p.code, l.ts, l.value
+            FROM public.latest_measurement l
+            JOIN public.parameters p ON p.parameter_id = l.parameter_id
+            LEFT JOIN public.sampling_points sp ON sp.sampling_point_id = l.sampling_point_id
+            WHERE {" AND ".join(where)}
+            ORDER BY l.ts
+        """
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(sql, params)
+                rows = cur.fetchall()
+
+        # ascending ts: later rows overwrite, so each slot ends on the newest reading
+        by_point: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        overall: Dict[str, Dict[str, Any]] = {}
+        for spcode, pcode, ts, value in rows:
+            reading = {"value": value, "ts": ts, "sampling_point": spcode}
+            by_point.setdefault(spcode, {})[pcode] = reading
+            overall[pcode] = reading
+
+        def _items(latest: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+            out = []
+            for code in BLOOM_CODES:
+                rule = BLOOM_RULES[code]
+                last = latest.get(code)
+                lvl = pick_level(code, last["value"] if last else None)
+                out.append({
+                    "parameter": code, "label": rule["label"], "unit": rule["unit"],
+                    "value": last["value"] if last else None,
+                    "ts": last["ts"] if last else None,
+                    "sampling_point": last["sampling_point"] if last else None,
+                    "level": lvl["level"], "hint": lvl["msg"],
+                })
+            return out
+
+        point_items = []
+        for spcode in sorted(by_point):
+            items = _items(by_point[spcode])
+            level = worst_level(it["level"] for it in items)
+            point_items.append({"sampling_point": spcode, "level": level,
+                                "safety": level_to_safety(level), "items": items})
+        summary = _items(overall)
+        level = worst_level(it["level"] for it in summary)
+        return json_response({"level": level, "items": summary, "points": point_items})
     except Exception as e:
         traceback.print_exc()
         return json_error(str(e), 500)
@@ -868,17 +1879,8 @@ def _run_readonly_sql(conn, sql: str, limit: int = 500):
         cur.execute(f"SELECT * FROM ({sql}) sub LIMIT %s", (int(limit),))
         rows = cur.fetchall()
 
-    def norm(v):
-        if isinstance(v, decimal.Decimal):
-            try:
-                return float(v)
-            except Exception:
-                return None
-        if isinstance(v, (datetime, date)):
-            return v.isoformat()
-        return v
-
-    out_rows = [{k: norm(v) for k, v in dict(r).items()} for r in rows]
+    # Decimal/datetime values are handled by the response serializer
+    out_rows = [dict(r) for r in rows]
     cols = list(out_rows[0].keys()) if out_rows else []
     return {"columns": cols, "rows": out_rows}
 
@@ -905,28 +1907,22 @@ ASSISTANT_SYSTEM = (
   "- If something is ambiguous, ask a brief follow-up in \"answer\" and still provide safe SQL.\n"
 )
 
-def _groq():
-    from groq import Groq
-    key = os.getenv("GROQ_API_KEY")
-    if not key:
-        raise RuntimeError("GROQ_API_KEY not set")
-    return Groq(api_key=key)
-
 @app.get("/assistant/schema")
 def assistant_schema():
     try:
         with get_connection() as conn:
             schema = _fetch_schema(conn)
-        return jsonify({"schema": schema})
+        return json_response({"schema": schema})
     except Exception as e:
         traceback.print_exc()
-        return jsonify({"error": str(e)}), 500
+        return json_response({"error": str(e)}), 500
 
 @app.post("/assistant/chat")
+@rate_limiter.limit("chat")
 def assistant_chat():
     """
     Request body:
-      { messages:[{role,content}], limit?:number }
+      { messages:[{role,content}], limit?:number, client_id?:uuid }
     Response:
       { answer, sql, chart, columns, rows, sql_error? }
     """
@@ -943,7 +1939,7 @@ def assistant_chat():
                 break
         prompt = (last_user_msg or "").strip()
         if not prompt:
-            return jsonify({"answer": "", "sql": None, "chart": None, "columns": None, "rows": None}), 200
+            return json_response({"answer": "", "sql": None, "chart": None, "columns": None, "rows": None}), 200
 
         wants_chart = bool(re.search(r"\b(plot|chart|graph|visual|time series|line|bar|area|scatter)\b", prompt, re.I))
 
@@ -969,6 +1965,7 @@ def assistant_chat():
                 "Prefer p.code for parameter identities.",
                 "sampling_points.lat/lon are available for mapping.",
                 "Use date_trunc for rollups (day, month).",
+                "Query the measurements view; measurement_rows, units and source_columns are its storage.",
             ],
         }
 
@@ -978,18 +1975,17 @@ def assistant_chat():
         )
 
         # 3) Ask the model
-        client = _groq()
-        resp = client.chat.completions.create(
-            model=os.getenv("GROQ_MODEL","llama-3.3-70b-versatile"),
-            temperature=0.2,
-            max_tokens=10000,
-            response_format={"type":"json_object"},
-            messages=[
+        raw = llm.chat(
+            [
               {"role":"system","content":ASSISTANT_SYSTEM},
               {"role":"user","content":user_content},
             ],
-        )
-        raw = resp.choices[0].message.content.strip()
+            purpose="assistant",
+            client=payload.get("client_id"),
+            temperature=0.2,
+            max_tokens=10000,
+            response_format={"type":"json_object"},
+        ).strip()
         try:
             model_json = json.loads(raw)
         except Exception:
@@ -1024,7 +2020,7 @@ def assistant_chat():
                 for r in rows:
                     v = r.get(col)
                     if v is not None:
-                        return isinstance(v, (int, float))
+                        return isinstance(v, (int, float, decimal.Decimal))
                 return False
 
             x = columns[0]
@@ -1033,11 +2029,13 @@ def assistant_chat():
                 kind = "line" if re.search(r"(date|day|month|year|ts)", x, re.I) else "bar"
                 result["chart"] = {"type": kind, "x": x, "series": y_series}
 
-        return jsonify(result), 200
+        return json_response(result), 200
 
+    except llm.LLMUnavailable as e:
+        return json_response({"error": str(e)}), 503
     except Exception as e:
         traceback.print_exc()
-        return jsonify({"error": str(e)}), 500
+        return json_response({"error": str(e)}), 500
 
 if __name__ == "__main__":
     # Ensure you run with Python 3.10+ (for `str | None` union syntax)
@@ -1,5 +1,6 @@
 # server/config.py
 import os
+import tempfile
 from dataclasses import dataclass, field
 
 def _parse_origins(val: str) -> list[str]:
@@ -19,3 +20,49 @@ class Settings:
         )
     )
     max_upload_mb: int = int(os.getenv("MAX_UPLOAD_MB", "25"))
+    # In-process response cache for dataset-scoped analytics (see http_cache.py)
+    response_cache_mb: int = int(os.getenv("RESPONSE_CACHE_MB", "64"))
+    cache_max_age: int = int(os.getenv("CACHE_MAX_AGE", "0"))
+    # Responses at least this large are gzip/brotli-encoded when the client accepts it
+    compress_min_bytes: int = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+    # Process-pool size for /analytics/trends on large datasets (0 = auto)
+    trend_workers: int = int(os.getenv("TREND_WORKERS", "0"))
+    # Ingest job workers (see jobs.py): processes the web process starts on
+    # first use (0 = run `python server/worker.py` instead), and how many jobs
+    # one client may have running at once
+    job_workers: int = int(os.getenv("JOB_WORKERS", "2"))
+    job_client_concurrency: int = int(os.getenv("JOB_CLIENT_CONCURRENCY", "1"))
+    # Requests / ingest jobs slower than this get a structured log line (ewai.requests / ewai.jobs)
+    slow_request_ms: int = int(os.getenv("SLOW_REQUEST_MS", "2000"))
+    # Processes sharing this directory report each other's metrics on /metrics ("" = this process only)
+    metrics_dir: str = os.getenv("METRICS_DIR", os.path.join(tempfile.gettempdir(), "ewai-metrics"))
+    # Opt-in profiling (see profiling.py): requests with `X-Profile: <token>`,
+    # or this fraction of all requests, run under cProfile + tracemalloc
+    profile_token: str = os.getenv("PROFILE_TOKEN", "")
+    profile_sample_rate: float = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+    profile_dir: str = os.getenv("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "ewai-profiles"))
+    profile_keep: int = int(os.getenv("PROFILE_KEEP", "200"))
+    # LLM provider (see ewai/llm.py): live | record | replay; record/replay
+    # keep request-hash -> response files in LLM_CASSETTE_DIR
+    llm_mode: str = os.getenv("LLM_MODE", "live")
+    llm_cassette_dir: str = os.getenv("LLM_CASSETTE_DIR", "")
+    # LLM call policy: per-attempt deadline, retries within a total budget, and
+    # a circuit breaker that skips the LLM (rule-based fallbacks) after repeated failures
+    llm_timeout_s: float = float(os.getenv("LLM_TIMEOUT_S", "30"))
+    llm_budget_s: float = float(os.getenv("LLM_BUDGET_S", "60"))
+    llm_retries: int = int(os.getenv("LLM_RETRIES", "2"))
+    llm_breaker_failures: int = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+    llm_breaker_reset_s: float = float(os.getenv("LLM_BREAKER_RESET_S", "30"))
+    # Header mapping: headers per LLM request, and how many requests run at once
+    llm_map_chunk: int = int(os.getenv("LLM_MAP_CHUNK", "40"))
+    llm_map_parallel: int = int(os.getenv("LLM_MAP_PARALLEL", "4"))
+    # LLM calls in flight across all processes sharing the database (public.llm_tickets);
+    # waiting calls are served weighted-fair by purpose and client
+    llm_concurrency: int = int(os.getenv("LLM_CONCURRENCY", "4"))
+    # Per-client token buckets (requests per minute, burst); 0 per minute disables the limit
+    rate_chat_per_min: float = float(os.getenv("RATE_CHAT_PER_MIN", "10"))
+    rate_chat_burst: int = int(os.getenv("RATE_CHAT_BURST", "3"))
+    rate_ingest_per_min: float = float(os.getenv("RATE_INGEST_PER_MIN", "20"))
+    rate_ingest_burst: int = int(os.getenv("RATE_INGEST_BURST", "5"))
+    # Each remote address also gets buckets of this many times the per-client rate and burst; 0 disables them
+    rate_addr_factor: float = float(os.getenv("RATE_ADDR_FACTOR", "3"))
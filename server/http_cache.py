@@ -0,0 +1,169 @@
+# server/http_cache.py
+"""
+HTTP caching for read endpoints that are pure functions of one dataset.
+
+Each dataset carries a monotonically increasing data version
+(public.dataset_versions, bumped on persist/delete). A cached view gets:
+- a strong ETag derived from (endpoint, normalized query, data version),
+  with If-None-Match / If-Modified-Since answered by 304,
+- Cache-Control / Last-Modified headers,
+- an in-process LRU of response bodies bounded by a byte budget, keyed by the
+  same triple, so a cold browser still skips the database work.
+
+Views that also read a client's sampling points (shared across that client's
+datasets) are declared with points=True; the client's points version
+(public.point_versions) then becomes part of the version.
+"""
+from __future__ import annotations
+
+import hashlib
+import threading
+import traceback
+from collections import OrderedDict
+from functools import wraps
+from typing import Callable, Optional, Tuple
+
+from flask import request, make_response
+from werkzeug.http import http_date, parse_date
+
+from ewai.db.db_conn import get_connection
+from ewai.db.db_util import get_data_version, get_point_version
+
+CacheKey = Tuple[str, str, str]
+
+
+class ResponseCache:
+    """Thread-safe LRU of (body, mimetype) with a total byte budget."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max(0, int(max_bytes))
+        self._items: "OrderedDict[CacheKey, Tuple[bytes, str]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: CacheKey) -> Optional[Tuple[bytes, str]]:
+        with self._lock:
+            hit = self._items.get(key)
+            if hit is not None:
+                self._items.move_to_end(key)
+            return hit
+
+    def put(self, key: CacheKey, body: bytes, mimetype: str) -> None:
+        size = len(body)
+        if size > self.max_bytes:
+            return  # never let one response flush the whole cache
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old[0])
+            self._items[key] = (body, mimetype)
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._items:
+                _, (evicted, _) = self._items.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+
+def _normalized_query() -> str:
+    items = sorted(
+        (k, v.strip())
+        for k, vals in request.args.lists()
+        for v in vals
+        if v is not None and v.strip() != ""
+    )
+    return "&".join(f"{k}={v}" for k, v in items)
+
+
+def _etag_matches(header: Optional[str], etag: str) -> bool:
+    # weak comparison (RFC 9110 §13.1.2); tolerate content-coding suffixes
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    opaque = etag.strip('"')
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        tag = tag.strip('"')
+        if tag == opaque or tag.startswith(opaque + "-"):
+            return True
+    return False
+
+
+class DatasetCache:
+    """
+    Decorator factory for dataset-scoped GET views:
+
+        dataset_cache = DatasetCache(max_bytes=..., max_age=0)
+
+        @app.get("/measurements")
+        @dataset_cache.cached("measurements")
+        def measurements(): ...
+    """
+
+    def __init__(self, max_bytes: int, max_age: int = 0):
+        self.store = ResponseCache(max_bytes)
+        self.max_age = max(0, int(max_age))
+
+    def _headers(self, resp, etag: str, last_modified) -> None:
+        resp.headers["ETag"] = f'"{etag}"'
+        resp.headers["Cache-Control"] = f"private, max-age={self.max_age}, must-revalidate"
+        if last_modified is not None:
+            resp.headers["Last-Modified"] = http_date(last_modified)
+
+    def cached(self, endpoint: str, points: bool = False) -> Callable:
+        def deco(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                dataset_id = request.args.get("dataset_id")
+                client_id = request.args.get("client_id")
+                if request.method != "GET" or not dataset_id or (points and not client_id):
+                    return view(*args, **kwargs)
+                try:
+                    with get_connection() as conn:
+                        ver = get_data_version(conn, dataset_id)
+                        if ver is not None and points:
+                            pver, pmod = get_point_version(conn, client_id)
+                            ver = (f"{ver[0]}.{pver}", max((t for t in (ver[1], pmod) if t is not None),
+                                                           default=None))
+                except Exception:
+                    traceback.print_exc()
+                    ver = None
+                if ver is None:
+                    # unknown dataset or lookup failure: let the view answer, uncached
+                    return view(*args, **kwargs)
+
+                version, last_modified = str(ver[0]), ver[1]
+                query = _normalized_query()
+                etag = hashlib.sha1(f"{endpoint}?{query}#{version}".encode("utf-8")).hexdigest()[:32]
+
+                inm = request.headers.get("If-None-Match")
+                not_modified = _etag_matches(inm, etag)
+                if not inm and last_modified is not None:
+                    ims = parse_date(request.headers.get("If-Modified-Since"))
+                    not_modified = ims is not None and last_modified.replace(microsecond=0) <= ims
+                if not_modified:
+                    resp = make_response("", 304)
+                    self._headers(resp, etag, last_modified)
+                    return resp
+
+                key = (endpoint, query, version)
+                hit = self.store.get(key)
+                if hit is not None:
+                    body, mimetype = hit
+                    resp = make_response(body, 200)
+                    resp.mimetype = mimetype
+                else:
+                    resp = make_response(view(*args, **kwargs))
+                    if resp.status_code != 200:
+                        return resp
+                    if not resp.direct_passthrough:
+                        self.store.put(key, resp.get_data(), resp.mimetype)
+                self._headers(resp, etag, last_modified)
+                return resp
+            return wrapper
+        return deco
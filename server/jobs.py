@@ -0,0 +1,317 @@
+# server/jobs.py
+"""
+Background jobs for the slow ingest steps (/ingest/map, /ingest/persist).
+
+Jobs live in public.ingest_jobs (status queued -> running -> done | failed).
+The request handler enqueues one and answers 202 with its id; worker
+processes claim queued jobs, run the handler registered for the job kind and
+write per-stage progress that /jobs/<id> reports while the job runs.
+
+Claiming holds a transaction-scoped advisory lock so the per-client limit
+(running jobs per client_id) is exact across processes and hosts; a tenant
+with a long backfill queue only ever occupies that many workers.
+
+Workers are either started by the web process on first use (JOB_WORKERS > 0)
+or run separately with `python server/worker.py`.
+"""
+from __future__ import annotations
+
+import importlib
+import logging
+import multiprocessing
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+import psycopg2.extras as pgx
+
+from ewai import llm, metrics
+from ewai.db.db_conn import get_connection
+from ewai.db.db_util import ensure_schema
+from config import Settings
+import profiling
+from responses import dumps
+
+_CLAIM_LOCK = 0x6A6F6273  # advisory lock key ('jobs')
+STALE_AFTER_S = 900       # a running job without a heartbeat for this long is presumed lost
+HEARTBEAT_S = 60          # heartbeat period while a handler runs (well under STALE_AFTER_S)
+
+job_log = logging.getLogger("ewai.jobs")
+_settings = Settings()
+_profiler = profiling.from_settings(_settings)
+
+_HANDLERS: Dict[str, Callable] = {}
+_SCHEMA_READY = False
+_POOL: List[multiprocessing.Process] = []
+_POOL_LOCK = threading.Lock()
+
+
+class JobError(Exception):
+    """A job failure caused by the input; /jobs/<id> reports it with `status`."""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+def register(kind: str):
+    """Decorator: fn(params, payload, progress) -> JSON-able result for jobs of `kind`."""
+    def deco(fn):
+        _HANDLERS[kind] = fn
+        return fn
+    return deco
+
+
+class Progress:
+    """Per-stage progress writer; counters merge into ingest_jobs.progress."""
+
+    def __init__(self, conn, job_id: str):
+        self.conn = conn
+        self.job_id = job_id
+
+    def __call__(self, stage: str, **counters: Any) -> None:
+        with self.conn.cursor() as cur:
+            cur.execute(
+                """
+                UPDATE public.ingest_jobs
+                SET stage = %s, progress = progress || %s::jsonb, heartbeat_at = now()
+                WHERE job_id = %s
+                """,
+                (stage, dumps(counters).decode(), self.job_id),
+            )
+        self.conn.commit()
+
+
+def ensure_tables() -> None:
+    """ensure_schema once per process (ingest_jobs / ingest_sessions may be new)."""
+    global _SCHEMA_READY
+    if not _SCHEMA_READY:
+        with get_connection() as conn:
+            ensure_schema(conn, seed_all=False)
+        _SCHEMA_READY = True
+
+
+def enqueue(client_id: Optional[str], kind: str, params: Dict[str, Any], payload: Optional[bytes] = None,
+            profile: bool = False) -> str:
+    """Queue a job; profile=True runs it under the profiler (see profiling.py)."""
+    if kind not in _HANDLERS:
+        raise ValueError(f"unknown job kind: {kind}")
+    ensure_tables()
+    if profile:
+        params = {**params, "_profile": True}
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                INSERT INTO public.ingest_jobs (client_id, kind, params, payload)
+                VALUES (%s, %s, %s::jsonb, %s)
+                RETURNING job_id::text
+                """,
+                (client_id, kind, dumps(params).decode(), payload),
+            )
+            job_id = cur.fetchone()[0]
+    return job_id
+
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    with get_connection() as conn:
+        with conn.cursor(cursor_factory=pgx.RealDictCursor) as cur:
+            cur.execute(
+                """
+                SELECT job_id::text, client_id::text, kind, status, stage, progress, result,
+                       error, error_status, created_at, started_at, finished_at
+                FROM public.ingest_jobs WHERE job_id = %s
+                """,
+                (job_id,),
+            )
+            row = cur.fetchone()
+    return dict(row) if row else None
+
+
+def _claim(conn, per_client: int) -> Optional[Dict[str, Any]]:
+    with conn.cursor(cursor_factory=pgx.RealDictCursor) as cur:
+        cur.execute("SELECT pg_advisory_xact_lock(%s)", (_CLAIM_LOCK,))
+        cur.execute(
+            """
+            UPDATE public.ingest_jobs
+            SET status = 'failed', error = 'worker lost', error_status = 500, finished_at = now()
+            WHERE status = 'running' AND heartbeat_at < now() - make_interval(secs => %s)
+            """,
+            (STALE_AFTER_S,),
+        )
+        cur.execute(
+            """
+            WITH busy AS (
+              SELECT client_id, COUNT(*) AS n
+              FROM public.ingest_jobs WHERE status = 'running'
+              GROUP BY client_id
+            )
+            UPDATE public.ingest_jobs j
+            SET status = 'running', started_at = now(), heartbeat_at = now()
+            WHERE j.job_id = (
+              SELECT q.job_id
+              FROM public.ingest_jobs q
+              LEFT JOIN busy b ON b.client_id IS NOT DISTINCT FROM q.client_id
+              WHERE q.status = 'queued' AND COALESCE(b.n, 0) < %s
+              ORDER BY COALESCE(b.n, 0), q.created_at
+              LIMIT 1
+            )
+            RETURNING j.job_id::text, j.client_id::text, j.kind, j.params, j.payload
+            """,
+            (per_client,),
+        )
+        job = cur.fetchone()
+    conn.commit()
+    return job
+
+
+def _finish(conn, job_id: str, result: Any = None, error: Optional[str] = None,
+            status: Optional[int] = None) -> bool:
+    """Record the outcome; False when the job was no longer running (reaped as lost meanwhile)."""
+    conn.rollback()
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            UPDATE public.ingest_jobs
+            SET status = %s, stage = COALESCE(%s, stage), result = %s::jsonb, error = %s, error_status = %s,
+                payload = NULL, finished_at = now(), heartbeat_at = now()
+            WHERE job_id = %s AND status = 'running'
+            """,
+            # a failed job keeps the stage it failed in
+            ("failed" if error else "done", None if error else "done",
+             None if error else dumps(result).decode(), error, status, job_id),
+        )
+        finished = cur.rowcount == 1
+    conn.commit()
+    if not finished:
+        job_log.warning("job %s was no longer running when it finished; outcome dropped", job_id)
+    return finished
+
+
+@contextmanager
+def _heartbeat(job_id: str, every_s: float = HEARTBEAT_S):
+    """
+    Refresh heartbeat_at every `every_s` on a side thread while the handler
+    runs, so one long stage (no progress() calls) is not reaped as lost. The
+    thread has its own connection: the handler's may be mid-transaction.
+    """
+    stop = threading.Event()
+
+    def beat():
+        conn = None
+        while not stop.wait(every_s):
+            try:
+                if conn is None:
+                    conn = get_connection()
+                with conn.cursor() as cur:
+                    cur.execute(
+                        "UPDATE public.ingest_jobs SET heartbeat_at = now() WHERE job_id = %s AND status = 'running'",
+                        (job_id,),
+                    )
+                conn.commit()
+            except Exception:
+                traceback.print_exc()
+                if conn is not None:
+                    conn.close()
+                conn = None
+        if conn is not None:
+            conn.close()
+
+    t = threading.Thread(target=beat, name=f"heartbeat-{job_id}", daemon=True)
+    t.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        t.join(timeout=10)
+
+
+def run_one(conn, per_client: int) -> bool:
+    """Claim and run one job on `conn`; False when nothing was runnable."""
+    job = _claim(conn, per_client)
+    if not job:
+        return False
+    job_id = job["job_id"]
+    progress = Progress(conn, job_id)
+    status = "done"
+    params = dict(job["params"])
+    profile = params.pop("_profile", False)
+    with metrics.scope() as stats, _maybe_profile(profile, job, params) as summary, \
+            llm.for_client(job["client_id"]):
+        try:
+            with _heartbeat(job_id):
+                result = _HANDLERS[job["kind"]](params, bytes(job["payload"]) if job["payload"] else None, progress)
+        except JobError as e:
+            status = "failed"
+            _finish(conn, job_id, error=str(e), status=e.status)
+        except Exception as e:
+            status = "failed"
+            traceback.print_exc()
+            _finish(conn, job_id, error=str(e), status=500)
+        else:
+            if not _finish(conn, job_id, result=result):
+                status = "lost"
+        if summary is not None:
+            summary["status"] = status
+    _record(job, status, stats)
+    return True
+
+
+@contextmanager
+def _maybe_profile(profile: bool, job: Dict[str, Any], params: Dict[str, Any]):
+    if not profile:
+        yield None
+        return
+    with _profiler.capture(f"job {job['kind']}", {"job_id": job["job_id"], **params}) as summary:
+        yield summary
+
+
+def _record(job: Dict[str, Any], status: str, stats: metrics.ScopeStats) -> None:
+    metrics.REGISTRY.observe("ewai_job_seconds", stats.elapsed, kind=job["kind"], status=status)
+    metrics.REGISTRY.observe("ewai_job_queries", stats.queries, metrics.COUNT_BUCKETS, kind=job["kind"])
+    if stats.elapsed * 1000 >= _settings.slow_request_ms:
+        job_log.warning(dumps({
+            "event": "slow_job", "job_id": job["job_id"], "kind": job["kind"], "status": status,
+            "bytes_in": len(job["payload"]) if job["payload"] else 0, **stats.summary(),
+        }).decode())
+    try:
+        metrics.dump(_settings.metrics_dir)
+    except OSError:
+        traceback.print_exc()
+
+
+def _worker_main(handlers_module: str, per_client: int, poll_s: float) -> None:
+    importlib.import_module(handlers_module)  # registers the job kinds
+    conn = get_connection()
+    while True:
+        try:
+            if not run_one(conn, per_client):
+                time.sleep(poll_s)
+        except Exception:
+            traceback.print_exc()
+            try:
+                conn.close()
+            finally:
+                time.sleep(poll_s)
+                conn = get_connection()
+
+
+def start_workers(processes: int, per_client: int, handlers_module: str = "app", poll_s: float = 0.5,
+                  daemon: bool = True) -> List[multiprocessing.Process]:
+    """
+    Start (or top up to) `processes` worker processes. Spawned, not forked:
+    the web process has threads and open connections a fork would inherit.
+    """
+    with _POOL_LOCK:
+        _POOL[:] = [p for p in _POOL if p.is_alive()]
+        if len(_POOL) < processes:
+            ensure_tables()
+            ctx = multiprocessing.get_context("spawn")
+            for _ in range(processes - len(_POOL)):
+                p = ctx.Process(target=_worker_main, args=(handlers_module, per_client, poll_s),
+                                name="ingest-worker", daemon=daemon)
+                p.start()
+                _POOL.append(p)
+        return list(_POOL)
@@ -0,0 +1,173 @@
+# server/profiling.py
+"""
+Opt-in request/job profiling.
+
+A request is profiled when it carries `X-Profile: <PROFILE_TOKEN>` or is
+picked by PROFILE_SAMPLE_RATE. The profiled unit of work runs under cProfile
+with tracemalloc on; the pstats dump (<name>.prof) and a JSON summary
+(<name>.json: endpoint, parameters, wall time, peak traced memory, top
+functions) land in PROFILE_DIR. Ingest jobs queued by a profiled request are
+profiled in the worker as well (the request itself only enqueues).
+
+Only one profile runs per process at a time (cProfile and tracemalloc are
+process-wide); a request that would overlap runs unprofiled.
+
+With no token and a zero sample rate install() registers nothing, so the
+disabled path costs nothing per request.
+"""
+from __future__ import annotations
+
+import cProfile
+import hmac
+import io
+import json
+import os
+import pstats
+import random
+import re
+import threading
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from flask import g, request
+
+HEADER = "X-Profile"
+TOP_FUNCTIONS = 30
+
+_LOCK = threading.Lock()
+
+
+class Profiler:
+    def __init__(self, directory: str, token: str = "", sample_rate: float = 0.0, keep: int = 200):
+        self.directory = directory
+        self.token = token
+        self.sample_rate = max(0.0, min(1.0, float(sample_rate)))
+        self.keep = keep
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.directory) and (bool(self.token) or self.sample_rate > 0)
+
+    def authorized(self, req) -> bool:
+        supplied = req.headers.get(HEADER, "")
+        return bool(self.token) and bool(supplied) and hmac.compare_digest(supplied, self.token)
+
+    def wanted(self, req) -> bool:
+        return self.authorized(req) or (self.sample_rate > 0 and random.random() < self.sample_rate)
+
+    # ---- capture ----
+    @contextmanager
+    def capture(self, label: str, params: Dict[str, Any]) -> Iterator[Optional[Dict[str, Any]]]:
+        """Profile the block; yields the summary dict (fill in extra fields) or None when busy."""
+        if not _LOCK.acquire(blocking=False):
+            yield None
+            return
+        summary: Dict[str, Any] = {"label": label, "params": params}
+        prof = cProfile.Profile()
+        started_tracing = not tracemalloc.is_tracing()
+        try:
+            if started_tracing:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            t0 = time.perf_counter()
+            prof.enable()
+            try:
+                yield summary
+            finally:
+                prof.disable()
+                summary["ms"] = round((time.perf_counter() - t0) * 1000, 1)
+                summary["peak_traced_bytes"] = tracemalloc.get_traced_memory()[1]
+                if started_tracing:
+                    tracemalloc.stop()
+                self._save(prof, summary)
+        finally:
+            _LOCK.release()
+
+    def _save(self, prof: cProfile.Profile, summary: Dict[str, Any]) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", summary["label"]).strip("_")[:60] or "root"
+        name = f"{time.strftime('%Y%m%dT%H%M%S')}_{slug}_{uuid.uuid4().hex[:8]}"
+        prof.dump_stats(os.path.join(self.directory, name + ".prof"))
+        buf = io.StringIO()
+        pstats.Stats(prof, stream=buf).sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+        summary.update(name=name, created_at=time.time(), top=buf.getvalue())
+        with open(os.path.join(self.directory, name + ".json"), "w", encoding="utf-8") as fh:
+            json.dump(summary, fh, default=str)
+        self._prune()
+
+    def _prune(self) -> None:
+        metas = sorted(f for f in os.listdir(self.directory) if f.endswith(".json"))
+        for f in metas[: max(0, len(metas) - self.keep)]:
+            for ext in (".json", ".prof"):
+                try:
+                    os.remove(os.path.join(self.directory, f[:-5] + ext))
+                except OSError:
+                    pass
+
+    # ---- listing ----
+    def list(self) -> List[Dict[str, Any]]:
+        if not os.path.isdir(self.directory):
+            return []
+        out = []
+        for f in sorted(os.listdir(self.directory), reverse=True):
+            if not f.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.directory, f), encoding="utf-8") as fh:
+                    meta = json.load(fh)
+            except (OSError, ValueError):
+                continue
+            meta.pop("top", None)
+            out.append(meta)
+        return out
+
+    def path(self, name: str, ext: str) -> Optional[str]:
+        if not re.fullmatch(r"[A-Za-z0-9_]+", name or ""):
+            return None
+        p = os.path.join(self.directory, name + ext)
+        return p if os.path.isfile(p) else None
+
+    # ---- Flask wiring ----
+    def install(self, app) -> None:
+        if not self.enabled:
+            return
+
+        @app.before_request
+        def _profile_begin():
+            if request.method == "OPTIONS" or not self.wanted(request):
+                return
+            label = f"{request.method} {request.url_rule.rule if request.url_rule else request.path}"
+            params = {"path": request.path, "args": request.args.to_dict(flat=False)}
+            cm = self.capture(label, params)
+            summary = cm.__enter__()
+            if summary is None:
+                cm.__exit__(None, None, None)
+                return
+            g.profile_cm = cm
+            g.profile_summary = summary
+
+        @app.after_request
+        def _profile_status(resp):
+            summary = g.get("profile_summary")
+            if summary is not None:
+                summary["status"] = resp.status_code
+            return resp
+
+        @app.teardown_request
+        def _profile_end(exc):
+            cm = g.pop("profile_cm", None)
+            if cm is not None:
+                cm.__exit__(None, None, None)
+
+
+def from_settings(settings) -> Profiler:
+    return Profiler(settings.profile_dir, settings.profile_token,
+                    settings.profile_sample_rate, settings.profile_keep)
+
+
+def profiled_request() -> bool:
+    """True inside a request that is being profiled (jobs it queues get profiled too)."""
+    return g.get("profile_cm") is not None
@@ -0,0 +1,121 @@
+# server/ratelimit.py
+"""
+Per-client token buckets for endpoints that spend LLM quota.
+
+Each endpoint class ("chat" for /assistant/chat, "ingest" for /ingest/map)
+has a refill rate (per minute) and a burst size; every client gets its own
+bucket per class. The client is the request's client_id (query string, form
+or JSON body), else the remote address. The client_id is whatever the
+caller sends, so every remote address also has a bucket per class with
+addr_factor times the rate and burst: several clients behind one NAT still
+fit, a caller rotating client_ids does not get past it. A request that finds
+either bucket empty gets a fast 429 with Retry-After and never reaches the
+view.
+
+Buckets live in this process. Behind several web processes each enforces
+the limit separately.
+"""
+from __future__ import annotations
+
+import math
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from typing import Callable, Dict, Optional, Tuple
+
+from flask import request
+
+from ewai.metrics import REGISTRY
+from utils import json_error
+
+MAX_BUCKETS = 10000
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "stamp")
+
+    def __init__(self, per_minute: float, burst: int):
+        self.rate = per_minute / 60.0
+        self.burst = float(max(1, burst))
+        self.tokens = self.burst
+        self.stamp = time.monotonic()
+
+    def wait(self) -> float:
+        """Refill; 0 when a token is available, else seconds until one is."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        if self.tokens >= 1.0:
+            return 0.0
+        return (1.0 - self.tokens) / self.rate if self.rate > 0 else 60.0
+
+    def take(self) -> float:
+        """0 when a token was taken, else seconds until one is available."""
+        wait = self.wait()
+        if wait == 0:
+            self.tokens -= 1.0
+        return wait
+
+
+class RateLimiter:
+    def __init__(self, limits: Dict[str, Tuple[float, int]], addr_factor: float = 3.0):
+        # class -> (per minute, burst); per minute <= 0 disables the class
+        self.limits = {k: v for k, v in limits.items() if v[0] > 0}
+        # addr_factor <= 0 turns the per-address buckets off
+        self.addr_factor = addr_factor
+        self._buckets: "OrderedDict[Tuple[str, str], TokenBucket]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _bucket(self, key: Tuple[str, str], per_minute: float, burst: int) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(per_minute, burst)
+            while len(self._buckets) > MAX_BUCKETS:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def check(self, klass: str, client: str, addr: Optional[str] = None) -> float:
+        """0 when allowed, else the Retry-After in seconds."""
+        limit = self.limits.get(klass)
+        if limit is None:
+            return 0.0
+        with self._lock:
+            buckets = [self._bucket((klass, client), *limit)]
+            if addr and self.addr_factor > 0:
+                per_minute, burst = limit
+                buckets.append(self._bucket(("addr:" + klass, addr), per_minute * self.addr_factor,
+                                            int(math.ceil(burst * self.addr_factor))))
+            # a request one bucket rejects takes nothing from the other: a
+            # client over its own quota must not drain its address's bucket
+            wait = max(b.wait() for b in buckets)
+            if wait > 0:
+                return wait
+            for b in buckets:
+                b.take()
+            return 0.0
+
+    def limit(self, klass: str) -> Callable:
+        def deco(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                wait = self.check(klass, _client_key(), request.remote_addr)
+                if wait > 0:
+                    REGISTRY.inc("ewai_rate_limited_total", **{"class": klass})
+                    resp = json_error(f"rate limit exceeded for {klass}; retry in {math.ceil(wait)}s", 429)
+                    resp.headers["Retry-After"] = str(math.ceil(wait))
+                    return resp
+                return view(*args, **kwargs)
+            return wrapper
+        return deco
+
+
+def _client_key() -> str:
+    cid: Optional[str] = request.args.get("client_id") or request.form.get("client_id")
+    if not cid and request.is_json:
+        body = request.get_json(silent=True)
+        if isinstance(body, dict):
+            cid = body.get("client_id")
+    return f"client:{cid}" if cid else f"addr:{request.remote_addr}"
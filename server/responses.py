@@ -0,0 +1,115 @@
+# server/responses.py
+"""
+Response layer: orjson serialization + gzip/brotli negotiation.
+
+- dumps() handles datetime/date, NumPy scalars/arrays, NaN (-> null) natively;
+  Decimal and pandas scalars go through _default. Views can hand over DB rows
+  as-is instead of coercing every value by hand.
+- compress_response() is installed as an after_request hook and encodes
+  bodies above a size threshold with the best coding the client accepts.
+"""
+from __future__ import annotations
+
+import decimal
+import gzip
+from typing import Any, Dict, Optional
+
+import orjson
+from flask import Response
+
+try:
+    import brotli  # optional; gzip is always available
+except ImportError:  # pragma: no cover
+    brotli = None
+
+_ORJSON_OPTS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+_COMPRESSIBLE = ("application/json", "text/")
+_GZIP_LEVEL = 5
+_BROTLI_QUALITY = 4  # dynamic content: favor speed over the last few %
+
+
+def _default(v: Any):
+    if isinstance(v, decimal.Decimal):
+        return float(v)
+    if hasattr(v, "isoformat"):  # pandas.Timestamp and friends
+        try:
+            return v.isoformat()
+        except ValueError:  # NaT
+            return None
+    if hasattr(v, "item"):  # NumPy scalars not covered by OPT_SERIALIZE_NUMPY
+        return v.item()
+    if isinstance(v, (set, frozenset, tuple)):
+        return list(v)
+    try:
+        if v != v:  # NaN-likes
+            return None
+    except TypeError:  # pd.NA refuses to be truth-tested
+        return None
+    raise TypeError(f"Type is not JSON serializable: {type(v).__name__}")
+
+
+def dumps(obj: Any) -> bytes:
+    return orjson.dumps(obj, default=_default, option=_ORJSON_OPTS)
+
+
+def json_response(obj: Any, status: int = 200) -> Response:
+    return Response(dumps(obj), status=status, mimetype="application/json")
+
+
+def _accepted_codings(header: Optional[str]) -> Dict[str, float]:
+    out: Dict[str, float] = {}
+    for part in (header or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, params = part.partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        out[name.strip().lower()] = q
+    return out
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    acc = _accepted_codings(accept_encoding)
+    wildcard = acc.get("*", 0.0)
+    if brotli is not None and acc.get("br", wildcard) > 0:
+        return "br"
+    if acc.get("gzip", wildcard) > 0:
+        return "gzip"
+    return None
+
+
+def encode_body(body: bytes, coding: str) -> bytes:
+    if coding == "br":
+        return brotli.compress(body, quality=_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=_GZIP_LEVEL)
+
+
+def compress_response(resp: Response, accept_encoding: Optional[str], min_bytes: int) -> Response:
+    if (
+        resp.status_code != 200
+        or resp.direct_passthrough
+        or "Content-Encoding" in resp.headers
+        or not (resp.mimetype or "").startswith(_COMPRESSIBLE)
+    ):
+        return resp
+    resp.vary.add("Accept-Encoding")
+    body = resp.get_data()
+    if len(body) < min_bytes:
+        return resp
+    coding = choose_encoding(accept_encoding)
+    if coding is None:
+        return resp
+    resp.set_data(encode_body(body, coding))
+    resp.headers["Content-Encoding"] = coding
+    # a different representation needs a different strong validator
+    etag = resp.headers.get("ETag")
+    if etag and etag.endswith('"'):
+        resp.headers["ETag"] = f'{etag[:-1]}-{coding}"'
+    return resp
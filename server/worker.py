@@ -0,0 +1,44 @@
+# server/worker.py
+"""
+Standalone ingest job workers, for deployments that run the web process with
+JOB_WORKERS=0 (see jobs.py).
+
+    python server/worker.py [--processes 2] [--per-client 1]
+
+Defaults come from JOB_WORKERS / JOB_CLIENT_CONCURRENCY; worker processes
+that die are restarted.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+BASE_DIR = os.path.abspath(os.path.join(SERVER_DIR, ".."))
+for p in (SERVER_DIR, BASE_DIR):
+    if p not in sys.path:
+        sys.path.insert(0, p)
+
+import app  # noqa: E402  (loads .env and registers the job kinds)
+import jobs  # noqa: E402
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog="python server/worker.py")
+    ap.add_argument("--processes", type=int, default=max(1, app.settings.job_workers))
+    ap.add_argument("--per-client", type=int, default=app.settings.job_client_concurrency)
+    args = ap.parse_args(argv)
+
+    print(f"starting {args.processes} ingest workers ({args.per_client} running job(s) per client)", flush=True)
+    try:
+        while True:
+            jobs.start_workers(args.processes, args.per_client, daemon=False)
+            time.sleep(5)
+    except KeyboardInterrupt:
+        return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())